@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compares the size and speed of the entry envelopes on a synthetic corpus of journal-like entries:
+v2 (Fernet, base64) and v3 (AES-GCM, raw binary) with each compression.
+
+    python3 benchmarks/envelope_benchmark.py --entries 2000 --words 300
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from helpers.encryption import (  # noqa: E402
+    LZMA, NO_COMPRESSION, ZLIB, EncryptionSession, KeyParameters, key_decrypt, key_encrypt,
+)
+from synthetic import make_corpus  # noqa: E402
+
+
+def measure(corpus: List[bytes], encrypt: Callable[[bytes], bytes], decrypt: Callable[[bytes], bytes]) -> Dict:
+    start: float = time.perf_counter()
+    tokens: List[bytes] = [encrypt(m) for m in corpus]
+    encrypt_seconds: float = time.perf_counter() - start
+    start = time.perf_counter()
+    for token, message in zip(tokens, corpus):
+        assert decrypt(token) == message
+    decrypt_seconds: float = time.perf_counter() - start
+
+    plain_bytes: int = sum(len(m) for m in corpus)
+    token_bytes: int = sum(len(t) for t in tokens)
+    return {
+        "bytes": token_bytes,
+        "ratio_to_plain_text": round(token_bytes / plain_bytes, 3),
+        "median_entry_bytes": statistics.median(len(t) for t in tokens),
+        "encrypt_mb_per_second": round(plain_bytes / encrypt_seconds / 1e6, 2),
+        "decrypt_mb_per_second": round(plain_bytes / decrypt_seconds / 1e6, 2),
+    }
+
+
+def run(entries: int, words: int) -> Dict:
+    corpus: List[bytes] = make_corpus(entries, words)
+    parameters: KeyParameters = KeyParameters.generate(iterations=1_000)
+    master_key: bytes = EncryptionSession("password", [parameters]).master_key(parameters)
+
+    results: Dict[str, Dict] = {
+        "v2": measure(corpus, lambda m: key_encrypt(m, master_key, parameters.key_id),
+                      lambda t: key_decrypt(t, master_key)),
+    }
+    for compression in (NO_COMPRESSION, ZLIB, LZMA):
+        session: EncryptionSession = EncryptionSession("password", [parameters], compression)
+        results[f"v3_{compression}"] = measure(corpus, session.encrypt, session.decrypt)
+    return {
+        "benchmark": "envelope",
+        "entries": entries,
+        "plain_text_bytes": sum(len(m) for m in corpus),
+        "envelopes": results,
+    }
+
+
+def main() -> None:
+    argument_parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    argument_parser.add_argument("--entries", type=int, default=2_000)
+    argument_parser.add_argument("--words", type=int, default=300, help="Average words per synthetic entry.")
+    args: argparse.Namespace = argument_parser.parse_args()
+    print(json.dumps(run(args.entries, args.words), indent=2))
+
+
+if __name__ == "__main__":
+    main()
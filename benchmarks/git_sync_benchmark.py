@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Times Journal.git_sync against a local bare remote holding a large synthetic journal.
+Compares staging every file, as a manual --sync does, with staging only the entry just written.
+
+    python3 benchmarks/git_sync_benchmark.py --entries 20000 --repeat 5
+"""
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from base64 import urlsafe_b64encode as b64e
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from git import Repo  # noqa: E402
+
+from giournal.journal import FILENAME_DATETIME_FORMAT, Journal  # noqa: E402
+from giournal.journal_configuration import JournalConfiguration  # noqa: E402
+from giournal.sync_queue import FULL_SCAN  # noqa: E402
+
+START = datetime(2000, 1, 1)
+
+
+def write_synthetic_entries(journal_path: str, first: int, count: int, size: int) -> List[str]:
+    """ Random tokens of about `size` bytes, git cannot tell them apart from real encrypted entries. """
+    file_names: List[str] = []
+    for i in range(first, first + count):
+        file_name: str = (START + timedelta(minutes=i)).strftime(FILENAME_DATETIME_FORMAT)
+        with open(os.path.join(journal_path, file_name), "wb") as file:
+            file.write(b64e(secrets.token_bytes(size * 3 // 4)))
+        file_names.append(file_name)
+    return file_names
+
+
+def make_journal(directory: str, entries: int, size: int) -> Journal:
+    remote_path: str = os.path.join(directory, "remote.git")
+    journal_path: str = os.path.join(directory, "journal")
+    Repo.init(remote_path, bare=True)
+    repo: Repo = Repo.init(journal_path)
+    repo.git.checkout("-b", "master")
+    write_synthetic_entries(journal_path, 0, entries, size)
+    repo.index.add("*")
+    repo.index.commit("synthetic journal")
+    repo.create_remote("origin", remote_path).push("master")
+    return Journal(JournalConfiguration(journal_path, True, remote_path, False, ""))
+
+
+def run(entries: int, size: int, repeat: int) -> Dict:
+    results: Dict[str, List[float]] = {"full_scan": [], "incremental": []}
+    with tempfile.TemporaryDirectory() as directory:
+        journal: Journal = make_journal(directory, entries, size)
+        journal_path: str = journal.journal_configuration.journal_path
+        next_entry: int = entries
+        for _ in range(repeat):
+            for mode in results:
+                file_names: List[str] = write_synthetic_entries(journal_path, next_entry, 1, size)
+                next_entry += 1
+                start: float = time.perf_counter()
+                journal.git_sync([FULL_SCAN] if mode == "full_scan" else file_names)
+                results[mode].append(time.perf_counter() - start)
+    return {
+        "benchmark": "git_sync",
+        "entries": entries,
+        "entry_size": size,
+        "repeat": repeat,
+        "seconds": {mode: {"median": statistics.median(times), "min": min(times)} for mode, times in results.items()},
+    }
+
+
+def main() -> None:
+    argument_parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    argument_parser.add_argument("--entries", type=int, default=10_000)
+    argument_parser.add_argument("--size", type=int, default=1_500, help="Bytes per synthetic entry.")
+    argument_parser.add_argument("--repeat", type=int, default=5)
+    args: argparse.Namespace = argument_parser.parse_args()
+    print(json.dumps(run(args.entries, args.size, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
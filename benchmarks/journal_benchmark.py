@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Times the main journal operations on synthetic journals of increasing size, with an in-memory keyring and a
+local bare remote, and prints JSON so runs can be compared across commits.
+
+    python3 benchmarks/journal_benchmark.py --entries 1000 10000 100000 > results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from synthetic import make_body, make_journal, use_in_memory_keyring
+
+from giournal.journal import Journal
+from giournal.sync_queue import FULL_SCAN
+
+
+def time_call(function: Callable[[], object], repeat: int = 1) -> Dict[str, float]:
+    times: List[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"median": statistics.median(times), "min": min(times)}
+
+
+def run_size(entries: int, words: int, repeat: int, workers: int) -> Dict:
+    with tempfile.TemporaryDirectory() as directory:
+        use_in_memory_keyring(directory)
+        start: float = time.perf_counter()
+        journal: Journal = make_journal(directory, entries, words, workers=workers)
+        generate_seconds: float = time.perf_counter() - start
+        cache_path: str = journal.journal_configuration.cache_path
+        generator: random.Random = random.Random(entries)
+
+        def list_cold() -> None:
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            for _ in journal.list_entries():
+                pass
+
+        def list_warm() -> None:
+            for _ in journal.list_entries():
+                pass
+
+        seconds: Dict[str, Dict[str, float]] = {
+            "add_entry": time_call(lambda: journal.add_entry(make_body(generator, words)), repeat),
+            "list_entries_cold": time_call(list_cold),
+            "list_entries_warm": time_call(list_warm, repeat),
+            "decrypt": time_call(journal.decrypt),
+            "encrypt": time_call(journal.encrypt),
+        }
+        journal.add_entry(make_body(generator, words))
+        seconds["git_sync_full_scan"] = time_call(lambda: journal.request_sync([FULL_SCAN], wait=True), repeat)
+        return {"entries": entries, "generate_seconds": generate_seconds, "seconds": seconds}
+
+
+def current_commit() -> str:
+    """ So results can be matched to the code they measured. Empty outside of a git checkout. """
+    completed_process: subprocess.CompletedProcess = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+    )
+    return completed_process.stdout.strip()
+
+
+def main() -> None:
+    argument_parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    argument_parser.add_argument("--entries", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    argument_parser.add_argument("--words", type=int, default=300, help="Average words per synthetic entry.")
+    argument_parser.add_argument("--repeat", type=int, default=3, help="Runs of the cheaper operations.")
+    argument_parser.add_argument("--workers", type=int, default=1)
+    args: argparse.Namespace = argument_parser.parse_args()
+    print(json.dumps({
+        "benchmark": "journal",
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "words": args.words,
+        "workers": args.workers,
+        "results": [run_size(e, args.words, args.repeat, args.workers) for e in args.entries],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
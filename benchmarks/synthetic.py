@@ -0,0 +1,103 @@
+"""
+Synthetic journals for the benchmarks: entries of realistic prose, encrypted like real ones, in a git repository
+with a local bare remote, and a keyring that never leaves the process.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import keyring  # noqa: E402
+from keyring.backend import KeyringBackend  # noqa: E402
+
+from helpers import key_agent  # noqa: E402
+from helpers.encryption import EncryptionSession  # noqa: E402
+from giournal.entry import Entry  # noqa: E402
+from giournal.journal import FILENAME_DATETIME_FORMAT, Journal  # noqa: E402
+from giournal.journal_configuration import JournalConfiguration  # noqa: E402
+
+START = datetime(2000, 1, 1)
+PASSWORD = "benchmark password"
+# Frequent English words, so the corpus compresses about as well as real prose.
+VOCABULARY: List[str] = (
+    "the of and to a in is you that it he was for on are as with his they at be this have from or one had by "
+    "word but not what all were we when your can said there use an each which she do how their if will up other "
+    "about out many then them these so some her would make like him into time has look two more write go see "
+    "number no way could people my than first water been call who oil its now find long down day did get come "
+    "made may part today work walk home feel think friend dinner morning tired happy meeting weekend"
+).split()
+
+
+class InMemoryKeyring(KeyringBackend):
+    """ Keeps benchmarks off the system keyring, whose latency would dominate and vary between machines. """
+    priority = 1
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.passwords = {}
+
+    def get_password(self, service: str, username: str) -> Optional[str]:
+        return self.passwords.get((service, username))
+
+    def set_password(self, service: str, username: str, password: str) -> None:
+        self.passwords[(service, username)] = password
+
+    def delete_password(self, service: str, username: str) -> None:
+        self.passwords.pop((service, username), None)
+
+
+def use_in_memory_keyring(directory: str) -> None:
+    """ Also points the key agent to a socket that does not exist, so a running agent is not used. """
+    keyring.set_keyring(InMemoryKeyring())
+    keyring.set_password("giournal", "giournal", PASSWORD)
+    os.environ[key_agent.SOCKET_ENVIRONMENT_VARIABLE] = os.path.join(directory, "no-agent.sock")
+
+
+def make_body(generator: random.Random, words: int) -> str:
+    """ About `words` words, in paragraphs. """
+    paragraphs: List[str] = []
+    remaining: int = generator.randint(words // 2, words * 3 // 2)
+    while remaining > 0:
+        length: int = min(remaining, generator.randint(20, 80))
+        paragraphs.append(" ".join(generator.choice(VOCABULARY) for _ in range(length)).capitalize() + ".")
+        remaining -= length
+    return "\n\n".join(paragraphs)
+
+
+def make_corpus(entries: int, words: int, seed: int = 0) -> List[bytes]:
+    """ Frontmatter entries, as add_entry writes them before encryption. """
+    generator: random.Random = random.Random(seed)
+    corpus: List[bytes] = []
+    for i in range(entries):
+        created: datetime = START + timedelta(hours=i)
+        entry: Entry = Entry(body=make_body(generator, words), created=created, last_modified=created)
+        corpus.append(entry.to_frontmatter().encode())
+    return corpus
+
+
+def make_journal(directory: str, entries: int, words: int, **configuration) -> Journal:
+    """
+    A journal of `entries` encrypted entries, committed and pushed to a bare remote in `directory`.
+    `configuration` overrides JournalConfiguration fields, e.g. workers.
+    """
+    from git import Repo
+
+    remote_path: str = os.path.join(directory, "remote.git")
+    journal_path: str = os.path.join(directory, "journal")
+    Repo.init(remote_path, bare=True)
+    repo: Repo = Repo.init(journal_path)
+    repo.git.checkout("-b", "master")
+    journal: Journal = Journal(JournalConfiguration(
+        journal_path, True, remote_path, True, "", cache_path=os.path.join(directory, "cache.sqlite"), **configuration
+    ))
+
+    session: EncryptionSession = journal._get_session()
+    for i, message in enumerate(make_corpus(entries, words)):
+        file_name: str = (START + timedelta(hours=i)).strftime(FILENAME_DATETIME_FORMAT)
+        with open(os.path.join(journal_path, file_name), "wb") as file:
+            file.write(session.encrypt(message))
+    journal.request_sync(["*"], wait=True)
+    return journal
@@ -0,0 +1,27 @@
+import dataclasses
+import json
+import os
+import subprocess
+import sys
+
+from .journal_configuration import JournalConfiguration
+from .local_state import local_state_path
+
+
+def spawn(module: str, journal_configuration: JournalConfiguration, log_file_name: str) -> None:
+    """
+    Runs `python -m <module> '<journal configuration json>'` detached, so it outlives the current process,
+    logging to the local state directory.
+    """
+    source_path: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path: str = os.pathsep.join(p for p in [source_path, os.environ.get("PYTHONPATH")] if p)
+    log_path: str = local_state_path(journal_configuration.journal_path, log_file_name)
+    with open(log_path, "a") as log_file:
+        subprocess.Popen(
+            [sys.executable, "-m", module, json.dumps(dataclasses.asdict(journal_configuration))],
+            env={**os.environ, "PYTHONPATH": python_path},
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=log_file,
+            start_new_session=True,
+        )
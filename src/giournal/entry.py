@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, Any
@@ -16,3 +18,18 @@ class Entry(object):
         del entry_frontmatter["body"]
         post: frontmatter.Post = frontmatter.Post(self.body, **entry_frontmatter)
         return frontmatter.dumps(post)
+
+    @classmethod
+    def from_frontmatter(cls, post: frontmatter.Post) -> Entry:
+        created: datetime = post.metadata["created"]
+        return cls(body=post.content, created=created, last_modified=post.metadata.get("last_modified", created))
+
+    @classmethod
+    def from_dict(cls, dictionary: Dict[str, Any]) -> Entry:
+        return cls(body=dictionary["body"],
+                   last_modified=datetime.fromisoformat(dictionary["last_modified"]),
+                   created=datetime.fromisoformat(dictionary["created"]),
+                   )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"body": self.body, "last_modified": self.last_modified.isoformat(), "created": self.created.isoformat()}
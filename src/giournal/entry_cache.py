@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+
+from helpers.encryption import local_decrypt, local_encrypt
+from helpers.timings import timed
+from .entry import Entry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    file_name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash BLOB NOT NULL,
+    payload BLOB NOT NULL,
+    last_used INTEGER NOT NULL
+)
+"""
+
+
+def default_cache_path(journal_path: str) -> str:
+    """ Outside of the journal, so the cache is never committed. One cache per journal. """
+    cache_home: str = os.environ.get("XDG_CACHE_HOME") or os.path.join(str(Path.home()), ".cache")
+    journal_id: str = hashlib.sha256(os.path.abspath(journal_path).encode()).hexdigest()[:16]
+    return os.path.join(cache_home, "giournal", f"{journal_id}.sqlite")
+
+
+def _file_signature(file_path: str) -> Tuple[int, int]:
+    stat: os.stat_result = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _file_hash(file_path: str) -> bytes:
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+class EntryCache(object):
+    """
+    Decrypted entries keyed by file name, each payload encrypted with a single key derived from the journal key.
+    Payloads use AES-GCM rather than Fernet, which is several times faster to open for small records.
+    A row is valid while the file size and mtime match, or failing that while the content hash matches,
+    so entries changed by a pull are decrypted again.
+    Least recently used rows are evicted once there are more than `max_entries`.
+    """
+
+    def __init__(self, path: str, key: bytes, max_entries: int) -> None:
+        """ `key` is a urlsafe base64 encoded 32 byte key, as returned by `EncryptionSession.derive_subkey`. """
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self._connection: sqlite3.Connection = sqlite3.connect(path)
+        self._connection.execute(_SCHEMA)
+        self._key: bytes = key
+        self._max_entries: int = max_entries
+        self._now: int = time.time_ns()
+        self._hits: List[Tuple[int, int, int, str]] = []
+
+    def __enter__(self) -> EntryCache:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @timed("cache.get")
+    def get(self, file_name: str, file_path: str) -> Optional[Entry]:
+        row: Optional[Tuple[int, int, bytes, bytes]] = self._connection.execute(
+            "SELECT size, mtime_ns, content_hash, payload FROM entries WHERE file_name = ?", (file_name,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        size, mtime_ns, content_hash, payload = row
+        signature: Tuple[int, int] = _file_signature(file_path)
+        if signature != (size, mtime_ns):
+            if _file_hash(file_path) != content_hash:
+                return None
+            size, mtime_ns = signature
+
+        try:
+            plaintext: bytes = local_decrypt(payload, self._key, file_name.encode())
+        except InvalidTag:
+            # Written under a journal key that has since been replaced.
+            return None
+        entry: Entry = Entry.from_dict(json.loads(plaintext))
+        self._hits.append((size, mtime_ns, self._now, file_name))
+        return entry
+
+    @timed("cache.put")
+    def put(self, file_name: str, file_path: str, entry: Entry) -> None:
+        size, mtime_ns = _file_signature(file_path)
+        payload: bytes = local_encrypt(json.dumps(entry.to_dict()).encode(), self._key, file_name.encode())
+        self._connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (file_name, size, mtime_ns, _file_hash(file_path), payload, self._now),
+        )
+
+    def prune(self, file_names: Iterable[str]) -> None:
+        """ Drop rows for entries that no longer exist. """
+        self._connection.execute("CREATE TEMPORARY TABLE IF NOT EXISTS live (file_name TEXT PRIMARY KEY)")
+        self._connection.execute("DELETE FROM live")
+        self._connection.executemany("INSERT OR IGNORE INTO live VALUES (?)", ((f,) for f in file_names))
+        self._connection.execute("DELETE FROM entries WHERE file_name NOT IN (SELECT file_name FROM live)")
+
+    def close(self) -> None:
+        self._connection.executemany(
+            "UPDATE entries SET size = ?, mtime_ns = ?, last_used = ? WHERE file_name = ?", self._hits
+        )
+        self._connection.execute(
+            "DELETE FROM entries WHERE file_name IN "
+            "(SELECT file_name FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self._max_entries,),
+        )
+        self._connection.commit()
+        self._connection.close()
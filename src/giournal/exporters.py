@@ -0,0 +1,88 @@
+import json
+import struct
+import tarfile
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional
+
+from helpers.encryption import EncryptionSession, KeyParameters
+from .entry import Entry
+from .layout import FILENAME_DATETIME_FORMAT
+
+# One JSON object per line, as read back by --import.
+JSONL = "jsonl"
+# An uncompressed tar of markdown files with frontmatter, pipe it into a compressor if needed.
+TAR = "tar"
+# Entries encrypted with a key derived from a password of its own, readable without the journal.
+ARCHIVE = "archive"
+EXPORT_FORMATS = (JSONL, TAR, ARCHIVE)
+
+ARCHIVE_MAGIC = b"GIOURNAL-ARCHIVE\n"
+ARCHIVE_VERSION = 1
+# Every record is the length of the token, then the token of one entry as a JSON line.
+_RECORD_LENGTH: struct.Struct = struct.Struct(">I")
+
+
+def export(entries: Iterable[Entry], output: BinaryIO, export_format: str, password: Optional[str] = None) -> int:
+    """ Writes the entries to `output` as they come, so only one is held at a time. Returns how many. """
+    if export_format == JSONL:
+        return _export_jsonl(entries, output)
+    if export_format == TAR:
+        return _export_tar(entries, output)
+    if export_format == ARCHIVE:
+        return _export_archive(entries, output, password)
+    raise ValueError(f"Unknown export format '{export_format}', expected one of {EXPORT_FORMATS}")
+
+
+def _export_jsonl(entries: Iterable[Entry], output: BinaryIO) -> int:
+    exported: int = 0
+    for entry in entries:
+        output.write(json.dumps(entry.to_dict()).encode() + b"\n")
+        exported += 1
+    return exported
+
+
+def _export_tar(entries: Iterable[Entry], output: BinaryIO) -> int:
+    exported: int = 0
+    # The stream mode never seeks, so it can write to a pipe.
+    with tarfile.open(fileobj=output, mode="w|") as tar:
+        for entry in entries:
+            content: bytes = entry.to_frontmatter().encode()
+            tar_info: tarfile.TarInfo = tarfile.TarInfo(f"{entry.created.strftime(FILENAME_DATETIME_FORMAT)}.md")
+            tar_info.size = len(content)
+            tar_info.mtime = int(entry.last_modified.timestamp())
+            tar.addfile(tar_info, BytesIO(content))
+            exported += 1
+    return exported
+
+
+def _export_archive(entries: Iterable[Entry], output: BinaryIO, password: Optional[str]) -> int:
+    if not password:
+        raise ValueError("An archive needs a password")
+    parameters: KeyParameters = KeyParameters.generate()
+    session: EncryptionSession = EncryptionSession(password, [])
+    session.add_key(parameters)
+    output.write(ARCHIVE_MAGIC)
+    output.write(json.dumps({"version": ARCHIVE_VERSION, "key": parameters.to_dict()}).encode() + b"\n")
+    exported: int = 0
+    for entry in entries:
+        token: bytes = session.encrypt(json.dumps(entry.to_dict()).encode())
+        output.write(_RECORD_LENGTH.pack(len(token)) + token)
+        exported += 1
+    return exported
+
+
+def read_archive(archive: BinaryIO, password: str) -> Iterator[Entry]:
+    """ Raises WrongPasswordError before yielding anything if `password` is not the one of the archive. """
+    if archive.readline() != ARCHIVE_MAGIC:
+        raise ValueError("Not a giournal archive")
+    header: Dict = json.loads(archive.readline())
+    if header["version"] > ARCHIVE_VERSION:
+        raise ValueError(f"Archive version {header['version']} is newer than this giournal")
+    session: EncryptionSession = EncryptionSession(password, [])
+    session.add_key(KeyParameters.from_dict(header["key"]))
+    while True:
+        length: bytes = archive.read(_RECORD_LENGTH.size)
+        if len(length) < _RECORD_LENGTH.size:
+            return
+        token: bytes = archive.read(_RECORD_LENGTH.unpack(length)[0])
+        yield Entry.from_dict(json.loads(session.decrypt(token)))
@@ -0,0 +1,38 @@
+import json
+import tarfile
+import unittest
+from datetime import datetime
+from io import BytesIO
+from typing import List
+
+from helpers.encryption import WrongPasswordError
+from .entry import Entry
+from .exporters import ARCHIVE, JSONL, TAR, export, read_archive
+
+ENTRIES: List[Entry] = [
+    Entry(body=f"entry {i}", created=datetime(2020, 1, i + 1), last_modified=datetime(2020, 1, i + 1))
+    for i in range(3)
+]
+
+
+class ExportersTest(unittest.TestCase):
+    def test_jsonl_and_tar_stream_entries_in_order(self) -> None:
+        output: BytesIO = BytesIO()
+        self.assertEqual(export(iter(ENTRIES), output, JSONL), 3)
+        self.assertEqual([Entry.from_dict(json.loads(line)) for line in output.getvalue().splitlines()], ENTRIES)
+
+        output = BytesIO()
+        self.assertEqual(export(iter(ENTRIES), output, TAR), 3)
+        output.seek(0)
+        with tarfile.open(fileobj=output, mode="r|") as tar:
+            names: List[str] = [m.name for m in tar]
+        self.assertEqual(names, ["2020_01_01-00_00_00.md", "2020_01_02-00_00_00.md", "2020_01_03-00_00_00.md"])
+
+    def test_archive_needs_its_password(self) -> None:
+        output: BytesIO = BytesIO()
+        self.assertEqual(export(iter(ENTRIES), output, ARCHIVE, "archive password"), 3)
+        self.assertNotIn(b"entry", output.getvalue())
+
+        self.assertEqual(list(read_archive(BytesIO(output.getvalue()), "archive password")), ENTRIES)
+        with self.assertRaises(WrongPasswordError):
+            list(read_archive(BytesIO(output.getvalue()), "wrong"))
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterator, List, Optional
+
+import frontmatter
+
+from .entry import Entry
+
+# A directory of markdown files, with a `created` or `date` in their frontmatter.
+MARKDOWN = "markdown"
+# One JSON object per line, with `created` or jrnl's `date` and `time`, and `body` and optionally `title`.
+JSONL = "jsonl"
+# jrnl's plain text export, every entry starting with a `[YYYY-MM-DD HH:MM] title` line.
+JRNL = "jrnl"
+# Written by --export in the archive format, needs the password of the archive.
+ARCHIVE = "archive"
+IMPORT_FORMATS = (MARKDOWN, JSONL, JRNL, ARCHIVE)
+
+_JRNL_HEADER: re.Pattern = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{1,2}:\d{2}(?::\d{2})?(?: ?[AaPp][Mm])?)\] ?(.*)$")
+_JRNL_DATETIME_FORMATS: List[str] = ["%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %I:%M %p", "%Y-%m-%d %I:%M%p"]
+
+
+class ImportFormatError(ValueError):
+    """ An entry to import has no date or a date that cannot be read. """
+
+
+def detect_format(path: str) -> str:
+    from .exporters import ARCHIVE_MAGIC
+
+    if os.path.isdir(path):
+        return MARKDOWN
+    with open(path, "rb") as file:
+        if file.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC:
+            return ARCHIVE
+    if path.endswith((".jsonl", ".json")):
+        return JSONL
+    return JRNL
+
+
+def read_entries(path: str, import_format: Optional[str] = None, password: Optional[str] = None) -> Iterator[Entry]:
+    """ Streams the entries in `path`, keeping their original creation dates. Only archives need `password`. """
+    import_format = import_format or detect_format(path)
+    if import_format == MARKDOWN:
+        return _read_markdown_directory(path)
+    if import_format == JSONL:
+        return _read_jsonl(path)
+    if import_format == JRNL:
+        return _read_jrnl(path)
+    if import_format == ARCHIVE:
+        return _read_archive(path, password)
+    raise ValueError(f"Unknown import format '{import_format}', expected one of {IMPORT_FORMATS}")
+
+
+def _as_datetime(value: Any, source: str) -> datetime:
+    """ Naive local time, like the entries written by giournal. """
+    if isinstance(value, datetime):
+        parsed: datetime = value
+    elif isinstance(value, date):
+        parsed = datetime.combine(value, time())
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            raise ImportFormatError(f"Cannot read the date '{value}' of {source}")
+    else:
+        raise ImportFormatError(f"No date for {source}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _read_markdown_directory(path: str) -> Iterator[Entry]:
+    for directory, directory_names, file_names in os.walk(path):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            if not file_name.endswith((".md", ".markdown")):
+                continue
+            file_path: str = os.path.join(directory, file_name)
+            post: frontmatter.Post = frontmatter.load(file_path)
+            created: datetime = _as_datetime(post.metadata.get("created", post.metadata.get("date")), file_path)
+            last_modified: datetime = _as_datetime(post.metadata.get("last_modified", created), file_path)
+            yield Entry(body=post.content, created=created, last_modified=last_modified)
+
+
+def _read_jsonl(path: str) -> Iterator[Entry]:
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            dictionary: Dict[str, Any] = json.loads(line)
+            source: str = f"line {line_number} of '{path}'"
+            if "created" in dictionary:
+                created: datetime = _as_datetime(dictionary["created"], source)
+            else:
+                created = _as_datetime(f"{dictionary.get('date', '')} {dictionary.get('time', '00:00')}", source)
+            body: str = dictionary.get("body", "")
+            if dictionary.get("title"):
+                body = f"{dictionary['title']}\n{body}".strip()
+            last_modified: datetime = _as_datetime(dictionary.get("last_modified", created), source)
+            yield Entry(body=body, created=created, last_modified=last_modified)
+
+
+def _parse_jrnl_datetime(value: str, source: str) -> datetime:
+    for datetime_format in _JRNL_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, datetime_format)
+        except ValueError:
+            pass
+    raise ImportFormatError(f"Cannot read the date '{value}' of {source}")
+
+
+def _read_jrnl(path: str) -> Iterator[Entry]:
+    created: Optional[datetime] = None
+    lines: List[str] = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            match: Optional[re.Match] = _JRNL_HEADER.match(line)
+            if match is None:
+                if created is not None:
+                    lines.append(line)
+                continue
+            if created is not None:
+                yield Entry(body="".join(lines).strip(), created=created, last_modified=created)
+            created = _parse_jrnl_datetime(match.group(1), f"line {line_number} of '{path}'")
+            lines = [f"{match.group(2)}\n"]
+    if created is not None:
+        yield Entry(body="".join(lines).strip(), created=created, last_modified=created)
+
+
+def _read_archive(path: str, password: Optional[str]) -> Iterator[Entry]:
+    from .exporters import read_archive
+
+    with open(path, "rb") as file:
+        yield from read_archive(file, password or "")
@@ -0,0 +1,45 @@
+import os
+import unittest
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from typing import List
+
+from .entry import Entry
+from .importers import JRNL, JSONL, MARKDOWN, detect_format, read_entries
+
+
+class ImportersTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _write(self, name: str, content: str) -> str:
+        path: str = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def test_markdown_directory_keeps_frontmatter_dates(self) -> None:
+        self._write("notes/2019/a.md", "---\ncreated: 2019-05-01 08:30:00\n---\nfirst")
+        self._write("notes/b.md", "---\ndate: 2020-01-02\n---\nsecond")
+        self._write("notes/ignored.txt", "not an entry")
+        path: str = os.path.join(self.directory.name, "notes")
+
+        self.assertEqual(detect_format(path), MARKDOWN)
+        entries: List[Entry] = list(read_entries(path))
+        self.assertEqual(sorted((e.created, e.body) for e in entries),
+                         [(datetime(2019, 5, 1, 8, 30), "first"), (datetime(2020, 1, 2), "second")])
+
+    def test_jsonl_and_jrnl_exports(self) -> None:
+        jsonl_path: str = self._write("export.jsonl", '{"created": "2020-01-01T10:00:00", "body": "json"}\n\n'
+                                                      '{"date": "2020-01-02", "time": "11:15", "title": "Title", '
+                                                      '"body": "jrnl json"}\n')
+        self.assertEqual(detect_format(jsonl_path), JSONL)
+        self.assertEqual([(e.created, e.body) for e in read_entries(jsonl_path)],
+                         [(datetime(2020, 1, 1, 10), "json"), (datetime(2020, 1, 2, 11, 15), "Title\njrnl json")])
+
+        jrnl_path: str = self._write("export.txt", "[2020-03-01 09:00] Morning\nCoffee.\n\n[2020-03-01 21:30] Night\n")
+        self.assertEqual(detect_format(jrnl_path), JRNL)
+        self.assertEqual([(e.created, e.body) for e in read_entries(jrnl_path)],
+                         [(datetime(2020, 3, 1, 9), "Morning\nCoffee."), (datetime(2020, 3, 1, 21, 30), "Night")])
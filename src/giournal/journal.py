@@ -1,130 +1,1403 @@
+import hashlib
+import json
 import os
-from datetime import datetime
-from os import listdir, remove
-from os.path import isfile, join
-from typing import List
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from functools import partial, wraps
+from itertools import islice
+from os import remove
+from os.path import join
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
 
 import frontmatter as frontmatter
-from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
 
-from helpers.encryption import password_encrypt, password_decrypt
-from helpers.filesystem import safe_make_dir_and_file, safe_make_dir
-from helpers.keychain import get_password_from_keychain_with_fallback
+from helpers.encryption import EncryptionSession, KeyParameters, UnknownKeyError, WrongPasswordError, token_key_id
+from helpers import key_agent
+from helpers.filesystem import atomic_create, atomic_write, safe_make_dir_and_file, safe_make_dir
+from helpers.keychain import (
+    get_password_from_keychain_with_fallback, get_password_without_prompt, replace_password, set_password_in_keychain,
+)
+from helpers.parallel import PROCESS, TaskResult, ordered_map
+from helpers.timings import Phase, timed
+from . import sync_queue
 from .entry import Entry
+from .journal_header import HEADER_FILE_NAME, JournalHeader, append_key, get_journal_header, update_keys
 from .journal_configuration import JournalConfiguration, get_journal_configuration
+from .layout import FILENAME_DATETIME_FORMAT, LAYOUTS, entry_created, entry_path, list_entry_paths
+from .local_state import local_state_lock, local_state_path
+from .local_log import append_record, read_records
+from .manifest import MANIFEST_FILE_NAME, MANIFEST_LOG_FILE_NAME, Manifest, ManifestRecord, ciphertext_digest
+from .search_index import SEARCH_INDEX_FILE_NAME, SEARCH_INDEX_LOG_FILE_NAME, SearchIndex, Signature, file_signature
+from .segments import SEGMENTS, SEGMENTS_DIRECTORY, SegmentStore
+from .statistics import STATISTICS_FILE_NAME, Statistics, Summary
 
-FILENAME_DATETIME_FORMAT = "%Y_%m_%d-%H_%M_%S"
+if TYPE_CHECKING:
+    from git import Repo
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Ciphertexts of the decrypted entries, and hashes of their plain text, kept until they are encrypted again.
+ORIGINALS_DIRECTORY = "originals"
+PLAINTEXT_HASHES_FILE_NAME = "plaintext_hashes"
+# Packed entries are appended to the segments in batches of this many.
+IMPORT_BATCH_SIZE = 1_000
+# The commit the journal was last verified at without problems, where an incremental verification starts from.
+VERIFIED_COMMIT_FILE_NAME = "verified_commit"
+# The new key of a password change in progress, until every entry has been re-encrypted with it.
+PASSWORD_CHANGE_FILE_NAME = "password_change"
+
+
+class PasswordChangeInProgressError(Exception):
+    """ Entries are under two passwords until the interrupted password change is run again to finish it. """
+
+
+class WorkspaceWriteBackError(Exception):
+    """ Some edited workspace files could not be written back, the workspace is kept so their edits are not lost. """
+
+
+class PasswordUnavailableError(Exception):
+    """ A journal that must not prompt, e.g. in a background worker, found no password in the agent or keyring. """
+
+
+def _original_path(journal_path: str, file_name: str) -> str:
+    """ Where the ciphertext of a decrypted entry is kept, so it can be restored if the entry is not edited. """
+    return join(local_state_path(journal_path, ORIGINALS_DIRECTORY), file_name)
+
+
+def _plaintext_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _decrypt_entry_file(journal_path: str, file_name: str, session: EncryptionSession) -> Tuple[str, str]:
+    """ Returns the name of the decrypted file and the hash of its content. """
+    encrypted_entry_filename = join(journal_path, file_name)
+    with open(encrypted_entry_filename, "rb") as encrypted_file:
+        encrypted_entry: bytes = encrypted_file.read()
+
+    decrypted_entry: str = session.decrypt(encrypted_entry).decode()
+    frontmatter_entry: frontmatter.Post = frontmatter.loads(decrypted_entry)
+    decrypted_content: bytes = frontmatter.dumps(frontmatter_entry).encode()
+
+    with open(f"{encrypted_entry_filename}.md", "wb") as decrypted_file:
+        decrypted_file.write(decrypted_content)
+
+    original_path: str = _original_path(journal_path, file_name)
+    os.makedirs(os.path.dirname(original_path), exist_ok=True)
+    os.replace(encrypted_entry_filename, original_path)
+    return f"{file_name}.md", _plaintext_hash(decrypted_content)
+
+
+@dataclass
+class _DecryptedFile(object):
+    file_name: str
+    # Of the content as decrypted, None for files that were not decrypted by giournal.
+    plaintext_hash: Optional[str] = None
+
+    def __str__(self) -> str:
+        return self.file_name
+
+
+def _encrypt_entry_file(
+    journal_path: str, decrypted_file: _DecryptedFile, session: EncryptionSession
+) -> Tuple[str, Optional[ManifestRecord], Optional[str]]:
+    """
+    Returns the name of the encrypted file, its manifest record, and the name it had if an edit of its created date
+    moved it. An entry that was not edited gets its original ciphertext back, byte for byte, and no record.
+    """
+    decrypted_entry_filename = join(journal_path, decrypted_file.file_name)
+    with open(decrypted_entry_filename, "rb") as file:
+        decrypted_content: bytes = file.read()
+    original_file_name: str = decrypted_file.file_name[:-len(".md")]
+    original_path: str = _original_path(journal_path, original_file_name)
+
+    if decrypted_file.plaintext_hash == _plaintext_hash(decrypted_content) and os.path.exists(original_path):
+        os.replace(original_path, join(journal_path, original_file_name))
+        remove(decrypted_entry_filename)
+        return original_file_name, None, None
+
+    decrypted_frontmatter_entry: frontmatter.Post = frontmatter.loads(decrypted_content.decode())
+    if decrypted_file.plaintext_hash is not None:
+        decrypted_frontmatter_entry["last_modified"] = datetime.now()
+
+    def token_for(created: datetime) -> bytes:
+        decrypted_frontmatter_entry["created"] = created
+        return session.encrypt(frontmatter.dumps(decrypted_frontmatter_entry).encode())
+
+    # Next to the decrypted file, so the entry stays in its shard.
+    filename, encrypted_formatted_entry, _ = _create_entry_file(
+        journal_path, decrypted_frontmatter_entry["created"],
+        lambda created: os.path.join(os.path.dirname(decrypted_file.file_name),
+                                     created.strftime(FILENAME_DATETIME_FORMAT)),
+        token_for,
+    )
+
+    remove(decrypted_entry_filename)
+    if os.path.exists(original_path):
+        remove(original_path)
+    return filename, ManifestRecord.from_entry(Entry.from_frontmatter(decrypted_frontmatter_entry),
+                                               encrypted_formatted_entry), \
+        original_file_name if filename != original_file_name else None
+
+
+def _create_entry_file(
+    journal_path: str, created: datetime, name_for: Callable[[datetime], str], token_for: Callable[[datetime], bytes]
+) -> Tuple[str, bytes, datetime]:
+    """
+    Writes a new entry file atomically, never over another entry, e.g. one added meanwhile by another process or
+    one an edited date now falls on: the entry moves to the next free second instead.
+    Returns the file name, the token written and the date the entry was created at.
+    """
+    while True:
+        file_name: str = name_for(created)
+        token: bytes = token_for(created)
+        os.makedirs(os.path.dirname(join(journal_path, file_name)), exist_ok=True)
+        if atomic_create(join(journal_path, file_name), token):
+            return file_name, token, created
+        created += timedelta(seconds=1)
+
+
+def _read_entry_file(journal_path: str, file_name: str, session: EncryptionSession) -> Entry:
+    if file_name.endswith(".md"):
+        with open(join(journal_path, file_name), "r") as file:
+            return Entry.from_frontmatter(frontmatter.load(file))
+
+    with Phase("read_file"), open(join(journal_path, file_name), "rb") as file:
+        encrypted_entry: bytes = file.read()
+    decrypted: str = session.decrypt(encrypted_entry).decode()
+    return _parse_entry(decrypted)
+
+
+@timed("frontmatter")
+def _parse_entry(decrypted: str) -> Entry:
+    return Entry.from_frontmatter(frontmatter.loads(decrypted))
+
+
+@dataclass
+class _CacheLookup(object):
+    file_name: str
+    entry: Optional[Entry]
+    miss: bool = False
+    # Read from its segment for packed entries, which are not cached.
+    token: Optional[bytes] = None
+
+    def __str__(self) -> str:
+        return self.file_name
+
+
+def _read_cached_entry_file(journal_path: str, lookup: _CacheLookup, session: EncryptionSession) -> _CacheLookup:
+    """ Returns the lookup itself on a cache hit, a new one holding the decrypted entry on a miss. """
+    if lookup.entry is not None:
+        return lookup
+    if lookup.token is not None:
+        entry: Entry = _parse_entry(session.decrypt(lookup.token).decode())
+        return _CacheLookup(lookup.file_name, entry)
+    return _CacheLookup(lookup.file_name, _read_entry_file(journal_path, lookup.file_name, session), miss=True)
+
+
+@dataclass
+class _VerifiedEntry(object):
+    file_name: str
+    problem: Optional[str] = None
+    created: Optional[datetime] = None
+    body_hash: Optional[str] = None
+
+
+def _verify_entry_file(journal_path: str, lookup: _CacheLookup, session: EncryptionSession) -> _VerifiedEntry:
+    """ Checks the envelope, its authentication and the frontmatter. Never raises, and writes nothing. """
+    file_name: str = lookup.file_name
+    token: Optional[bytes] = lookup.token
+    if token is None:
+        try:
+            with open(join(journal_path, file_name), "rb") as file:
+                token = file.read()
+        except OSError as e:
+            return _VerifiedEntry(file_name, f"cannot be read: {e.strerror}")
+    if not token:
+        return _VerifiedEntry(file_name, "is empty")
+    try:
+        decrypted: bytes = session.decrypt(token)
+    except UnknownKeyError:
+        return _VerifiedEntry(file_name, "is encrypted with a journal key missing from the header")
+    except (InvalidTag, InvalidToken):
+        return _VerifiedEntry(file_name, "fails authentication, it is corrupt or was encrypted with another password")
+    except Exception as e:
+        return _VerifiedEntry(file_name, f"has a malformed envelope: {e!r}")
+    try:
+        entry: Entry = _parse_entry(decrypted.decode())
+    except Exception as e:
+        return _VerifiedEntry(file_name, f"does not parse as an entry: {e!r}")
+    if not isinstance(entry.created, datetime):
+        return _VerifiedEntry(file_name, f"has an invalid created date '{entry.created}'")
+    verified_entry: _VerifiedEntry = _VerifiedEntry(file_name, None, entry.created,
+                                                    _plaintext_hash(entry.body.encode()))
+    if entry.created.strftime(FILENAME_DATETIME_FORMAT) != os.path.basename(file_name):
+        verified_entry.problem = f"is named after another date than its created date {entry.created}"
+    return verified_entry
+
+
+def _upgrade_entry_file(journal_path: str, file_name: str, session: EncryptionSession) -> Optional[str]:
+    """ Returns the file name if the entry was rewritten. """
+    encrypted_entry_filename = join(journal_path, file_name)
+    with open(encrypted_entry_filename, "rb") as encrypted_file:
+        encrypted_entry: bytes = encrypted_file.read()
+    if session.is_current(encrypted_entry):
+        return None
+
+    # Atomically, as this may run in the background while other commands read the entry.
+    atomic_write(encrypted_entry_filename, session.encrypt(session.decrypt(encrypted_entry)))
+    return file_name
+
+
+def _upgrade_packed_entry(
+    journal_path: str, packed_entry: Tuple[str, bytes], session: EncryptionSession
+) -> Optional[Tuple[str, bytes]]:
+    """ Returns the name and new token if the entry needs rewriting, the caller appends it to the segments. """
+    name, token = packed_entry
+    if session.is_current(token):
+        return None
+    return name, session.encrypt(session.decrypt(token))
+
+
+def _import_entry(
+    journal_path: str, imported: Tuple[str, Entry], session: EncryptionSession
+) -> Tuple[str, ManifestRecord, Optional[bytes]]:
+    """ Writes an entry file straight away, the token of a packed entry is returned for the caller to append. """
+    file_name, entry = imported
+    token: bytes = session.encrypt(entry.to_frontmatter().encode())
+    record: ManifestRecord = ManifestRecord.from_entry(entry, token)
+    if os.path.dirname(file_name) == SEGMENTS_DIRECTORY:
+        return file_name, record, token
+    os.makedirs(os.path.dirname(join(journal_path, file_name)), exist_ok=True)
+    atomic_write(join(journal_path, file_name), token)
+    return file_name, record, None
+
+
+@dataclass
+class ImportReport(object):
+    imported: int = 0
+    duplicates: int = 0
+    moved: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return (f"Imported {self.imported} entries in {self.seconds:.1f}s, "
+                f"{self.imported / self.seconds if self.seconds else 0:.0f} entries/s. "
+                f"Skipped {self.duplicates} already in the journal, "
+                f"moved {self.moved} to the next free second as another entry had the same date.")
+
+
+@dataclass
+class VerifyReport(object):
+    checked: int = 0
+    problems: List[str] = field(default_factory=list)
+    # Whether only the entries changed since the last verified commit were checked.
+    incremental: bool = False
+
+    def __str__(self) -> str:
+        scope: str = "changed since the last verified commit " if self.incremental else ""
+        return f"Checked {self.checked} entries {scope}and found {len(self.problems)} problems."
+
+
+@dataclass
+class SyncReport(object):
+    pulled_commits: int = 0
+    pulled_paths: List[str] = field(default_factory=list)
+    committed_paths: List[str] = field(default_factory=list)
+    pushed_commits: int = 0
+
+    def __str__(self) -> str:
+        return (f"Pulled {self.pulled_commits} commits changing {len(self.pulled_paths)} files, "
+                f"committed {len(self.committed_paths)} files, pushed {self.pushed_commits} commits.")
+
+
+def _holding_local_state_lock(method: Callable[..., R]) -> Callable[..., R]:
+    """ For methods that read, update and store local state, which background workers update too. """
+    @wraps(method)
+    def wrapper(self: "Journal", *args, **kwargs) -> R:
+        with local_state_lock(self.journal_configuration.journal_path):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _file_name_in_range(file_name: str, since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """ Entries whose file name is not a creation date are kept, their date is only known once decrypted. """
+    if since is None and until is None:
+        return True
+    created: Optional[datetime] = entry_created(file_name)
+    if created is None:
+        return True
+    # File names are truncated to the second, so compare at that resolution to not drop entries at the edges.
+    return (since is None or created >= since.replace(microsecond=0)) and (until is None or created < until)
 
 
 class Journal(object):
-    def __init__(self, journal_configuration: JournalConfiguration) -> None:
+    def __init__(self, journal_configuration: JournalConfiguration, interactive: bool = True) -> None:
         self.journal_configuration: JournalConfiguration = journal_configuration
+        # Without a terminal, e.g. in background workers, the password only comes from the agent or keyring.
+        self.interactive: bool = interactive
+        self._session: Optional[EncryptionSession] = None
+        self._segments: Optional[SegmentStore] = None
+        # Kept open between syncs by long running processes, e.g. the local server.
+        self._repo: Optional["Repo"] = None
 
     def decrypt(self) -> None:
-        """ Decrypt all entries in place. """
-        password: str = get_password_from_keychain_with_fallback()
-        file_names: List[str] = self._all_entries_file_names()
+        """
+        Decrypt all entries in place. Nothing is recorded for the next sync, plain text must never be pushed.
+        The hash of every decrypted file is kept, so encrypt can tell which entries were edited.
+        """
+        self._warn_packed("decrypt")
+        file_names: List[str] = [f for f in self._all_entries_file_names() if not f.endswith(".md")]
+        plaintext_hashes: Dict[str, str] = self._load_plaintext_hashes()
+        plaintext_hashes.update(self._map_entry_files(_decrypt_entry_file, file_names, "decrypt"))
+        self._store_plaintext_hashes(plaintext_hashes)
 
-        for file_name in file_names:
-            encrypted_entry_filename = join(self.journal_configuration.journal_path, file_name)
-            with open(encrypted_entry_filename, "rb") as encrypted_file:
-                encrypted_entry: bytes = encrypted_file.readline()
+    def encrypt(self) -> None:
+        """ Encrypt all entries in place. Only the edited ones are re-encrypted and recorded for the next sync. """
+        plaintext_hashes: Dict[str, str] = self._load_plaintext_hashes()
+        decrypted_files: List[_DecryptedFile] = [
+            _DecryptedFile(f, plaintext_hashes.get(f)) for f in self._all_entries_file_names() if f.endswith(".md")
+        ]
+        encrypted: Dict[str, ManifestRecord] = {}
+        # Entries moved by an edit of their created date, their old file is deleted by the same sync.
+        moved_from: List[str] = []
+        for file_name, record, previous_name in self._map_entry_files(_encrypt_entry_file, decrypted_files, "encrypt"):
+            if record is not None:
+                encrypted[file_name] = record
+            if previous_name is not None:
+                moved_from.append(previous_name)
+        # Files that failed to encrypt are still there, and keep their hash for the next attempt.
+        self._store_plaintext_hashes({f: h for f, h in plaintext_hashes.items()
+                                      if os.path.exists(join(self.journal_configuration.journal_path, f))})
+        self._record_changes(list(encrypted) + moved_from)
 
-            decrypted_entry: str = password_decrypt(encrypted_entry, password).decode()
-            frontmatter_entry: frontmatter.Post = frontmatter.loads(decrypted_entry)
+        def update(manifest: Manifest) -> None:
+            for file_name in moved_from:
+                manifest.remove(file_name)
+            manifest.put_all(encrypted)
 
-            with open(f"{encrypted_entry_filename}.md", "wb") as decrypted_file:
-                frontmatter.dump(frontmatter_entry, decrypted_file)
+        self._update_manifest(update)
 
-            remove(encrypted_entry_filename)
+    def _load_plaintext_hashes(self) -> Dict[str, str]:
+        path: str = local_state_path(self.journal_configuration.journal_path, PLAINTEXT_HASHES_FILE_NAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as file:
+            return json.load(file)
 
-    def encrypt(self) -> None:
-        """ Encrypt all entries in place. """
-        password: str = get_password_from_keychain_with_fallback()
-        file_names: List[str] = [f for f in self._all_entries_file_names() if f.endswith(".md")]
+    def _store_plaintext_hashes(self, plaintext_hashes: Dict[str, str]) -> None:
+        path: str = local_state_path(self.journal_configuration.journal_path, PLAINTEXT_HASHES_FILE_NAME)
+        if plaintext_hashes:
+            atomic_write(path, json.dumps(plaintext_hashes).encode())
+        elif os.path.exists(path):
+            remove(path)
+
+    def list_entries(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+    ) -> Iterator[str]:
+        """ Yields formatted entries with created date and body, as soon as each one is decrypted. """
+        for entry in self.iter_entries(since, until, limit, reverse):
+            yield f"{entry.created}: {entry.body}\n\n"
+
+    def iter_entries(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+    ) -> Iterator[Entry]:
+        """
+        Yields entries created from `since` included to `until` excluded, oldest first unless `reverse`.
+        The range is checked against file names first, so entries outside of it are never opened.
+        """
+        file_names: List[str] = [f for f in self._all_entry_names(since, until)
+                                 if _file_name_in_range(f, since, until)]
+        if reverse:
+            file_names.reverse()
+
+        entries: Iterator[Entry] = (
+            e for e in self._read_entries(file_names, prune=since is None and until is None)
+            if (since is None or e.created >= since) and (until is None or e.created < until)
+        )
+        yield from islice(entries, limit)
+
+    def upgrade(self) -> int:
+        """ Re-encrypt entries that are not using the current journal key. Returns how many were rewritten. """
+        file_names: List[str] = [f for f in self._all_entries_file_names() if not f.endswith(".md")]
+        upgraded: List[str] = [f for f in self._map_entry_files(_upgrade_entry_file, file_names, "upgrade") if f]
+        self._record_changes(upgraded)
 
+        packed_entries: Iterator[Tuple[str, bytes]] = (
+            (n, self._entry_ciphertext(n)) for n in self._all_entry_names() if self._is_packed(n)
+        )
+        rewritten: List[Tuple[str, bytes]] = [
+            r for r in self._map_entry_files(_upgrade_packed_entry, packed_entries, "upgrade") if r
+        ]
+        if rewritten:
+            self._record_changes(self._segment_store().append((os.path.basename(n), t) for n, t in rewritten))
+            upgraded.extend(n for n, _ in rewritten)
+
+        def update(manifest: Manifest) -> None:
+            for file_name in upgraded:
+                manifest.refresh_digest(file_name, self._entry_ciphertext(file_name))
+
+        self._update_manifest(update)
+        return len(upgraded)
+
+    def migrate_layout(self) -> int:
+        """ Moves entries to the configured layout, git sees them as renamed. Returns how many were moved. """
+        if self.journal_configuration.layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{self.journal_configuration.layout}', expected one of {LAYOUTS}")
+        journal_path: str = self.journal_configuration.journal_path
+        moved: List[str] = []
+        for file_name in self._all_entries_file_names():
+            created: Optional[datetime] = entry_created(file_name)
+            if created is None or file_name.endswith(".md"):
+                continue
+            target: str = entry_path(created, self.journal_configuration.layout)
+            if target == file_name:
+                continue
+            os.makedirs(os.path.dirname(join(journal_path, target)), exist_ok=True)
+            try:
+                # Unlike a rename, fails rather than replace an entry already there, e.g. pulled from a migrated clone.
+                os.link(join(journal_path, file_name), join(journal_path, target))
+            except FileExistsError:
+                print(f"Left '{file_name}' in place, '{target}' already exists.", file=sys.stderr)
+                continue
+            remove(join(journal_path, file_name))
+            moved.extend([file_name, target])
+            shard: str = os.path.dirname(join(journal_path, file_name))
+            if shard != journal_path and not os.listdir(shard):
+                os.removedirs(shard)
+        self._record_changes(moved)
+
+        def update(manifest: Manifest) -> None:
+            for file_name, target in zip(moved[::2], moved[1::2]):
+                manifest.rename(file_name, target)
+
+        self._update_manifest(update)
+        return len(moved) // 2
+
+    def pack(self) -> int:
+        """ Moves every entry file into segments. Returns how many entries were packed. """
+        journal_path: str = self.journal_configuration.journal_path
+        file_names: List[str] = [f for f in self._all_entries_file_names() if not f.endswith(".md")]
+        written: List[str] = self._segment_store().append(
+            (os.path.basename(f), self._entry_ciphertext(f)) for f in file_names
+        )
         for file_name in file_names:
-            decrypted_entry_filename = join(self.journal_configuration.journal_path, file_name)
-            with open(decrypted_entry_filename, "r") as decrypted_file:
-                decrypted_frontmatter_entry: frontmatter.Post = frontmatter.load(decrypted_file)
+            remove(join(journal_path, file_name))
+            shard: str = os.path.dirname(join(journal_path, file_name))
+            if shard != journal_path and not os.listdir(shard):
+                os.removedirs(shard)
+        self._record_changes(file_names + written)
 
-            decrypted_entry: str = frontmatter.dumps(decrypted_frontmatter_entry)
+        def update(manifest: Manifest) -> None:
+            for file_name in file_names:
+                manifest.rename(file_name, join(SEGMENTS_DIRECTORY, os.path.basename(file_name)))
 
-            encrypted_formatted_entry: bytes = password_encrypt(
-                decrypted_entry.encode(), password
-            )
-            filename = decrypted_frontmatter_entry["created"].strftime("%Y_%m_%d-%H_%M_%S")
+        self._update_manifest(update)
+        return len(file_names)
+
+    def unpack(self) -> int:
+        """ Writes every packed entry back to its own file, in the configured layout. Returns how many. """
+        journal_path: str = self.journal_configuration.journal_path
+        store: SegmentStore = self._segment_store()
+        unpacked: Dict[str, str] = {}
+        for name in store.names():
+            created: Optional[datetime] = entry_created(name)
+            file_name: str = name if created is None else entry_path(created, self.journal_configuration.layout)
+            # An entry file for the same entry is newer than the packed one.
+            if not os.path.exists(join(journal_path, file_name)):
+                os.makedirs(os.path.dirname(join(journal_path, file_name)), exist_ok=True)
+                atomic_write(join(journal_path, file_name), bytes(store.read(name)))
+            unpacked[join(SEGMENTS_DIRECTORY, name)] = file_name
+        self._record_changes(list(unpacked.values()) + store.remove_all())
+
+        def update(manifest: Manifest) -> None:
+            for packed_name, file_name in unpacked.items():
+                manifest.rename(packed_name, file_name)
+
+        self._update_manifest(update)
+        return len(unpacked)
+
+    def compact(self) -> Tuple[int, int]:
+        """ Merges the segments, dropping superseded records. Returns how many segments there were before and after. """
+        store: SegmentStore = self._segment_store()
+        before: int = len(store.segments())
+        self._record_changes(store.compact())
+        return before, len(store.segments())
+
+    def count(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> int:
+        """ Entries created from `since` included to `until` excluded, counted from the manifest alone. """
+        return sum(1 for r in self._get_manifest().records.values()
+                   if (since is None or r.created >= since) and (until is None or r.created < until))
 
-            with open(os.path.join(self.journal_configuration.journal_path, filename), "ab") as file:
-                file.write(encrypted_formatted_entry)
+    def reindex(self) -> int:
+        """ Rebuilds the manifest from all the entries. Returns how many entries were indexed. """
+        return len(self._get_manifest(rebuild=True).records)
 
-            remove(decrypted_entry_filename)
+    @_holding_local_state_lock
+    def statistics(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   rebuild: bool = False) -> Summary:
+        """
+        Of the entries created from `since` included to `until` excluded, from aggregates kept up to date as entries
+        are added or pulled. They are kept per day, so a bound with a time of day includes that whole day.
+        `rebuild` recomputes them from all the entries, decrypting them in parallel.
+        """
+        journal_path: str = self.journal_configuration.journal_path
+        statistics_path: str = local_state_path(journal_path, STATISTICS_FILE_NAME)
+        statistics_key: bytes = self._get_session().derive_subkey(b"statistics")
+        if rebuild or not os.path.exists(statistics_path):
+            statistics: Statistics = Statistics.from_records(self._get_manifest(rebuild=rebuild).records.values())
+            statistics.store(statistics_path, statistics_key)
+        else:
+            if os.path.exists(local_state_path(journal_path, MANIFEST_LOG_FILE_NAME)):
+                # Folds the entries added since into the manifest, and the statistics.
+                self._update_manifest(lambda manifest: None)
+            statistics = Statistics.load(statistics_path, statistics_key)
+        until_day: Optional[date] = None
+        if until is not None:
+            until_day = until.date() if until.time() == datetime.min.time() else until.date() + timedelta(days=1)
+        return statistics.summary(since.date() if since else None, until_day)
+
+    def check_manifest(self) -> List[str]:
+        """ Differences between the manifest and the entry files, an empty list if they are consistent. """
+        digests: Dict[str, Tuple[str, int]] = {
+            f: ciphertext_digest(self._entry_ciphertext(f)) for f in self._all_entry_names() if not f.endswith(".md")
+        }
+        return self._get_manifest().check(digests)
+
+    def verify(self, incremental: bool = False) -> VerifyReport:
+        """
+        Checks that entries decrypt and parse, on the worker pool, and reports corrupt entries, entries named after
+        another date than their created date, and duplicates. Nothing in the journal is written.
+        Once no problem is found the current commit is recorded, `incremental` then only checks entries changed since.
+        """
+        verify_report: VerifyReport = VerifyReport()
+        journal_path: str = self.journal_configuration.journal_path
+        file_names: List[str] = self._all_entry_names()
+        head: Optional[str] = self._head_commit()
+        changed: Optional[Set[str]] = self._changed_since_verified(head) if incremental else None
+        if changed is not None:
+            verify_report.incremental = True
+            file_names = [f for f in file_names if f in changed or self._segment_path(f) in changed]
+
+        # The same date twice, e.g. in both layouts, is a duplicate even if one of them is corrupt.
+        paths_by_name: Dict[str, List[str]] = {}
+        for file_name in self._all_entries_file_names():
+            paths_by_name.setdefault(os.path.basename(file_name), []).append(file_name)
+        for name, paths in paths_by_name.items():
+            if len(paths) > 1 and (changed is None or any(p in changed for p in paths)):
+                verify_report.problems.append(f"{', '.join(paths)} are the same entry in different directories")
 
-    def list_entries(self) -> str:
-        """ Returns all formatted entries with created date and body. """
-        file_names: List[str] = self._all_entries_file_names()
-        password: str = get_password_from_keychain_with_fallback()
-        entries: str = ""
         for file_name in file_names:
             if file_name.endswith(".md"):
-                with open(join(self.journal_configuration.journal_path, file_name), "r") as file:
-                    post: frontmatter.Post = frontmatter.load(file)
-            else:
-                with open(join(self.journal_configuration.journal_path, file_name), "rb") as file:
-                    encrypted_entry: bytes = file.readline()
-                    decrypted: str = password_decrypt(encrypted_entry, password).decode()
-                    post: frontmatter.Post = frontmatter.loads(decrypted)
-            entries += f"{post.metadata['created']}: {post.content}\n\n"
+                verify_report.problems.append(f"{file_name} is decrypted, run --encrypt to encrypt it again")
+        lookups: Iterator[_CacheLookup] = (self._uncached_lookup(f) for f in file_names if not f.endswith(".md"))
+        files_by_body: Dict[Tuple[datetime, str], str] = {}
+        verified_entry: _VerifiedEntry
+        for verified_entry in self._map_entry_files(_verify_entry_file, lookups, "verify"):
+            verify_report.checked += 1
+            if verified_entry.problem is not None:
+                verify_report.problems.append(f"{verified_entry.file_name} {verified_entry.problem}")
+            if verified_entry.body_hash is None:
+                continue
+            body_key: Tuple[datetime, str] = (verified_entry.created, verified_entry.body_hash)
+            if body_key in files_by_body:
+                verify_report.problems.append(
+                    f"{files_by_body[body_key]} and {verified_entry.file_name} have the same date and text"
+                )
+            files_by_body[body_key] = verified_entry.file_name
+
+        if not verify_report.problems and head is not None:
+            atomic_write(local_state_path(journal_path, VERIFIED_COMMIT_FILE_NAME), head.encode())
+        return verify_report
+
+    def _segment_path(self, file_name: str) -> Optional[str]:
+        """ The segment holding a packed entry, relative to the journal. """
+        if not self._is_packed(file_name):
+            return None
+        return join(SEGMENTS_DIRECTORY, self._segment_store().locations[os.path.basename(file_name)][0])
+
+    def _head_commit(self) -> Optional[str]:
+        from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+
+        try:
+            repo: Repo = self._repo or Repo(self.journal_configuration.journal_path)
+        except (InvalidGitRepositoryError, NoSuchPathError):
+            return None
+        self._repo = repo
+        return repo.head.commit.hexsha if repo.head.is_valid() else None
+
+    def _changed_since_verified(self, head: Optional[str]) -> Optional[Set[str]]:
+        """ Paths changed, committed or not, since the last verified commit. None if everything needs checking. """
+        from git import GitCommandError
+
+        verified_commit_path: str = local_state_path(self.journal_configuration.journal_path,
+                                                     VERIFIED_COMMIT_FILE_NAME)
+        if head is None or not os.path.exists(verified_commit_path):
+            return None
+        with open(verified_commit_path, "r") as file:
+            verified_commit: str = file.read().strip()
+        try:
+            changed: Set[str] = set(self._repo.git.diff("--name-only", verified_commit, "--").splitlines())
+        except GitCommandError:
+            # The commit is gone, e.g. history was rewritten.
+            return None
+        return changed | set(self._repo.untracked_files)
+
+    @_holding_local_state_lock
+    def _get_manifest(self, rebuild: bool = False) -> Manifest:
+        """ Builds the manifest on first use, which decrypts every entry once. """
+        journal_path: str = self.journal_configuration.journal_path
+        manifest_path: str = local_state_path(journal_path, MANIFEST_FILE_NAME)
+        manifest_key: bytes = self._get_session().derive_subkey(b"manifest")
+        if not rebuild and os.path.exists(manifest_path):
+            if os.path.exists(local_state_path(journal_path, MANIFEST_LOG_FILE_NAME)):
+                return self._update_manifest(lambda manifest: None)
+            return Manifest.load(manifest_path, manifest_key)
+
+        # Statistics are computed from the manifest, a new one makes them stale, as it covers the logged records.
+        for file_name in (STATISTICS_FILE_NAME, MANIFEST_LOG_FILE_NAME):
+            if os.path.exists(local_state_path(journal_path, file_name)):
+                remove(local_state_path(journal_path, file_name))
+        manifest: Manifest = Manifest()
+        file_names: List[str] = [f for f in self._all_entry_names() if not f.endswith(".md")]
+        for file_name, entry in self._read_named_entries(file_names, prune=True):
+            manifest.put(file_name, ManifestRecord.from_entry(entry, self._entry_ciphertext(file_name)))
+        manifest.store(manifest_path, manifest_key)
+        return manifest
+
+    @_holding_local_state_lock
+    def _update_manifest(self, update: Callable[[Manifest], None]) -> Optional[Manifest]:
+        """
+        Applies the logged records of added entries, then `update`, to an existing manifest and stores it.
+        A missing one is built when first needed. Statistics follow the records changed, without reading any entry.
+        """
+        journal_path: str = self.journal_configuration.journal_path
+        manifest_path: str = local_state_path(journal_path, MANIFEST_FILE_NAME)
+        log_path: str = local_state_path(journal_path, MANIFEST_LOG_FILE_NAME)
+        statistics_path: str = local_state_path(journal_path, STATISTICS_FILE_NAME)
+        if not os.path.exists(manifest_path):
+            # They could not follow this change, they are recomputed with the manifest.
+            if os.path.exists(statistics_path):
+                remove(statistics_path)
+            return None
+        manifest_key: bytes = self._get_session().derive_subkey(b"manifest")
+        manifest: Manifest = Manifest.load(manifest_path, manifest_key)
+        for record in read_records(log_path, manifest_key):
+            manifest.put(record.pop("file_name"), ManifestRecord.from_dict(record))
+        update(manifest)
+        manifest.store(manifest_path, manifest_key)
+
+        if manifest.changes and os.path.exists(statistics_path):
+            statistics_key: bytes = self._get_session().derive_subkey(b"statistics")
+            statistics: Statistics = Statistics.load(statistics_path, statistics_key)
+            statistics.apply(manifest.changes)
+            statistics.store(statistics_path, statistics_key)
+        # Only once the statistics include them, a crash before leaves them to be applied again.
+        if os.path.exists(log_path):
+            remove(log_path)
+        return manifest
+
+    def _reconcile_manifest(self, paths: List[str]) -> None:
+        """ Updates the manifest for entries added, changed or deleted by a pull, decrypting only those. """
+        journal_path: str = self.journal_configuration.journal_path
+        entry_paths: List[str] = [p for p in paths if entry_created(p) is not None and not p.endswith(".md")]
+        segments_changed: bool = any(os.path.dirname(p) == SEGMENTS_DIRECTORY for p in paths)
+        if not entry_paths and not segments_changed:
+            return
 
-        return entries
+        def update(manifest: Manifest) -> None:
+            existing: List[str] = [p for p in entry_paths if os.path.exists(join(journal_path, p))]
+            removed: Set[str] = set(entry_paths) - set(existing)
+            if segments_changed:
+                # A segment holds many entries, the ones that changed are told apart by their hash.
+                packed: List[str] = self._packed_entry_names()
+                existing += [p for p in packed if p not in manifest.records or ciphertext_digest(
+                    self._entry_ciphertext(p)) != (manifest.records[p].content_hash, manifest.records[p].size)]
+                removed |= {r for r in manifest.records if self._is_packed(r)} - set(packed)
+            for file_name in removed:
+                manifest.remove(file_name)
+            for file_name, entry in self._read_named_entries(existing):
+                manifest.put(file_name, ManifestRecord.from_entry(entry, self._entry_ciphertext(file_name)))
 
-    def _all_entries_file_names(self) -> List[str]:
-        file_names: List[str] = [f for f in listdir(self.journal_configuration.journal_path) if
-                                 isfile(join(self.journal_configuration.journal_path, f))
-                                 and not f.startswith(".")]
-        return file_names
+        self._update_manifest(update)
 
-    def git_sync(self) -> None:
+    def select_entries(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        query: Optional[str] = None,
+        file_names: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        File names of the entries created from `since` to `until` and matching `query`, oldest first.
+        `file_names` picks entries explicitly, by their path or just the file name.
+        """
+        listed: List[str] = [f for f in self._all_entry_names(since, until) if not f.endswith(".md")]
+        selected: List[str] = [f for f in listed if _file_name_in_range(f, since, until)]
+        if file_names is not None:
+            selected = [f for f in selected if f in file_names or os.path.basename(f) in file_names]
+        if query:
+            matches: Set[str] = set(self._refresh_search_index().search(query))
+            selected = [f for f in selected if f in matches]
+        return selected
+
+    @contextmanager
+    def workspace(self, file_names: List[str]) -> Iterator[str]:
+        """
+        Decrypts the entries into a private temporary directory outside of the journal, in memory where possible,
+        and yields its path. On exit writes back only the entries edited there, then deletes the directory.
+        If some entries cannot be written back the directory is kept, with their edits, and
+        WorkspaceWriteBackError is raised once the others are written back.
+        """
+        memory_directory: Optional[str] = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        directory: str = tempfile.mkdtemp(prefix="giournal-", dir=memory_directory)
+        keep: bool = False
+        failures: Dict[str, str] = {}
         try:
+            plaintext_hashes: Dict[str, str] = {}
+            for file_name, entry in self._read_named_entries(file_names):
+                content: bytes = entry.to_frontmatter().encode()
+                with open(join(directory, f"{os.path.basename(file_name)}.md"), "wb") as file:
+                    file.write(content)
+                plaintext_hashes[file_name] = _plaintext_hash(content)
+            yield directory
+            # Until written back, the edits only exist in the workspace.
+            keep = True
+            failures = self._write_back(directory, plaintext_hashes)
+            keep = bool(failures)
+        finally:
+            if not keep:
+                shutil.rmtree(directory, ignore_errors=True)
+        if failures:
+            raise WorkspaceWriteBackError(
+                "Could not write back " + ", ".join(f"'{f}' ({e})" for f, e in failures.items())
+                + f", fix them in '{directory}', which was kept, and run the workspace again to write them back"
+            )
+
+    def _write_back(self, directory: str, plaintext_hashes: Dict[str, str]) -> Dict[str, str]:
+        """
+        Re-encrypts the entries whose workspace file changed, and records them for the next sync.
+        Each entry is written back on its own, returns why the ones that could not be failed, by file name.
+        """
+        updated: List[str] = []
+        failures: Dict[str, str] = {}
+        for file_name, plaintext_hash in plaintext_hashes.items():
             try:
-                repo: Repo = Repo(self.journal_configuration.journal_path)
-            except NoSuchPathError:
-                safe_make_dir(self.journal_configuration.journal_path)
-                repo: Repo = Repo(self.journal_configuration.journal_path)
-        except InvalidGitRepositoryError:
-            print("# Creating git repo")
-            repo: Repo = Repo.init(self.journal_configuration.journal_path)
-            if self.journal_configuration.sync_to_git:
-                repo.create_remote("origin", self.journal_configuration.git_remote)
-                repo.heads.master.set_tracking_branch(repo.remotes.origin.refs.master)
+                with open(join(directory, f"{os.path.basename(file_name)}.md"), "rb") as file:
+                    content: bytes = file.read()
+                if _plaintext_hash(content) == plaintext_hash:
+                    continue
+                entry: Entry = Entry.from_frontmatter(frontmatter.loads(content.decode()))
+            except Exception as e:
+                # Unreadable, deleted, or no longer valid front matter.
+                failures[file_name] = repr(e)
+                continue
+            entry.last_modified = datetime.now()
+            updated.append(self._write_entry(file_name, self._get_session().encrypt(entry.to_frontmatter().encode())))
+            self._index_entry(file_name, entry)
+        self._record_changes(updated)
+        return failures
+
+    def search(self, query: str, limit: Optional[int] = None) -> Iterator[Entry]:
+        """ Yields matching entries newest first. Only the entries displayed are decrypted. """
+        search_index: SearchIndex = self._refresh_search_index()
+        file_names: List[str] = list(reversed(search_index.search(query)))
+        yield from islice(self._read_entries(file_names), limit)
+
+    def rebuild_search_index(self) -> int:
+        """ Indexes every entry from scratch. Returns how many entries were indexed. """
+        return len(self._refresh_search_index(rebuild=True).documents)
+
+    @_holding_local_state_lock
+    def _refresh_search_index(self, rebuild: bool = False) -> SearchIndex:
+        """ Indexes entries added or changed since the index was stored, e.g. by a pull, and drops removed ones. """
+        journal_path: str = self.journal_configuration.journal_path
+        index_path: str = local_state_path(journal_path, SEARCH_INDEX_FILE_NAME)
+        index_key: bytes = self._get_session().derive_subkey(b"search-index")
+        log_path: str = local_state_path(journal_path, SEARCH_INDEX_LOG_FILE_NAME)
+        search_index: SearchIndex = SearchIndex() if rebuild else SearchIndex.load(index_path, index_key)
+        logged: List[Dict] = [] if rebuild else read_records(log_path, index_key)
+        for record in logged:
+            search_index.add(record["file_name"], tuple(record["signature"]), record["text"])
+
+        signatures: Dict[str, Signature] = {
+            f: self._entry_signature(f) for f in self._all_entry_names() if not f.endswith(".md")
+        }
+        to_index, to_remove = search_index.stale(signatures)
+        for file_name in to_remove:
+            search_index.remove(file_name)
+        for file_name, entry in self._read_named_entries(to_index):
+            search_index.add(file_name, signatures[file_name], entry.body)
+
+        if rebuild or logged or to_index or to_remove:
+            search_index.store(index_path, index_key)
+        if os.path.exists(log_path):
+            remove(log_path)
+        return search_index
+
+    def _read_entries(self, file_names: List[str], prune: bool = False) -> Iterator[Entry]:
+        for _, entry in self._read_named_entries(file_names, prune):
+            yield entry
+
+    def _read_named_entries(self, file_names: List[str], prune: bool = False) -> Iterator[Tuple[str, Entry]]:
+        """
+        File names and entries in the order of `file_names`, skipping the ones that failed to decrypt.
+        Entries are served from the local entry cache when the file has not changed.
+        `prune` drops cached entries missing from `file_names`, so only pass it with the full listing.
+        """
+        lookup: _CacheLookup
+        if self.journal_configuration.cache_max_entries <= 0:
+            lookups: Iterator[_CacheLookup] = (self._uncached_lookup(f) for f in file_names)
+            for lookup in self._map_entry_files(_read_cached_entry_file, lookups, "read"):
+                yield lookup.file_name, lookup.entry
+            return
+
+        from .entry_cache import EntryCache, default_cache_path
+
+        journal_path: str = self.journal_configuration.journal_path
+        cache_path: str = self.journal_configuration.cache_path or default_cache_path(journal_path)
+        cache_key: bytes = self._get_session().derive_subkey(b"entry-cache")
+        with EntryCache(cache_path, cache_key, self.journal_configuration.cache_max_entries) as cache:
+            if prune:
+                cache.prune(file_names)
+            lookups: Iterator[_CacheLookup] = (
+                self._uncached_lookup(f) if f.endswith(".md") or self._is_packed(f)
+                else _CacheLookup(f, cache.get(f, join(journal_path, f)))
+                for f in file_names
+            )
+            for lookup in self._map_entry_files(_read_cached_entry_file, lookups, "read"):
+                if lookup.miss and not lookup.file_name.endswith(".md"):
+                    cache.put(lookup.file_name, join(journal_path, lookup.file_name), lookup.entry)
+                yield lookup.file_name, lookup.entry
+
+    def _uncached_lookup(self, file_name: str) -> _CacheLookup:
+        """ Packed entries are read from the segment here, so workers never open segments themselves. """
+        if self._is_packed(file_name):
+            return _CacheLookup(file_name, None, token=self._entry_ciphertext(file_name))
+        return _CacheLookup(file_name, None)
+
+    def _map_entry_files(
+        self, function: Callable[[str, T, EncryptionSession], R], items: Iterable[T], action: str
+    ) -> Iterator[R]:
+        """
+        Runs `function` for every entry file on the configured worker pool, yielding results in file name order.
+        Failures are reported per file and skipped, so one corrupt entry does not abort the whole run.
+        """
+        session: EncryptionSession = self._get_session()
+        if self.journal_configuration.worker_mode == PROCESS:
+            # Derive every journal key before the session is pickled, or each task would derive them again.
+            session.derive_keys()
+        task: Callable[[T], R] = partial(function, self.journal_configuration.journal_path, session=session)
+        result: TaskResult
+        for result in ordered_map(task, items, self.journal_configuration.workers,
+                                  self.journal_configuration.worker_mode):
+            if result.error is not None:
+                print(f"Failed to {action} '{result.item}': {result.error!r}", file=sys.stderr)
+            else:
+                yield result.value
+
+    @timed("session")
+    def _get_session(self) -> EncryptionSession:
+        """ The journal key is derived once per session instead of once per entry. """
+        if self._session is None:
+            if os.path.exists(local_state_path(self.journal_configuration.journal_path, PASSWORD_CHANGE_FILE_NAME)):
+                raise PasswordChangeInProgressError(
+                    "A password change was interrupted, run --change-password again to finish it"
+                )
+            password: Optional[str] = (get_password_from_keychain_with_fallback() if self.interactive
+                                       else get_password_without_prompt())
+            if password is None:
+                raise PasswordUnavailableError("Neither the key agent nor the keyring holds the journal password")
+            journal_header: JournalHeader = get_journal_header(self.journal_configuration.journal_path,
+                                                               self.journal_configuration.kdf,
+                                                               self.journal_configuration.kdf_cost)
+            self._session = self._unlocked_session(password, journal_header.keys)
+        return self._session
+
+    def _unlocked_session(self, password: str, keys: List[KeyParameters]) -> EncryptionSession:
+        """ Asks for the password again, when interactive, if it does not derive the current key. """
+        session: EncryptionSession = EncryptionSession(password, keys, self.journal_configuration.compression,
+                                                       self.journal_configuration.compression_level)
+        try:
+            key_agent.share_current_key(session)
+        except WrongPasswordError:
+            if not self.interactive:
+                raise
+            # Changed on another machine, the new key came with the last pull.
+            session.password = replace_password("The journal password was changed, enter the new one: ")
+            key_agent.share_current_key(session)
+        return session
+
+    def add_key(self, algorithm: str, cost: int) -> KeyParameters:
+        """
+        Makes a new journal key with the given key derivation cost the current one, so new and edited entries use
+        it straight away. Entries under older keys keep decrypting until `upgrade` rewrites them.
+        """
+        parameters: KeyParameters = KeyParameters.generate(cost, algorithm)
+        self._get_session().add_key(parameters)
+        append_key(self.journal_configuration.journal_path, parameters)
+        self._forget_key_bound_state()
+        self._record_changes([HEADER_FILE_NAME])
+        return parameters
+
+    def change_password(self, old_password: str, new_password: str) -> Tuple[int, int]:
+        """
+        Re-encrypts every entry with a new journal key derived from `new_password`, on the worker pool, replacing
+        each file atomically. The new key goes to a checkpoint file, then to the header, and entries already under
+        it are skipped, so running this again with the same passwords resumes an interrupted change.
+        The keychain and key agent get the new password only once no entry needs the old one.
+        Returns how many entries were rewritten and how many are still under the old password.
+        """
+        journal_path: str = self.journal_configuration.journal_path
+        checkpoint_path: str = local_state_path(journal_path, PASSWORD_CHANGE_FILE_NAME)
+        keys: List[KeyParameters] = get_journal_header(journal_path, self.journal_configuration.kdf,
+                                                       self.journal_configuration.kdf_cost).keys
+        new_key: KeyParameters
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r") as file:
+                new_key = KeyParameters.from_dict(json.load(file))
+        else:
+            new_key = KeyParameters.generate(keys[-1].iterations, keys[-1].algorithm)
+        session: EncryptionSession = EncryptionSession(
+            old_password, [k for k in keys if k.key_id != new_key.key_id], self.journal_configuration.compression,
+            self.journal_configuration.compression_level,
+        )
+        self._check_password(session)
+        session.add_key(new_key, new_password)
+        # Entries other machines write under the old keys until they pull the change stay readable.
+        session.wrap_older_keys()
+        if not os.path.exists(checkpoint_path):
+            atomic_write(checkpoint_path, json.dumps(new_key.to_dict()).encode())
+        update_keys(journal_path, session.keys)
+        self._record_changes([HEADER_FILE_NAME])
+        self._forget_key_bound_state()
+        self._session = session
+
+        rewritten: int = self.upgrade()
+        remaining: int = sum(1 for f in self._all_entry_names()
+                             if not f.endswith(".md") and not session.is_current(self._entry_ciphertext(f)))
+        if not remaining:
+            set_password_in_keychain(new_password)
+            key_agent.set_password(new_password)
+            key_agent.share_current_key(session)
+            remove(checkpoint_path)
+        return rewritten, remaining
+
+    def _check_password(self, session: EncryptionSession) -> None:
+        """
+        Checks the old password against the current key, or else decrypts one entry under the older keys, or else
+        compares it with the stored password, so a mistyped password is caught before anything is written.
+        """
+        if session.current_key.check is not None:
+            session.master_key(session.current_key)
+            return
+        for file_name in self._all_entry_names():
+            if file_name.endswith(".md"):
+                continue
+            try:
+                session.decrypt(self._entry_ciphertext(file_name))
+            except UnknownKeyError:
+                # Already under the new key.
+                continue
+            except (InvalidTag, InvalidToken):
+                raise WrongPasswordError("The old password does not decrypt the entries")
+            return
+        stored_password: Optional[str] = get_password_without_prompt()
+        if stored_password is not None and stored_password != session.password:
+            raise WrongPasswordError("The old password is not the stored journal password")
 
+    def _forget_key_bound_state(self) -> None:
+        """ Local state encrypted with a key derived from the previous journal key is rebuilt when next needed. """
+        for file_name in (MANIFEST_FILE_NAME, MANIFEST_LOG_FILE_NAME, SEARCH_INDEX_FILE_NAME,
+                          SEARCH_INDEX_LOG_FILE_NAME, STATISTICS_FILE_NAME):
+            path: str = local_state_path(self.journal_configuration.journal_path, file_name)
+            if os.path.exists(path):
+                remove(path)
+
+    def unlock(self) -> None:
+        """ Derives the journal key now, which hands it and the password to the key agent if one is running. """
+        self._get_session()
+
+    def _all_entries_file_names(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[str]:
+        """ Paths relative to the journal, in either layout, sorted so in chronological order. """
+        return list_entry_paths(self.journal_configuration.journal_path, since, until)
+
+    def _all_entry_names(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[str]:
+        """
+        Entry files and packed entries, named after their segments directory, in chronological order.
+        An entry file supersedes the packed entry with the same name.
+        """
+        file_names: List[str] = self._all_entries_file_names(since, until)
+        packed: List[str] = self._packed_entry_names()
+        if not packed:
+            return file_names
+        loose: Set[str] = {os.path.basename(f) for f in file_names}
+        return sorted(file_names + [p for p in packed if os.path.basename(p) not in loose], key=os.path.basename)
+
+    def _segment_store(self) -> SegmentStore:
+        """ Brought up to date on every call, segments may have been appended to or compacted by a pull. """
+        if self._segments is None:
+            self._segments = SegmentStore(self.journal_configuration.journal_path)
+        else:
+            self._segments.refresh()
+        return self._segments
+
+    def _packed_entry_names(self) -> List[str]:
+        return [join(SEGMENTS_DIRECTORY, n) for n in self._segment_store().names()]
+
+    def _warn_packed(self, action: str) -> None:
+        packed: int = len(self._packed_entry_names())
+        if packed:
+            print(f"Skipped {packed} packed entries, run --unpack first to {action} them.", file=sys.stderr)
+
+    @staticmethod
+    def _is_packed(file_name: str) -> bool:
+        return os.path.dirname(file_name) == SEGMENTS_DIRECTORY
+
+    def _entry_ciphertext(self, file_name: str) -> bytes:
+        if self._is_packed(file_name):
+            return bytes(self._segment_store().read(os.path.basename(file_name)))
+        with open(join(self.journal_configuration.journal_path, file_name), "rb") as file:
+            return file.read()
+
+    def _entry_signature(self, file_name: str) -> Signature:
+        if self._is_packed(file_name):
+            return self._segment_store().signature(os.path.basename(file_name))
+        return file_signature(join(self.journal_configuration.journal_path, file_name))
+
+    def _write_entry(self, file_name: str, token: bytes) -> str:
+        """ Writes over an entry, or appends a new record for a packed one. Returns the path changed. """
+        if self._is_packed(file_name):
+            return self._segment_store().append([(os.path.basename(file_name), token)])[0]
+        atomic_write(join(self.journal_configuration.journal_path, file_name), token)
+        return file_name
+
+    @timed("git_sync")
+    def git_sync(self, paths: Optional[List[str]] = None) -> SyncReport:
+        """
+        Stages `paths`, relative to the journal, commits and pushes, pulling first only if the remote moved.
+        `None`, or the FULL_SCAN path, stages every visible file in the journal instead.
+        """
+        # GitPython is slow to import, and only needed here.
+        with Phase("git_sync.import"):
+            from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+
+        if self._repo is None:
+            try:
+                try:
+                    self._repo = Repo(self.journal_configuration.journal_path)
+                except NoSuchPathError:
+                    safe_make_dir(self.journal_configuration.journal_path)
+                    self._repo = Repo(self.journal_configuration.journal_path)
+            except InvalidGitRepositoryError:
+                print("# Creating git repo")
+                self._repo = Repo.init(self.journal_configuration.journal_path)
+                if self.journal_configuration.sync_to_git:
+                    self._repo.create_remote("origin", self.journal_configuration.git_remote)
+        repo: Repo = self._repo
+
+        sync_report: SyncReport = SyncReport()
+        remote_sha: str = ""
         if self.journal_configuration.sync_to_git:
             if not repo.remotes:
                 repo.create_remote("origin", self.journal_configuration.git_remote)
-            repo.remotes.origin.pull("master")
+            with Phase("git_sync.ls_remote"):
+                remote_sha = self._remote_master_sha(repo)
+            if remote_sha and not self._is_merged(repo, remote_sha):
+                adopted: List[str] = self._adopt_remote_header(repo, remote_sha)
+                if paths is not None and adopted:
+                    paths = paths + adopted
+                with Phase("git_sync.pull"):
+                    self._pull(repo, sync_report)
+                if HEADER_FILE_NAME in sync_report.pulled_paths:
+                    # Another machine added a journal key.
+                    self._session = None
+                    self._forget_key_bound_state()
+                self._reconcile_manifest(sync_report.pulled_paths)
+                rewritten: List[str] = self._upgrade_pulled(sync_report.pulled_paths)
+                if paths is not None and rewritten:
+                    paths = paths + rewritten
+
+        with Phase("git_sync.stage"):
+            if paths is None or sync_queue.FULL_SCAN in paths:
+                repo.index.add("*")
+            else:
+                self._stage(repo, paths)
+            # Dot files are skipped by the glob above, but the header is needed to decrypt on other machines.
+            if os.path.exists(join(self.journal_configuration.journal_path, HEADER_FILE_NAME)):
+                repo.index.add([HEADER_FILE_NAME])
+
+        with Phase("git_sync.commit"):
+            staged: List[str] = [d.a_path for d in repo.index.diff("HEAD")] if repo.head.is_valid() \
+                else [p for p, _ in repo.index.entries]
+            if staged:
+                repo.index.commit("update")
+                sync_report.committed_paths = staged
 
-        repo.index.add("*")
-        if repo.is_dirty():
-            repo.index.commit("update")
-            if self.journal_configuration.sync_to_git:
+        if self.journal_configuration.sync_to_git and repo.head.is_valid() and remote_sha != repo.head.commit.hexsha:
+            with Phase("git_sync.push"):
+                sync_report.pushed_commits = len(list(repo.iter_commits(
+                    f"{remote_sha}..HEAD" if remote_sha else "HEAD")))
                 repo.remotes.origin.push("master")
+        return sync_report
+
+    def _adopt_remote_header(self, repo: "Repo", remote_sha: str) -> List[str]:
+        """
+        A clone that wrote entries before its first pull made a header of its own, which would conflict with the
+        remote one. It takes the remote header instead, re-encrypting those entries with its key.
+        Returns the paths changed.
+        """
+        from git import GitCommandError
+
+        journal_path: str = self.journal_configuration.journal_path
+        if not os.path.exists(join(journal_path, HEADER_FILE_NAME)) or (
+                repo.head.is_valid() and HEADER_FILE_NAME in repo.head.commit.tree):
+            return []
+        repo.remotes.origin.fetch("master")
+        try:
+            remote_header: JournalHeader = JournalHeader.loads(repo.git.show(f"{remote_sha}:{HEADER_FILE_NAME}"))
+        except GitCommandError:
+            # The remote has no header yet, this one is pushed with the entries.
+            return []
+
+        local_session: EncryptionSession = self._get_session()
+        # Before anything is rewritten, so a password that does not derive the remote key changes nothing.
+        session: EncryptionSession = self._unlocked_session(local_session.password, remote_header.keys)
+        tokens: Dict[str, bytes] = {n: self._entry_ciphertext(n) for n in self._all_entry_names()
+                                    if not n.endswith(".md")}
+        # Staged as well, which the pull accepts as the header is already what it brings.
+        repo.git.checkout(remote_sha, "--", HEADER_FILE_NAME)
+        self._forget_key_bound_state()
+        self._session = session
+        return list(dict.fromkeys(self._write_entry(n, session.encrypt(local_session.decrypt(t)))
+                                  for n, t in tokens.items()))
+
+    def _upgrade_pulled(self, paths: List[str]) -> List[str]:
+        """
+        Re-encrypts pulled entries under a key replaced by a password change, written by machines that had not pulled
+        the change yet, so the old key is not needed for long. Returns the paths changed.
+        """
+        journal_path: str = self.journal_configuration.journal_path
+        entry_paths: List[str] = [p for p in paths if entry_created(p) is not None and not p.endswith(".md")
+                                  and not self._is_packed(p) and os.path.exists(join(journal_path, p))]
+        if not entry_paths and not any(self._is_packed(p) for p in paths):
+            return []
+        replaced: Set[bytes] = {k.key_id for k in self._get_session().keys if k.wrapped is not None}
+        if not replaced:
+            return []
+        file_names: List[str] = [p for p in entry_paths if token_key_id(self._entry_ciphertext(p)) in replaced]
+        upgraded: List[str] = [f for f in self._map_entry_files(_upgrade_entry_file, file_names, "upgrade") if f]
+        changed_paths: List[str] = list(upgraded)
+
+        if any(self._is_packed(p) for p in paths):
+            packed_entries: List[Tuple[str, bytes]] = [
+                (n, t) for n, t in ((n, self._entry_ciphertext(n)) for n in self._packed_entry_names())
+                if token_key_id(t) in replaced
+            ]
+            rewritten: List[Tuple[str, bytes]] = [
+                r for r in self._map_entry_files(_upgrade_packed_entry, packed_entries, "upgrade") if r
+            ]
+            if rewritten:
+                changed_paths.extend(self._segment_store().append((os.path.basename(n), t) for n, t in rewritten))
+                upgraded.extend(n for n, _ in rewritten)
+
+        def update(manifest: Manifest) -> None:
+            for file_name in upgraded:
+                manifest.refresh_digest(file_name, self._entry_ciphertext(file_name))
+
+        if upgraded:
+            self._update_manifest(update)
+        return changed_paths
+
+    def _stage(self, repo: "Repo", paths: List[str]) -> None:
+        """ Adds the paths that exist and removes from the index the ones that were deleted. """
+        existing: List[str] = [p for p in paths if os.path.exists(join(self.journal_configuration.journal_path, p))]
+        deleted: List[str] = [p for p in paths if p not in existing and (p, 0) in repo.index.entries]
+        if existing:
+            repo.index.add(existing)
+        if deleted:
+            repo.index.remove(deleted)
+
+    @staticmethod
+    def _remote_master_sha(repo: "Repo") -> str:
+        """ A single round trip that transfers no objects. Empty if the remote has no master yet. """
+        remote_refs: str = repo.git.ls_remote("origin", "refs/heads/master")
+        return remote_refs.split()[0] if remote_refs else ""
+
+    @staticmethod
+    def _is_merged(repo: "Repo", sha: str) -> bool:
+        """ Whether the commit is already part of HEAD, in which case pulling would transfer nothing. """
+        from git import GitCommandError
+
+        if not repo.head.is_valid():
+            return False
+        try:
+            return repo.is_ancestor(sha, repo.head.commit)
+        except GitCommandError:
+            # Not a commit we have: the remote moved since the last pull.
+            return False
+
+    @staticmethod
+    def _pull(repo: "Repo", sync_report: SyncReport) -> None:
+        previous_sha: Optional[str] = repo.head.commit.hexsha if repo.head.is_valid() else None
+        repo.remotes.origin.pull("master")
+        if previous_sha is None:
+            sync_report.pulled_commits = len(list(repo.iter_commits("HEAD")))
+            sync_report.pulled_paths = [p for p, _ in repo.index.entries]
+        else:
+            sync_report.pulled_commits = len(list(repo.iter_commits(f"{previous_sha}..HEAD")))
+            sync_report.pulled_paths = repo.git.diff("--name-only", previous_sha, "HEAD").splitlines()
 
     def add_entry(self, entry_body: str) -> None:
-        created: datetime = datetime.now()
-        entry: Entry = Entry(body=entry_body, created=created, last_modified=created)
+        created: datetime = self._unused_creation_time(datetime.now())
 
-        formatted_entry: str = entry.to_frontmatter()
+        def token_for(entry_created: datetime) -> bytes:
+            formatted_entry: str = Entry(body=entry_body, created=entry_created,
+                                         last_modified=entry_created).to_frontmatter()
+            return self._get_session().encrypt(formatted_entry.encode())
 
-        password: str = get_password_from_keychain_with_fallback()
-        encrypted_formatted_entry: bytes = password_encrypt(
-            formatted_entry.encode(), password
-        )
-        filename = created.strftime(FILENAME_DATETIME_FORMAT)
+        if self.journal_configuration.storage == SEGMENTS:
+            filename = join(SEGMENTS_DIRECTORY, created.strftime(FILENAME_DATETIME_FORMAT))
+            changed_path: str = self._write_entry(filename, token_for(created))
+        else:
+            filename, _, created = _create_entry_file(
+                self.journal_configuration.journal_path, created,
+                partial(entry_path, layout=self.journal_configuration.layout), token_for,
+            )
+            changed_path: str = filename
+
+        self._index_entry(filename, Entry(body=entry_body, created=created, last_modified=created))
+        self.request_sync([changed_path])
+
+    def import_entries(self, entries: Iterable[Entry]) -> ImportReport:
+        """
+        Adds entries with their original dates, encrypting them on the worker pool, then syncs once.
+        An entry whose file name is taken by one with the same body is skipped, so imports can be run again,
+        otherwise it is moved to the next free second.
+        """
+        start: float = time.perf_counter()
+        import_report: ImportReport = ImportReport()
+        names: Dict[str, str] = {os.path.basename(f): f for f in self._all_entry_names()}
+        # Hashes of the bodies of the entries imported so far, to tell duplicates apart without decrypting them.
+        imported_bodies: Dict[str, str] = {}
+
+        def unique_names() -> Iterator[Tuple[str, Entry]]:
+            for entry in entries:
+                created: datetime = entry.created.replace(microsecond=0)
+                body_hash: str = _plaintext_hash(entry.body.encode())
+                name: str = created.strftime(FILENAME_DATETIME_FORMAT)
+                duplicate: bool = False
+                while name in names:
+                    if imported_bodies.get(name, None) == body_hash or (
+                            name not in imported_bodies and self._body_hash(names[name]) == body_hash):
+                        duplicate = True
+                        break
+                    created += timedelta(seconds=1)
+                    name = created.strftime(FILENAME_DATETIME_FORMAT)
+                if duplicate:
+                    import_report.duplicates += 1
+                    continue
+                if created != entry.created.replace(microsecond=0):
+                    import_report.moved += 1
+                entry = Entry(body=entry.body, created=created, last_modified=max(entry.last_modified, created))
+                file_name: str = join(SEGMENTS_DIRECTORY, name) if self.journal_configuration.storage == SEGMENTS \
+                    else entry_path(created, self.journal_configuration.layout)
+                names[name] = file_name
+                imported_bodies[name] = body_hash
+                yield file_name, entry
+
+        changed_paths: List[str] = []
+        records: Dict[str, ManifestRecord] = {}
+        packed: List[Tuple[str, bytes]] = []
+        try:
+            for file_name, record, token in self._map_entry_files(_import_entry, unique_names(), "import"):
+                records[file_name] = record
+                if token is None:
+                    changed_paths.append(file_name)
+                else:
+                    packed.append((os.path.basename(file_name), token))
+                    if len(packed) >= IMPORT_BATCH_SIZE:
+                        changed_paths.extend(self._segment_store().append(packed))
+                        packed = []
+        finally:
+            # Entries written before an unreadable one still get into the manifest and the next sync, importing
+            # again once the source is fixed skips them as duplicates.
+            if packed:
+                changed_paths.extend(self._segment_store().append(packed))
+            import_report.imported = len(records)
+            self._update_manifest(lambda manifest: manifest.put_all(records))
+            # The search index picks the new entries up on the next search.
+            if changed_paths:
+                self.request_sync(list(dict.fromkeys(changed_paths)))
+        import_report.seconds = time.perf_counter() - start
+        return import_report
+
+    def _body_hash(self, file_name: str) -> Optional[str]:
+        for entry in self._read_entries([file_name]):
+            return _plaintext_hash(entry.body.encode())
+        return None
+
+    def _unused_creation_time(self, created: datetime) -> datetime:
+        """ File names only have seconds, so entries added within the same second are spread a second apart. """
+        names: Set[str] = {os.path.basename(f) for f in self._all_entry_names(created, created + timedelta(days=1))}
+        while created.strftime(FILENAME_DATETIME_FORMAT) in names:
+            created += timedelta(seconds=1)
+        return created
+
+    def request_sync(self, paths: List[str], wait: bool = False) -> List[SyncReport]:
+        """
+        Records `paths`, relative to the journal, as changed and syncs them straight away.
+        With background sync on, and unless `wait`, leaves the sync to a detached worker and returns no reports.
+        """
+        sync_queue.enqueue(self.journal_configuration.journal_path, paths)
+        if self.journal_configuration.background_sync and sync_queue.is_supported() and not wait:
+            sync_queue.spawn_worker(self.journal_configuration)
+            return []
+        return self.flush_sync()
+
+    def _record_changes(self, paths: List[str]) -> None:
+        """ Queues `paths` to be staged by the next sync, without syncing now. """
+        if paths:
+            sync_queue.enqueue(self.journal_configuration.journal_path, paths)
+
+    def flush_sync(self) -> List[SyncReport]:
+        """ Syncs every path recorded as changed, waiting for any background worker to finish first. """
+        return sync_queue.drain(self, wait=True)
 
-        with open(os.path.join(self.journal_configuration.journal_path, filename), "ab") as file:
-            file.write(encrypted_formatted_entry)
+    @_holding_local_state_lock
+    def _index_entry(self, file_name: str, entry: Entry) -> None:
+        """
+        Logs an added or edited entry for an existing manifest and search index, in constant time, instead of
+        storing them and the statistics whole on every add. Missing ones are built when first needed.
+        """
+        journal_path: str = self.journal_configuration.journal_path
+        if os.path.exists(local_state_path(journal_path, MANIFEST_FILE_NAME)):
+            record: ManifestRecord = ManifestRecord.from_entry(entry, self._entry_ciphertext(file_name))
+            append_record(local_state_path(journal_path, MANIFEST_LOG_FILE_NAME),
+                          self._get_session().derive_subkey(b"manifest"), {"file_name": file_name, **record.to_dict()})
+        elif os.path.exists(local_state_path(journal_path, STATISTICS_FILE_NAME)):
+            # Built again with the manifest.
+            remove(local_state_path(journal_path, STATISTICS_FILE_NAME))
 
-        self.git_sync()
+        if os.path.exists(local_state_path(journal_path, SEARCH_INDEX_FILE_NAME)):
+            append_record(local_state_path(journal_path, SEARCH_INDEX_LOG_FILE_NAME),
+                          self._get_session().derive_subkey(b"search-index"),
+                          {"file_name": file_name, "signature": self._entry_signature(file_name), "text": entry.body})
 
 
 def initialise_journal(journal_path: str) -> None:
@@ -3,8 +3,9 @@ from __future__ import annotations
 import dataclasses
 import json
 import os
-import subprocess
+import shutil
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
@@ -18,6 +19,18 @@ class JournalConfiguration:
     git_remote: str
     use_keychain: bool
     editor_path: str
+    workers: int = 1
+    worker_mode: str = "thread"
+    cache_path: Optional[str] = None
+    cache_max_entries: int = 100_000
+    background_sync: bool = False
+    layout: str = "flat"
+    storage: str = "files"
+    compression: str = "zlib"
+    compression_level: Optional[int] = None
+    # Used for new journal keys, set by --calibrate. No cost means the default of the algorithm.
+    kdf: str = "pbkdf2"
+    kdf_cost: Optional[int] = None
 
     @classmethod
     def load(cls, path: str) -> JournalConfiguration:
@@ -28,6 +41,17 @@ class JournalConfiguration:
                        loaded_dictionary["git_remote"],
                        loaded_dictionary["use_keychain"],
                        loaded_dictionary["editor_path"],
+                       loaded_dictionary.get("workers", 1),
+                       loaded_dictionary.get("worker_mode", "thread"),
+                       loaded_dictionary.get("cache_path"),
+                       loaded_dictionary.get("cache_max_entries", 100_000),
+                       loaded_dictionary.get("background_sync", False),
+                       loaded_dictionary.get("layout", "flat"),
+                       loaded_dictionary.get("storage", "files"),
+                       loaded_dictionary.get("compression", "zlib"),
+                       loaded_dictionary.get("compression_level"),
+                       loaded_dictionary.get("kdf", "pbkdf2"),
+                       loaded_dictionary.get("kdf_cost"),
                        )
 
     def store(self, path: str) -> None:
@@ -44,20 +68,25 @@ def get_journal_configuration(path: str) -> JournalConfiguration:
 
 def get_executable_path(executable: str) -> str:
     """ Returns empty string if not found. """
-    return subprocess.getoutput(f"which {executable}")
+    return shutil.which(executable) or ""
 
 
-EDITORS: Dict[str, str] = {
-    "Vi": get_executable_path("vi"),
-    "Vim": get_executable_path("vim"),
-    "Visual Studio Code": f"{get_executable_path('code')} --wait",
-}
+@lru_cache(maxsize=None)
+def get_editors() -> Dict[str, str]:
+    """ Looked up on first use rather than at import, only the first run needs them. """
+    code_path: str = get_executable_path("code")
+    return {
+        "Vi": get_executable_path("vi"),
+        "Vim": get_executable_path("vim"),
+        "Visual Studio Code": f"{code_path} --wait" if code_path else "",
+    }
 
 
 def editor_prompt() -> str:
     print()
     print("Please pick an editor:")
-    available_editors: List[str] = list([k for k in EDITORS if EDITORS[k]])
+    editors: Dict[str, str] = get_editors()
+    available_editors: List[str] = list([k for k in editors if editors[k]])
     for i, editor_name in enumerate(available_editors):
         print(f"[{i + 1}] {editor_name}")
     print(f"[{len(available_editors) + 1}] type your own")
@@ -70,7 +99,7 @@ def editor_prompt() -> str:
     if choice == len(available_editors) + 1:
         return input("Path to your own editor: ")
     else:
-        return EDITORS[available_editors[choice - 1]]
+        return editors[available_editors[choice - 1]]
 
 
 def initialise_journal_config(config_path) -> JournalConfiguration:
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+from helpers.encryption import DEFAULT_COSTS, PBKDF2, KeyParameters
+from helpers.filesystem import atomic_create, atomic_write
+from .local_state import local_state_lock
+
+HEADER_FILE_NAME = ".giournal_header"
+HEADER_VERSION = 2
+
+
+@dataclass
+class JournalHeader:
+    """ Journal wide, non secret, encryption parameters. Committed alongside the entries. """
+    keys: List[KeyParameters]
+    version: int = HEADER_VERSION
+
+    @classmethod
+    def load(cls, path: str) -> JournalHeader:
+        with open(path, "r") as file:
+            return cls.loads(file.read())
+
+    @classmethod
+    def loads(cls, content: str) -> JournalHeader:
+        loaded_dictionary: Dict[str, Any] = json.loads(content)
+        return cls([KeyParameters.from_dict(k) for k in loaded_dictionary["keys"]],
+                   loaded_dictionary["version"],
+                   )
+
+    def dumps(self) -> str:
+        return json.dumps({"version": self.version, "keys": [k.to_dict() for k in self.keys]})
+
+    def store(self, path: str) -> None:
+        """ Atomically: it holds the only copy of the salts, a partly written header would lose every entry. """
+        atomic_write(path, self.dumps().encode())
+
+
+def get_journal_header(journal_path: str, algorithm: str = PBKDF2, cost: Optional[int] = None) -> JournalHeader:
+    """ A new journal gets a first key with the given algorithm and cost. """
+    path: str = os.path.join(journal_path, HEADER_FILE_NAME)
+    if not os.path.exists(path):
+        # Only ever created once, by whichever process gets there first, e.g. a foreground add or a sync worker.
+        with local_state_lock(journal_path):
+            atomic_create(path, JournalHeader([KeyParameters.generate(cost or DEFAULT_COSTS[algorithm],
+                                                                      algorithm)]).dumps().encode())
+    return JournalHeader.load(path)
+
+
+def append_key(journal_path: str, parameters: KeyParameters) -> None:
+    """ The new key becomes the current one. Older keys are kept to decrypt older entries. """
+    with local_state_lock(journal_path):
+        journal_header: JournalHeader = get_journal_header(journal_path)
+        if parameters.key_id not in [k.key_id for k in journal_header.keys]:
+            journal_header.keys.append(parameters)
+            journal_header.store(os.path.join(journal_path, HEADER_FILE_NAME))
+
+
+def update_keys(journal_path: str, keys: List[KeyParameters]) -> None:
+    """ Stores `keys` over the ones with the same id, e.g. once wrapped, and appends the new ones in order. """
+    with local_state_lock(journal_path):
+        journal_header: JournalHeader = get_journal_header(journal_path)
+        updated: Dict[bytes, KeyParameters] = {k.key_id: k for k in keys}
+        journal_header.keys = [updated.pop(k.key_id, k) for k in journal_header.keys] + \
+            [k for k in keys if k.key_id in updated]
+        journal_header.store(os.path.join(journal_path, HEADER_FILE_NAME))
@@ -0,0 +1,28 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from helpers.encryption import KeyParameters
+from .journal_header import HEADER_FILE_NAME, JournalHeader, append_key, get_journal_header
+
+
+class JournalHeaderTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_first_header_is_never_replaced_by_a_concurrent_one(self) -> None:
+        first: JournalHeader = get_journal_header(self.directory.name)
+        # Another process saw no header either, and creates its own after this one.
+        exists = os.path.exists
+        with patch("giournal.journal_header.os.path.exists",
+                   side_effect=lambda path: not path.endswith(HEADER_FILE_NAME) and exists(path)):
+            self.assertEqual(get_journal_header(self.directory.name), first)
+
+    def test_failed_update_leaves_the_header_whole(self) -> None:
+        first: JournalHeader = get_journal_header(self.directory.name)
+        with patch("helpers.filesystem.os.replace", side_effect=OSError("crashed")):
+            with self.assertRaises(OSError):
+                append_key(self.directory.name, KeyParameters.generate(1_000))
+        self.assertEqual(JournalHeader.load(os.path.join(self.directory.name, HEADER_FILE_NAME)), first)
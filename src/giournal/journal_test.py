@@ -0,0 +1,442 @@
+import os
+import shutil
+import unittest
+from contextlib import redirect_stderr
+from datetime import datetime
+from io import StringIO
+from typing import Iterator, List
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from helpers import key_agent
+from helpers.encryption import PBKDF2, EncryptionSession, WrongPasswordError, password_encrypt
+from helpers.parallel import PROCESS
+from .entry import Entry
+from .importers import ImportFormatError
+from .journal import FILENAME_DATETIME_FORMAT, Journal, PasswordChangeInProgressError, WorkspaceWriteBackError
+from .journal_configuration import JournalConfiguration
+from .journal_header import get_journal_header
+from .layout import FLAT, SHARDED
+from .manifest import Manifest
+from .search_index import SearchIndex
+from .segments import SEGMENTS
+from .statistics import Statistics
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory: TemporaryDirectory = TemporaryDirectory()
+        self.journal_path: str = self.directory.name
+        self.journal: Journal = Journal(JournalConfiguration(
+            journal_path=self.journal_path,
+            sync_to_git=False,
+            git_remote=None,
+            use_keychain=False,
+            editor_path="",
+            cache_path=os.path.join(self.journal_path, ".cache.sqlite"),
+        ))
+        password_patch = patch("giournal.journal.get_password_from_keychain_with_fallback", return_value="password")
+        password_patch.start()
+        self.addCleanup(password_patch.stop)
+        # Never the agent of whoever runs the tests, which holds the password of their own journal.
+        agent_patch = patch.dict(os.environ, {
+            key_agent.SOCKET_ENVIRONMENT_VARIABLE: os.path.join(self.journal_path, "no-agent.sock"),
+        })
+        agent_patch.start()
+        self.addCleanup(agent_patch.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_add_and_list_entry(self) -> None:
+        self.journal.add_entry("hello journal")
+        self.assertIn("hello journal", "".join(self.journal.list_entries()))
+
+    def test_entries_added_within_a_second_are_kept_apart(self) -> None:
+        with patch("giournal.journal.datetime", wraps=datetime) as datetime_mock:
+            datetime_mock.now.return_value = datetime(2020, 1, 1, 12)
+            self.journal.add_entry("first")
+            self.journal.add_entry("second")
+        self.assertEqual([e.body for e in self.journal.iter_entries()], ["first", "second"])
+
+    def test_upgrade_rewrites_v1_entries(self) -> None:
+        entry: Entry = Entry(body="old entry", created=datetime(2020, 1, 1), last_modified=datetime(2020, 1, 1))
+        with open(os.path.join(self.journal_path, "2020_01_01-00_00_00"), "wb") as file:
+            file.write(password_encrypt(entry.to_frontmatter().encode(), "password", 1_000))
+
+        self.assertEqual(self.journal.upgrade(), 1)
+        self.assertEqual(self.journal.upgrade(), 0)
+        self.assertIn("old entry", "".join(self.journal.list_entries()))
+
+    def test_entries_under_an_older_key_decrypt_until_upgraded(self) -> None:
+        self.journal.add_entry("before")
+        self.assertEqual(self.journal.count(), 1)
+        self.assertEqual(len(list(self.journal.search("before"))), 1)
+        self.journal.add_key(PBKDF2, 1_000)
+        self.journal.add_entry("after")
+
+        self.assertEqual([e.body for e in self.journal.iter_entries()], ["before", "after"])
+        self.assertEqual(self.journal.count(), 2)
+        self.assertEqual(self.journal.upgrade(), 1)
+        self.assertEqual([e.body for e in self.journal.search("before")], ["before"])
+
+    @patch("giournal.journal.set_password_in_keychain")
+    def test_interrupted_password_change_resumes(self, set_password_mock: MagicMock) -> None:
+        for body in ("first", "second", "third"):
+            self.journal.add_entry(body)
+        self.journal.pack()
+        self.journal.add_entry("fourth")
+        with self.assertRaises(WrongPasswordError):
+            self.journal.change_password("wrong", "new password")
+
+        with patch("giournal.journal._upgrade_entry_file", side_effect=OSError("interrupted")), \
+                redirect_stderr(StringIO()):
+            self.assertEqual(self.journal.change_password("password", "new password"), (3, 1))
+        set_password_mock.assert_not_called()
+        with self.assertRaises(PasswordChangeInProgressError):
+            Journal(self.journal.journal_configuration).count()
+
+        self.assertEqual(self.journal.change_password("password", "new password"), (1, 0))
+        set_password_mock.assert_called_once_with("new password")
+        with patch("giournal.journal.get_password_from_keychain_with_fallback", return_value="new password"):
+            journal: Journal = Journal(self.journal.journal_configuration)
+            self.assertEqual([e.body for e in journal.iter_entries()], ["first", "second", "third", "fourth"])
+
+    @patch("giournal.journal.set_password_in_keychain")
+    @patch("giournal.journal.get_password_without_prompt", return_value="password")
+    def test_password_change_keeps_entries_written_under_the_old_key_readable(self, *_: MagicMock) -> None:
+        with self.assertRaises(WrongPasswordError):
+            self.journal.change_password("wrong", "new password")
+        self.assertEqual(self.journal.change_password("password", "new password"), (0, 0))
+
+        # Written by a machine that has not pulled the change yet.
+        old_session: EncryptionSession = EncryptionSession("password", [get_journal_header(self.journal_path).keys[0]])
+        old_session.keys[0].wrapped = None
+        entry: Entry = Entry(body="offline", created=datetime(2020, 1, 1), last_modified=datetime(2020, 1, 1))
+        with open(os.path.join(self.journal_path, "2020_01_01-00_00_00"), "wb") as file:
+            file.write(old_session.encrypt(entry.to_frontmatter().encode()))
+
+        with patch("giournal.journal.get_password_from_keychain_with_fallback", return_value="new password"):
+            journal: Journal = Journal(self.journal.journal_configuration)
+            self.assertEqual([e.body for e in journal.iter_entries()], ["offline"])
+            self.assertEqual(journal._upgrade_pulled(["2020_01_01-00_00_00"]), ["2020_01_01-00_00_00"])
+            self.assertTrue(journal._get_session().is_current(journal._entry_ciphertext("2020_01_01-00_00_00")))
+
+    def test_import_keeps_dates_skips_duplicates_and_moves_collisions(self) -> None:
+        self.journal.journal_configuration.workers = 4
+        with patch("giournal.journal.datetime", wraps=datetime) as datetime_mock:
+            datetime_mock.now.return_value = datetime(2020, 1, 1, 12)
+            self.journal.add_entry("already there")
+        entries: List[Entry] = [
+            Entry(body=b, created=datetime(2020, 1, 1, 12), last_modified=datetime(2020, 1, 1, 12))
+            for b in ("already there", "same second", "same second")
+        ] + [Entry(body="older", created=datetime(2019, 6, 1), last_modified=datetime(2019, 6, 1))]
+
+        with patch.object(self.journal, "request_sync") as request_sync_mock:
+            import_report = self.journal.import_entries(entries)
+        self.assertEqual((import_report.imported, import_report.duplicates, import_report.moved), (2, 2, 1))
+        request_sync_mock.assert_called_once()
+        self.assertEqual([(e.created, e.body) for e in self.journal.iter_entries()], [
+            (datetime(2019, 6, 1), "older"),
+            (datetime(2020, 1, 1, 12), "already there"),
+            (datetime(2020, 1, 1, 12, 0, 1), "same second"),
+        ])
+
+    def test_import_stopped_by_an_unreadable_entry_keeps_and_syncs_the_entries_before(self) -> None:
+        self.assertEqual(self.journal.count(), 0)
+
+        def entries() -> Iterator[Entry]:
+            yield Entry(body="readable", created=datetime(2020, 1, 1), last_modified=datetime(2020, 1, 1))
+            raise ImportFormatError("No date for line 2")
+
+        with patch.object(self.journal, "request_sync") as request_sync_mock:
+            with self.assertRaises(ImportFormatError):
+                self.journal.import_entries(entries())
+        request_sync_mock.assert_called_once_with(["2020_01_01-00_00_00"])
+        with patch.object(EncryptionSession, "decrypt", side_effect=AssertionError("decrypted")):
+            self.assertEqual(self.journal.count(), 1)
+
+    def test_verify_reports_problems_and_checks_only_changes_incrementally(self) -> None:
+        self.journal.journal_configuration.workers = 4
+        for body in ("first", "second"):
+            self.journal.add_entry(body)
+        self.assertEqual((self.journal.verify().checked, self.journal.verify(incremental=True).checked), (2, 0))
+
+        first, second = self.journal._all_entries_file_names()
+        with open(os.path.join(self.journal_path, first), "r+b") as file:
+            file.seek(-1, os.SEEK_END)
+            file.write(b"!")
+        shutil.copy(os.path.join(self.journal_path, second), os.path.join(self.journal_path, "2000_01_01-00_00_00"))
+        verify_report = self.journal.verify(incremental=True)
+        self.assertEqual((verify_report.checked, len(verify_report.problems)), (2, 2))
+        self.assertIn(f"{first} fails authentication", "\n".join(verify_report.problems))
+        self.assertIn("2000_01_01-00_00_00 is named after another date", "\n".join(verify_report.problems))
+
+        # Only a full check compares the texts of every entry.
+        verify_report = self.journal.verify()
+        self.assertEqual((verify_report.checked, len(verify_report.problems)), (3, 3))
+        self.assertIn("have the same date and text", "\n".join(verify_report.problems))
+
+    def test_parallel_round_trip_skips_corrupt_entries(self) -> None:
+        self.journal.journal_configuration.workers = 2
+        self.journal.journal_configuration.worker_mode = PROCESS
+        for day in range(1, 6):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        with open(os.path.join(self.journal_path, "2020_01_03-00_00_00"), "wb") as file:
+            file.write(b"corrupt")
+
+        with redirect_stderr(StringIO()) as stderr:
+            listed: str = "".join(self.journal.list_entries())
+            self.journal.decrypt()
+            self.journal.encrypt()
+        self.assertEqual(listed.count("entry"), 4)
+        self.assertLess(listed.index("entry 1"), listed.index("entry 5"))
+        self.assertIn("2020_01_03-00_00_00", stderr.getvalue())
+        self.assertEqual("".join(self.journal.list_entries()), listed)
+
+    def test_list_is_served_from_cache_until_the_entry_changes(self) -> None:
+        self._write_entry(datetime(2020, 1, 1), "cached entry")
+        listed: str = "".join(self.journal.list_entries())
+        with patch.object(EncryptionSession, "decrypt", side_effect=AssertionError("decrypted")):
+            self.assertEqual("".join(self.journal.list_entries()), listed)
+
+        self._write_entry(datetime(2020, 1, 1), "changed entry")
+        self.assertIn("changed entry", "".join(self.journal.list_entries()))
+
+    def test_list_range_skips_entries_outside_of_it_without_opening_them(self) -> None:
+        for day in range(1, 6):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        with open(os.path.join(self.journal_path, "2019_12_31-00_00_00"), "wb") as file:
+            file.write(b"corrupt, but never opened")
+
+        with redirect_stderr(StringIO()) as stderr:
+            listed: List[str] = list(self.journal.list_entries(
+                since=datetime(2020, 1, 2), until=datetime(2020, 1, 5), limit=2, reverse=True
+            ))
+        self.assertEqual(stderr.getvalue(), "")
+        self.assertEqual(len(listed), 2)
+        self.assertIn("entry 4", listed[0])
+        self.assertIn("entry 3", listed[1])
+
+    def test_search_indexes_new_and_pulled_entries(self) -> None:
+        self._write_entry(datetime(2020, 1, 1), "a walk in the park")
+        self.assertEqual([e.body for e in self.journal.search("park")], ["a walk in the park"])
+
+        self.journal.add_entry("back to the park")
+        self._write_entry(datetime(2020, 1, 2), "pulled from another machine, park again")
+        with patch.object(Journal, "_read_named_entries", wraps=self.journal._read_named_entries) as read_mock:
+            self.assertEqual(len(list(self.journal.search("park", limit=2))), 2)
+        self.assertEqual(read_mock.call_args_list[0].args[0], ["2020_01_02-00_00_00"])
+
+    def test_migrate_to_sharded_layout_and_back(self) -> None:
+        for month in range(1, 4):
+            self._write_entry(datetime(2020, month, 1), f"entry {month}")
+        listed: str = "".join(self.journal.list_entries())
+
+        self.journal.journal_configuration.layout = SHARDED
+        self.assertEqual(self.journal.migrate_layout(), 3)
+        self.assertTrue(os.path.isfile(os.path.join(self.journal_path, "2020", "02", "2020_02_01-00_00_00")))
+        self.assertEqual("".join(self.journal.list_entries()), listed)
+        with patch("giournal.layout.os.scandir", wraps=os.scandir) as scandir_mock:
+            ranged: List[str] = list(self.journal.list_entries(since=datetime(2020, 2, 1), until=datetime(2020, 3, 1)))
+        self.assertEqual(len(ranged), 1)
+        scanned: List[str] = [c.args[0] for c in scandir_mock.call_args_list]
+        self.assertNotIn(os.path.join(self.journal_path, "2020", "01"), scanned)
+
+        self.journal.journal_configuration.layout = FLAT
+        self.assertEqual(self.journal.migrate_layout(), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.journal_path, "2020")))
+        self.assertEqual("".join(self.journal.list_entries()), listed)
+
+    def test_migrate_leaves_an_entry_in_place_when_its_target_exists(self) -> None:
+        self._write_entry(datetime(2020, 1, 1), "flat")
+        flat: bytes = self._read_file("2020_01_01-00_00_00")
+        os.makedirs(os.path.join(self.journal_path, "2020", "01"))
+        with open(os.path.join(self.journal_path, "2020", "01", "2020_01_01-00_00_00"), "wb") as file:
+            file.write(b"pulled from a migrated clone")
+
+        self.journal.journal_configuration.layout = SHARDED
+        stderr: StringIO = StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(self.journal.migrate_layout(), 0)
+        self.assertIn("already exists", stderr.getvalue())
+        self.assertEqual(self._read_file("2020_01_01-00_00_00"), flat)
+        self.assertEqual(self._read_file(os.path.join("2020", "01", "2020_01_01-00_00_00")),
+                         b"pulled from a migrated clone")
+
+    def test_manifest_counts_without_decrypting_and_follows_changes(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        self.assertEqual(self.journal.reindex(), 3)
+
+        self.journal.add_entry("added entry")
+        with patch.object(EncryptionSession, "decrypt", side_effect=AssertionError("decrypted")):
+            self.assertEqual(self.journal.count(), 4)
+            self.assertEqual(self.journal.count(since=datetime(2020, 1, 2), until=datetime(2020, 1, 3)), 1)
+            self.assertEqual(self.journal.check_manifest(), [])
+
+        self._write_entry(datetime(2020, 1, 1), "pulled change")
+        os.remove(os.path.join(self.journal_path, "2020_01_02-00_00_00"))
+        self.assertEqual(len(self.journal.check_manifest()), 2)
+        self.journal._reconcile_manifest(["2020_01_01-00_00_00", "2020_01_02-00_00_00", ".giournal_header"])
+        self.assertEqual(self.journal.check_manifest(), [])
+        self.assertEqual(self.journal.count(), 3)
+
+    def test_statistics_follow_added_and_pulled_entries_without_decrypting(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        self.assertEqual(self.journal.statistics().entries, 3)
+
+        self.assertEqual(list(self.journal.search("missing")), [])
+        # Adding only appends to logs, neither the manifest, the search index nor the statistics are stored whole.
+        with patch.object(Manifest, "store", side_effect=AssertionError("stored")), \
+                patch.object(SearchIndex, "store", side_effect=AssertionError("stored")), \
+                patch.object(Statistics, "store", side_effect=AssertionError("stored")):
+            self.journal.add_entry("three added words")
+        self._write_entry(datetime(2020, 1, 1), "pulled longer change")
+        with patch.object(EncryptionSession, "decrypt", side_effect=AssertionError("decrypted")):
+            summary = self.journal.statistics()
+            self.assertEqual(self.journal.statistics(until=datetime(2020, 1, 3, 12)).entries, 3)
+            self.assertEqual(self.journal.statistics(until=datetime(2020, 1, 3)).entries, 2)
+        self.assertEqual((summary.entries, summary.words, summary.longest_streak[0]), (4, 9, 3))
+
+        with patch.object(EncryptionSession, "decrypt", wraps=self.journal._get_session().decrypt) as decrypt_mock:
+            self.journal._reconcile_manifest(["2020_01_01-00_00_00"])
+        self.assertEqual(decrypt_mock.call_count, 1)
+        self.assertEqual(self.journal.statistics().words, 10)
+        self.assertEqual(self.journal.statistics(rebuild=True).words, 10)
+        self.assertEqual([e.body for e in self.journal.search("added")], ["three added words"])
+
+    def test_encrypt_restores_entries_that_were_not_edited(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        ciphertexts: List[bytes] = [self._read_file(f"2020_01_0{day}-00_00_00") for day in range(1, 4)]
+
+        self.journal.decrypt()
+        edited_path: str = os.path.join(self.journal_path, "2020_01_02-00_00_00.md")
+        with open(edited_path, "r") as file:
+            edited: str = file.read().replace("entry 2", "edited entry")
+        with open(edited_path, "w") as file:
+            file.write(edited)
+        with patch("giournal.journal.sync_queue.enqueue") as enqueue_mock:
+            self.journal.encrypt()
+
+        enqueue_mock.assert_called_once_with(self.journal_path, ["2020_01_02-00_00_00"])
+        self.assertEqual(self._read_file("2020_01_01-00_00_00"), ciphertexts[0])
+        self.assertEqual(self._read_file("2020_01_03-00_00_00"), ciphertexts[2])
+        self.assertNotEqual(self._read_file("2020_01_02-00_00_00"), ciphertexts[1])
+        edited_entry: Entry = list(self.journal.iter_entries())[1]
+        self.assertEqual(edited_entry.body, "edited entry")
+        self.assertGreater(edited_entry.last_modified, edited_entry.created)
+
+    def test_encrypt_moves_an_entry_whose_created_date_was_edited(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        self.assertEqual(self.journal.count(), 3)
+        self.assertEqual(len(list(self.journal.search("entry"))), 3)
+
+        self.journal.decrypt()
+        edited_path: str = os.path.join(self.journal_path, "2020_01_02-00_00_00.md")
+        with open(edited_path, "r") as file:
+            edited: str = file.read().replace("2020-01-02", "2020-01-05")
+        with open(edited_path, "w") as file:
+            file.write(edited)
+        with patch("giournal.journal.sync_queue.enqueue") as enqueue_mock:
+            self.journal.encrypt()
+
+        enqueue_mock.assert_called_once_with(self.journal_path, ["2020_01_05-00_00_00", "2020_01_02-00_00_00"])
+        self.assertEqual(self.journal.check_manifest(), [])
+        self.assertEqual(self.journal.count(), 3)
+        self.assertEqual([e.created for e in self.journal.search("entry")],
+                         [datetime(2020, 1, 5), datetime(2020, 1, 3), datetime(2020, 1, 1)])
+
+    def test_workspace_writes_back_only_edited_entries(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        untouched: bytes = self._read_file("2020_01_02-00_00_00")
+
+        file_names: List[str] = self.journal.select_entries(since=datetime(2020, 1, 2), query="entry")
+        self.assertEqual(file_names, ["2020_01_02-00_00_00", "2020_01_03-00_00_00"])
+        with self.journal.workspace(file_names) as directory:
+            self.assertFalse(os.path.exists(os.path.join(self.journal_path, "2020_01_03-00_00_00.md")))
+            edited_path: str = os.path.join(directory, "2020_01_03-00_00_00.md")
+            with open(edited_path, "r") as file:
+                edited: str = file.read().replace("entry 3", "edited entry")
+            with open(edited_path, "w") as file:
+                file.write(edited)
+
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual(self._read_file("2020_01_02-00_00_00"), untouched)
+        self.assertEqual([e.body for e in self.journal.search("edited")], ["edited entry"])
+
+    def test_workspace_keeps_edits_that_cannot_be_written_back(self) -> None:
+        for day in range(1, 3):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+
+        with self.assertRaises(WorkspaceWriteBackError):
+            with self.journal.workspace(["2020_01_01-00_00_00", "2020_01_02-00_00_00"]) as directory:
+                with open(os.path.join(directory, "2020_01_01-00_00_00.md"), "w") as file:
+                    file.write("---\ncreated: [unclosed\n---\nbroken edit")
+                edited_path: str = os.path.join(directory, "2020_01_02-00_00_00.md")
+                with open(edited_path, "r") as file:
+                    edited: str = file.read().replace("entry 2", "edited entry")
+                with open(edited_path, "w") as file:
+                    file.write(edited)
+
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, "2020_01_01-00_00_00.md"), "r") as file:
+            self.assertIn("broken edit", file.read())
+        self.assertEqual([e.body for e in self.journal.iter_entries()], ["entry 1", "edited entry"])
+
+    def test_edited_date_taken_by_another_entry_moves_to_the_next_free_second(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        first: bytes = self._read_file("2020_01_01-00_00_00")
+
+        self.journal.decrypt()
+        edited_path: str = os.path.join(self.journal_path, "2020_01_03-00_00_00.md")
+        with open(edited_path, "r") as file:
+            edited: str = file.read().replace("2020-01-03", "2020-01-01")
+        with open(edited_path, "w") as file:
+            file.write(edited)
+        with patch("giournal.journal.sync_queue.enqueue"):
+            self.journal.encrypt()
+
+        self.assertEqual(self._read_file("2020_01_01-00_00_00"), first)
+        self.assertEqual([(e.created, e.body) for e in self.journal.iter_entries()], [
+            (datetime(2020, 1, 1), "entry 1"), (datetime(2020, 1, 1, 0, 0, 1), "entry 3"),
+            (datetime(2020, 1, 2), "entry 2"),
+        ])
+
+    def test_pack_and_unpack_entries(self) -> None:
+        for day in range(1, 4):
+            self._write_entry(datetime(2020, 1, day), f"entry {day}")
+        ciphertext: bytes = self._read_file("2020_01_01-00_00_00")
+        listed: str = "".join(self.journal.list_entries())
+        self.assertEqual(self.journal.reindex(), 3)
+
+        self.assertEqual(self.journal.pack(), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.journal_path, "2020_01_01-00_00_00")))
+        self.assertEqual("".join(self.journal.list_entries()), listed)
+        self.journal.journal_configuration.storage = SEGMENTS
+        self.journal.add_entry("packed entry")
+        self.assertEqual([e.body for e in self.journal.search("packed")], ["packed entry"])
+        with self.journal.workspace(self.journal.select_entries(query="entry 2")) as directory:
+            with open(os.path.join(directory, "2020_01_02-00_00_00.md"), "a") as file:
+                file.write(" edited")
+        self.assertEqual(self.journal.compact(), (1, 1))
+        self.assertEqual(self.journal.count(), 4)
+        self.assertEqual(self.journal.check_manifest(), [])
+
+        self.assertEqual(self.journal.unpack(), 4)
+        self.assertEqual(os.listdir(os.path.join(self.journal_path, "segments")), [])
+        self.assertEqual(self._read_file("2020_01_01-00_00_00"), ciphertext)
+        self.assertIn("entry 2 edited", "".join(self.journal.list_entries()))
+        self.assertEqual(self.journal.check_manifest(), [])
+
+    def _read_file(self, file_name: str) -> bytes:
+        with open(os.path.join(self.journal_path, file_name), "rb") as file:
+            return file.read()
+
+    def _write_entry(self, created: datetime, body: str) -> None:
+        entry: Entry = Entry(body=body, created=created, last_modified=created)
+        with open(os.path.join(self.journal_path, created.strftime(FILENAME_DATETIME_FORMAT)), "wb") as file:
+            file.write(self.journal._get_session().encrypt(entry.to_frontmatter().encode()))
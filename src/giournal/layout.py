@@ -0,0 +1,65 @@
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+FILENAME_DATETIME_FORMAT = "%Y_%m_%d-%H_%M_%S"
+
+# Every entry directly in the journal directory.
+FLAT = "flat"
+# Entries in YYYY/MM directories, so listings and date ranges only touch the relevant shards.
+SHARDED = "sharded"
+LAYOUTS = (FLAT, SHARDED)
+
+_YEAR_DIRECTORY = re.compile(r"^\d{4}$")
+_MONTH_DIRECTORY = re.compile(r"^\d{2}$")
+
+
+def entry_path(created: datetime, layout: str) -> str:
+    """ Path of an entry relative to the journal. """
+    file_name: str = created.strftime(FILENAME_DATETIME_FORMAT)
+    if layout == SHARDED:
+        return os.path.join(created.strftime("%Y"), created.strftime("%m"), file_name)
+    return file_name
+
+
+def entry_created(path: str) -> Optional[datetime]:
+    """ The creation date encoded in an entry path, None if it does not follow FILENAME_DATETIME_FORMAT. """
+    file_name: str = os.path.basename(path)
+    try:
+        return datetime.strptime(file_name[:-len(".md")] if file_name.endswith(".md") else file_name,
+                                 FILENAME_DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def list_entry_paths(
+    journal_path: str, since: Optional[datetime] = None, until: Optional[datetime] = None
+) -> List[str]:
+    """
+    Paths, relative to the journal, of the entries in either layout, sorted by file name so chronologically.
+    Shards entirely outside of `since` included to `until` excluded are not listed at all.
+    """
+    paths: List[str] = []
+    # scandir gets the file type from the directory listing itself, without a stat per entry.
+    for directory_entry in os.scandir(journal_path):
+        if directory_entry.name.startswith("."):
+            continue
+        if directory_entry.is_file():
+            paths.append(directory_entry.name)
+        elif _YEAR_DIRECTORY.match(directory_entry.name) and directory_entry.is_dir():
+            for month_entry in os.scandir(directory_entry.path):
+                if not _MONTH_DIRECTORY.match(month_entry.name) or not month_entry.is_dir() \
+                        or not _shard_in_range(int(directory_entry.name), int(month_entry.name), since, until):
+                    continue
+                paths.extend(os.path.join(directory_entry.name, month_entry.name, f.name)
+                             for f in os.scandir(month_entry.path) if not f.name.startswith(".") and f.is_file())
+    return sorted(paths, key=os.path.basename)
+
+
+def _shard_in_range(year: int, month: int, since: Optional[datetime], until: Optional[datetime]) -> bool:
+    if since is not None and (year, month) < (since.year, since.month):
+        return False
+    if until is not None and (year, month) > (until.year, until.month):
+        return False
+    return True
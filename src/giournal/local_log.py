@@ -0,0 +1,30 @@
+import json
+import os
+from base64 import b64decode, b64encode
+from typing import Any, Dict, List
+
+from helpers.encryption import local_decrypt, local_encrypt
+
+
+def append_record(path: str, key: bytes, record: Dict[str, Any]) -> None:
+    """
+    Appends an encrypted record to a log of changes to local state, which costs the same however large the state
+    is, unlike storing it. The log is folded into the state when it is next read.
+    """
+    with open(path, "ab") as file:
+        file.write(b64encode(local_encrypt(json.dumps(record).encode(), key)) + b"\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_records(path: str, key: bytes) -> List[Dict[str, Any]]:
+    """ In the order appended, a record cut short by a crash is skipped. """
+    records: List[Dict[str, Any]] = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            records.append(json.loads(local_decrypt(b64decode(line), key)))
+    return records
@@ -0,0 +1,60 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Set
+
+from helpers.filesystem import atomic_write, safe_make_dir
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows, where nothing updates local state in the background.
+    fcntl = None
+
+# Hidden, so it is neither listed as an entry nor committed: everything in it can be rebuilt from the entries.
+LOCAL_STATE_DIRECTORY = ".giournal"
+LOCAL_STATE_LOCK_FILE_NAME = "state.lock"
+# Ignores everything in the directory, itself included, so git status does not list it in the journal repository.
+GITIGNORE_FILE_NAME = ".gitignore"
+
+# Directories already known to be ignored, so it is checked once per process rather than on every path.
+_ignored: Set[str] = set()
+
+# How many times each thread holds the lock of each journal, a thread locking again must not wait for itself.
+_held: threading.local = threading.local()
+
+
+def local_state_path(journal_path: str, file_name: str) -> str:
+    directory: str = os.path.join(journal_path, LOCAL_STATE_DIRECTORY)
+    safe_make_dir(directory)
+    if directory not in _ignored:
+        gitignore_path: str = os.path.join(directory, GITIGNORE_FILE_NAME)
+        if not os.path.exists(gitignore_path):
+            atomic_write(gitignore_path, b"*\n")
+        _ignored.add(directory)
+    return os.path.join(directory, file_name)
+
+
+@contextmanager
+def local_state_lock(journal_path: str) -> Iterator[None]:
+    """
+    Held while reading, updating and storing local state, so updates made at the same time by the foreground command
+    and the background workers are not lost. Never sync while holding it, syncing takes it too.
+    """
+    lock_path: str = local_state_path(journal_path, LOCAL_STATE_LOCK_FILE_NAME)
+    depths = _held.__dict__.setdefault("depths", {})
+    if fcntl is None or depths.get(lock_path):
+        depths[lock_path] = depths.get(lock_path, 0) + 1
+        try:
+            yield
+        finally:
+            depths[lock_path] -= 1
+        return
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        depths[lock_path] = 1
+        try:
+            yield
+        finally:
+            depths[lock_path] = 0
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,41 @@
+import os
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+from typing import List
+
+from helpers.filesystem import atomic_write
+from .local_state import GITIGNORE_FILE_NAME, LOCAL_STATE_DIRECTORY, local_state_lock, local_state_path
+from . import sync_queue
+
+
+class LocalStateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    @unittest.skipUnless(sync_queue.is_supported(), "Needs flock")
+    def test_lock_is_reentrant_and_excludes_other_holders(self) -> None:
+        acquired: List[bool] = []
+
+        def acquire() -> None:
+            with local_state_lock(self.directory.name):
+                acquired.append(True)
+
+        with local_state_lock(self.directory.name):
+            with local_state_lock(self.directory.name):
+                other: threading.Thread = threading.Thread(target=acquire)
+                other.start()
+                other.join(0.1)
+                self.assertEqual(acquired, [])
+        other.join(5)
+        self.assertEqual(acquired, [True])
+
+    def test_atomic_write_leaves_no_temporary_file(self) -> None:
+        path: str = local_state_path(self.directory.name, "state")
+        atomic_write(path, b"first")
+        atomic_write(path, b"second")
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"second")
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory.name, LOCAL_STATE_DIRECTORY))),
+                         [GITIGNORE_FILE_NAME, "state"])
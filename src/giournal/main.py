@@ -9,43 +9,331 @@ import sys
 import tempfile
 from json.decoder import JSONDecodeError
 from pathlib import Path
-from typing import Callable, List
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
 
-from .journal import Journal, get_journal, FILENAME_DATETIME_FORMAT
+from helpers import key_agent, timings
 from .journal_configuration import JournalConfiguration, initialise_journal_config
+from .sync_queue import FULL_SCAN
+
+if TYPE_CHECKING:
+    from .journal import Journal
 
 CONFIG_PATH = f"{str(Path.home())}/.giournal"
 
 
-def sync() -> None:
-    journal: Journal = get_journal(CONFIG_PATH)
-    journal.git_sync()
+def _get_journal(journal_configuration: Optional[JournalConfiguration] = None) -> "Journal":
+    """
+    The journal module pulls in cryptography, GitPython, frontmatter and keyring,
+    so it is only imported once a command actually needs the journal.
+    """
+    from .journal import Journal, get_journal
+
+    if journal_configuration is None:
+        return get_journal(CONFIG_PATH)
+    return Journal(journal_configuration)
+
+
+def sync(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    for sync_report in journal.request_sync([FULL_SCAN], wait=args.wait):
+        print(sync_report)
+
+
+def print_entries(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    entries: Iterator[str] = journal.list_entries(args.since, args.until, args.limit, args.reverse)
+    if args.pager:
+        _page(entries)
+    else:
+        for entry in entries:
+            print(entry, end="", flush=True)
+
+
+def _page(lines: Iterator[str]) -> None:
+    """ Streams into the pager, so the first entries show up while the rest are still being decrypted. """
+    pager: subprocess.Popen = subprocess.Popen(os.environ.get("PAGER", "less").split(" "), stdin=subprocess.PIPE,
+                                               universal_newlines=True)
+    try:
+        for line in lines:
+            pager.stdin.write(line)
+            pager.stdin.flush()
+        pager.stdin.close()
+    except BrokenPipeError:
+        # The pager was closed before reaching the end.
+        pass
+    pager.wait()
+
+
+def _parse_since(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def _parse_until(value: str) -> datetime.datetime:
+    """ A bare date includes the whole day. """
+    until: datetime.datetime = datetime.datetime.fromisoformat(value)
+    if len(value) == len("YYYY-MM-DD"):
+        until += datetime.timedelta(days=1)
+    return until
+
+
+def _search_query(words: List[str]) -> str:
+    """
+    The shell has removed the quotes by now: a single argument of several words was quoted, so it is searched as a
+    phrase. Separate arguments match entries containing all of them.
+    """
+    if len(words) == 1 and len(words[0].split()) > 1 and not words[0].strip().startswith('"'):
+        return f'"{words[0]}"'
+    return " ".join(words)
+
+
+def search(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    for entry in journal.search(_search_query(args.text), args.limit):
+        print(f"{entry.created}: {entry.body}\n", flush=True)
+
+
+def rebuild_search(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    indexed: int = journal.rebuild_search_index()
+    print(f"Indexed {indexed} entries.")
+
+
+def count(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    print(journal.count(args.since, args.until))
+
+
+def reindex(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    indexed: int = journal.reindex()
+    print(f"Indexed {indexed} entries.")
+
+
+def check_manifest(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    problems: List[str] = journal.check_manifest()
+    for problem in problems:
+        print(problem)
+    if problems:
+        print("Run with --reindex to rebuild the manifest.")
+        sys.exit(1)
+    print("The manifest is consistent with the journal.")
 
 
-def print_entries() -> None:
-    journal: Journal = get_journal(CONFIG_PATH)
-    entries: str = journal.list_entries()
-    print(entries)
+def stats(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    print(journal.statistics(args.since, args.until, args.rebuild))
 
 
-def decrypt() -> None:
-    journal: Journal = get_journal(CONFIG_PATH)
+def import_entries(args: argparse.Namespace) -> None:
+    from getpass import getpass
+    from helpers.encryption import WrongPasswordError
+    from .importers import ARCHIVE, detect_format, read_entries
+
+    path: str = os.path.expanduser(" ".join(args.text))
+    if not os.path.exists(path):
+        print(f"Nothing to import at '{path}'.", file=sys.stderr)
+        sys.exit(1)
+    import_format: str = args.import_format or detect_format(path)
+    password: Optional[str] = getpass("Archive password: ") if import_format == ARCHIVE else None
+    journal: Journal = _get_journal()
+    try:
+        print(journal.import_entries(read_entries(path, import_format, password)))
+    except WrongPasswordError:
+        print("Wrong archive password.", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        # Unreadable dates, JSON or archives. The entries read before were imported and are skipped next time.
+        print(f"Import stopped: {e}. Entries before it were imported, fix it and import again to add the rest.",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+def export_entries(args: argparse.Namespace) -> None:
+    from getpass import getpass
+    from .exporters import ARCHIVE, export
+
+    if sys.stdout.isatty() and args.export_format != "jsonl":
+        print("Redirect the output to a file or pipe it into another command.", file=sys.stderr)
+        sys.exit(1)
+    password: Optional[str] = None
+    if args.export_format == ARCHIVE:
+        password = getpass("Archive password: ", stream=sys.stderr)
+        if getpass("Repeat the archive password: ", stream=sys.stderr) != password:
+            print("The passwords do not match.", file=sys.stderr)
+            sys.exit(1)
+    journal: Journal = _get_journal()
+    try:
+        exported: int = export(journal.iter_entries(args.since, args.until), sys.stdout.buffer, args.export_format,
+                               password)
+        sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        # The reading end was closed, e.g. by `head`. Python flushes stdout again on exit, which would fail too.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    print(f"Exported {exported} entries.", file=sys.stderr)
+
+
+def verify(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    verify_report = journal.verify(args.incremental)
+    for problem in verify_report.problems:
+        print(problem)
+    print(verify_report)
+    if verify_report.problems:
+        sys.exit(1)
+
+
+def start_agent(args: argparse.Namespace) -> None:
+    if not key_agent.is_supported():
+        print("The key agent needs Unix sockets, which are not available on this system.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        key_agent.spawn(args.agent_ttl)
+    except PermissionError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    _get_journal().unlock()
+    print(f"The key agent at '{key_agent.socket_path()}' holds your password until unused for {args.agent_ttl}s.")
+
+
+def serve(args: argparse.Namespace) -> None:
+    from . import server
+
+    if args.port is None and not key_agent.is_supported():
+        print("Unix sockets are not available on this system, serve on a local port with --port.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        if args.port is None:
+            print(f"Listening on '{args.socket or server.default_socket_path()}'.", file=sys.stderr)
+        else:
+            print(f"Listening on 127.0.0.1:{args.port}, requests need the token in '{server.token_path()}'.",
+                  file=sys.stderr)
+    except PermissionError as e:
+        # The directory of the socket and token is not private.
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    server.run(_get_journal(), args.socket, args.port)
+
+
+def lock(_: argparse.Namespace) -> None:
+    if key_agent.lock():
+        print("The key agent forgot your password.")
+    else:
+        print("No key agent is running.")
+
+
+def decrypt(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
     journal.decrypt()
     print("All entries have been decrypted, press enter to encrypt them again.")
     input()
     journal.encrypt()
 
 
-def encrypt() -> None:
-    journal: Journal = get_journal(CONFIG_PATH)
+def workspace(args: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    file_names: List[str] = journal.select_entries(args.since, args.until, _search_query(args.text), args.entry)
+    from .journal import WorkspaceWriteBackError
+
+    try:
+        with journal.workspace(file_names) as directory:
+            print(f"Decrypted {len(file_names)} entries to '{directory}', press enter when done editing them.")
+            input()
+    except WorkspaceWriteBackError as e:
+        print(f"{e}.", file=sys.stderr)
+        sys.exit(1)
+    print("Edited entries have been encrypted again, the workspace was deleted.")
+
+
+def encrypt(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
     journal.encrypt()
 
 
-def editor() -> None:
+def upgrade(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    upgraded: int = journal.upgrade()
+    print(f"Upgraded {upgraded} entries to the current encryption format.")
+
+
+def change_password(_: argparse.Namespace) -> None:
+    from getpass import getpass
+    from helpers.encryption import WrongPasswordError
+
+    journal: Journal = _get_journal()
+    old_password: str = getpass("Current password: ")
+    new_password: str = getpass("New password: ")
+    if getpass("Repeat the new password: ") != new_password:
+        print("The new passwords do not match.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        rewritten, remaining = journal.change_password(old_password, new_password)
+    except WrongPasswordError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if remaining:
+        print(f"Re-encrypted {rewritten} entries, {remaining} failed and still need the old password. "
+              f"Run --change-password again with the same passwords to finish.")
+        sys.exit(1)
+    print(f"Re-encrypted {rewritten} entries, the keychain now holds the new password. "
+          f"Other machines ask for it once they sync.")
+
+
+def calibrate(args: argparse.Namespace) -> None:
+    from helpers.encryption import calibrate as calibrate_kdf, is_kdf_available
+    from .upgrade_worker import UPGRADE_LOG_FILE_NAME, spawn_worker
+
+    journal_configuration: JournalConfiguration = get_or_create_config()
+    algorithm: str = args.kdf or journal_configuration.kdf
+    if not is_kdf_available(algorithm):
+        print(f"{algorithm} is not available in this Python build.", file=sys.stderr)
+        sys.exit(1)
+    cost: int = calibrate_kdf(algorithm, args.target_ms / 1000)
+    print(f"Deriving a key with {algorithm} at cost {cost} takes about {args.target_ms:g}ms on this machine.")
+    journal_configuration.kdf = algorithm
+    journal_configuration.kdf_cost = cost
+    journal_configuration.store(CONFIG_PATH)
+
+    journal: Journal = _get_journal(journal_configuration)
+    journal.add_key(algorithm, cost)
+    # Hands the new key to the key agent, if running, so the background upgrade does not derive it again.
+    journal.unlock()
+    spawn_worker(journal_configuration)
+    print(f"New entries use the new journal key, older ones are being re-encrypted in the background, "
+          f"see {UPGRADE_LOG_FILE_NAME} in the local state directory.")
+
+
+def migrate_layout(_: argparse.Namespace) -> None:
+    journal_configuration: JournalConfiguration = get_or_create_config()
+    journal: Journal = _get_journal(journal_configuration)
+    moved: int = journal.migrate_layout()
+    print(f"Moved {moved} entries to the {journal_configuration.layout} layout.")
+
+
+def pack(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    print(f"Packed {journal.pack()} entries into segments.")
+
+
+def unpack(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    print(f"Unpacked {journal.unpack()} entries into their own files.")
+
+
+def compact(_: argparse.Namespace) -> None:
+    journal: Journal = _get_journal()
+    before, after = journal.compact()
+    print(f"Compacted {before} segments into {after}.")
+
+
+def editor(_: argparse.Namespace) -> None:
     journal_configuration: JournalConfiguration = get_or_create_config()
-    journal: Journal = Journal(journal_configuration)
+    journal: Journal = _get_journal(journal_configuration)
     directory: str
     with tempfile.TemporaryDirectory() as directory:
+        from .layout import FILENAME_DATETIME_FORMAT
+
         file_name: str = f"{datetime.datetime.now().strftime(FILENAME_DATETIME_FORMAT)}.md"
         file_path: str = os.path.join(directory, file_name)
 
@@ -72,6 +360,133 @@ def _parse_args(args: List[str]) -> argparse.Namespace:
         dest="callable",
         help="Lists all the entries.",
     )
+    argument_parser.add_argument(
+        "--search",
+        action="store_const",
+        const=search,
+        dest="callable",
+        help="Lists the entries containing all the words given, newest first. Quote them together, as one "
+             "argument, to match a phrase.",
+    )
+    argument_parser.add_argument(
+        "--rebuild-search",
+        action="store_const",
+        const=rebuild_search,
+        dest="callable",
+        help="Rebuilds the search index from all the entries.",
+    )
+    argument_parser.add_argument(
+        "--count",
+        action="store_const",
+        const=count,
+        dest="callable",
+        help="Prints how many entries there are, without decrypting them.",
+    )
+    argument_parser.add_argument(
+        "--reindex",
+        action="store_const",
+        const=reindex,
+        dest="callable",
+        help="Rebuilds the manifest of entry dates and sizes from all the entries.",
+    )
+    argument_parser.add_argument(
+        "--check-manifest",
+        action="store_const",
+        const=check_manifest,
+        dest="callable",
+        help="Checks that the manifest matches the entry files.",
+    )
+    argument_parser.add_argument(
+        "--stats",
+        action="store_const",
+        const=stats,
+        dest="callable",
+        help="Prints entries and words per month, streaks and gaps, without decrypting entries.",
+    )
+    argument_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="With --stats, recomputes the statistics from all the entries.",
+    )
+    argument_parser.add_argument(
+        "--verify",
+        action="store_const",
+        const=verify,
+        dest="callable",
+        help="Checks that every entry decrypts and parses, and reports corrupt, misnamed and duplicate entries "
+             "without changing anything.",
+    )
+    argument_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="With --verify, only checks entries changed since the last commit verified without problems.",
+    )
+    argument_parser.add_argument(
+        "--import",
+        action="store_const",
+        const=import_entries,
+        dest="callable",
+        help="Imports the entries from the path given, a directory of markdown files with dates in their "
+             "frontmatter, a JSONL file or a jrnl text export, keeping their dates. Syncs once at the end.",
+    )
+    argument_parser.add_argument(
+        "--import-format",
+        choices=("markdown", "jsonl", "jrnl", "archive"),
+        help="With --import, the format of the path, guessed from it by default.",
+    )
+    argument_parser.add_argument(
+        "--export",
+        action="store_const",
+        const=export_entries,
+        dest="callable",
+        help="Writes the entries to stdout, oldest first and optionally narrowed with --since and --until, "
+             "in the format set with --export-format.",
+    )
+    argument_parser.add_argument(
+        "--export-format",
+        choices=("jsonl", "tar", "archive"),
+        default="jsonl",
+        help="With --export, JSONL (the default), a tar of markdown files, or an archive encrypted with a new "
+             "password. All of them can be imported back.",
+    )
+    argument_parser.add_argument(
+        "--agent",
+        action="store_const",
+        const=start_agent,
+        dest="callable",
+        help="Starts a key agent holding your password and journal key, so commands skip the keychain.",
+    )
+    argument_parser.add_argument(
+        "--agent-ttl",
+        type=float,
+        default=key_agent.DEFAULT_TTL_SECONDS,
+        help="With --agent, seconds without use after which the agent forgets your password and exits.",
+    )
+    argument_parser.add_argument(
+        "--serve",
+        action="store_const",
+        const=serve,
+        dest="callable",
+        help="Serves add, list, search and sync as JSON requests, one per line, keeping the journal open between "
+             "them. Listens on a Unix socket only your user can access, or on --port.",
+    )
+    argument_parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="With --serve, the Unix socket to listen on instead of the default one.",
+    )
+    argument_parser.add_argument(
+        "--port",
+        type=int,
+        help="With --serve, listen on this port of localhost instead of a Unix socket.",
+    )
+    argument_parser.add_argument(
+        "--lock",
+        action="store_const",
+        const=lock,
+        dest="callable",
+        help="Makes the key agent forget your password and journal key.",
+    )
     argument_parser.add_argument(
         "--decrypt",
         action="store_const",
@@ -79,6 +494,19 @@ def _parse_args(args: List[str]) -> argparse.Namespace:
         dest="callable",
         help="Decrypt entries, waits for input, re-encrypts all entries.",
     )
+    argument_parser.add_argument(
+        "--workspace",
+        action="store_const",
+        const=workspace,
+        dest="callable",
+        help="Decrypts some entries to a temporary directory, selected with --since, --until, --entry or "
+             "search words, and encrypts back the ones edited there.",
+    )
+    argument_parser.add_argument(
+        "--entry",
+        action="append",
+        help="With --workspace, an entry file name to decrypt. Can be repeated.",
+    )
     argument_parser.add_argument(
         "--encrypt",
         action="store_const",
@@ -86,6 +514,67 @@ def _parse_args(args: List[str]) -> argparse.Namespace:
         dest="callable",
         help="encrypts all entries.",
     )
+    argument_parser.add_argument(
+        "--upgrade",
+        action="store_const",
+        const=upgrade,
+        dest="callable",
+        help="Re-encrypts older entries with the current journal key.",
+    )
+    argument_parser.add_argument(
+        "--change-password",
+        action="store_const",
+        const=change_password,
+        dest="callable",
+        help="Re-encrypts every entry with a new password. Run it again to resume if interrupted.",
+    )
+    argument_parser.add_argument(
+        "--calibrate",
+        action="store_const",
+        const=calibrate,
+        dest="callable",
+        help="Picks the key derivation cost that takes --target-ms on this machine, switches the journal to a new "
+             "key with that cost and re-encrypts the entries in the background.",
+    )
+    argument_parser.add_argument(
+        "--kdf",
+        choices=("pbkdf2", "scrypt"),
+        help="With --calibrate, the key derivation function, defaults to the configured one.",
+    )
+    argument_parser.add_argument(
+        "--target-ms",
+        type=float,
+        default=500,
+        help="With --calibrate, how long deriving the journal key should take.",
+    )
+    argument_parser.add_argument(
+        "--migrate-layout",
+        action="store_const",
+        const=migrate_layout,
+        dest="callable",
+        help="Moves the entries to the layout set in the configuration, 'flat' or 'sharded' by year and month.",
+    )
+    argument_parser.add_argument(
+        "--pack",
+        action="store_const",
+        const=pack,
+        dest="callable",
+        help="Moves every entry file into segment files.",
+    )
+    argument_parser.add_argument(
+        "--unpack",
+        action="store_const",
+        const=unpack,
+        dest="callable",
+        help="Moves every packed entry back into its own file.",
+    )
+    argument_parser.add_argument(
+        "--compact",
+        action="store_const",
+        const=compact,
+        dest="callable",
+        help="Merges segment files, dropping older revisions of entries.",
+    )
     argument_parser.add_argument(
         "--editor",
         action="store_const",
@@ -100,6 +589,56 @@ def _parse_args(args: List[str]) -> argparse.Namespace:
         dest="callable",
         help="Manually sync from and to the remote.",
     )
+    argument_parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="With --sync, waits for background syncs and flushes every queued entry.",
+    )
+    argument_parser.add_argument(
+        "--since",
+        type=_parse_since,
+        help="With --list, --count, --stats or --workspace, only entries created from this ISO date or datetime.",
+    )
+    argument_parser.add_argument(
+        "--until",
+        type=_parse_until,
+        help="With --list, --count, --stats or --workspace, only entries created up to this ISO date or datetime.",
+    )
+    argument_parser.add_argument(
+        "--limit",
+        type=int,
+        help="With --list or --search, show at most this many entries.",
+    )
+    argument_parser.add_argument(
+        "--reverse",
+        action="store_true",
+        help="With --list, newest entries first.",
+    )
+    argument_parser.add_argument(
+        "--pager",
+        action="store_true",
+        help="With --list, show entries in $PAGER.",
+    )
+    # "1" prints the table, any other value is a path to write the JSON to.
+    environment_timings: Optional[str] = os.environ.get(timings.TIMINGS_ENVIRONMENT_VARIABLE) or None
+    argument_parser.add_argument(
+        "--timings",
+        action="store_true",
+        default=environment_timings in ("-", "1"),
+        help="Prints how long each phase took, e.g. key derivation or git.",
+    )
+    argument_parser.add_argument(
+        "--timings-json",
+        default=environment_timings if environment_timings not in ("-", "1") else None,
+        metavar="PATH",
+        help="Writes how long each phase took as JSON to the path given.",
+    )
+    argument_parser.add_argument(
+        "--profile",
+        default=os.environ.get(timings.PROFILE_ENVIRONMENT_VARIABLE),
+        metavar="PATH",
+        help="Dumps cProfile statistics of the command to the path given.",
+    )
     argument_parser.add_argument("text", metavar="", nargs="*")
     args: argparse.Namespace = argument_parser.parse_args(args)
     return args
@@ -118,12 +657,43 @@ def main() -> None:
     journal_configuration = get_or_create_config()
 
     args = _parse_args(sys.argv[1:])
+    if args.timings or args.timings_json:
+        timings.enable()
+    profile = None
+    if args.profile:
+        import cProfile
+
+        profile: cProfile.Profile = cProfile.Profile()
+        profile.enable()
+
+    try:
+        with timings.Phase("total"):
+            _run(args, journal_configuration)
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(args.profile)
+        if args.timings:
+            print(timings.format_table(), file=sys.stderr)
+        if args.timings_json:
+            timings.write_json(args.timings_json)
+
+
+def _run(args: argparse.Namespace, journal_configuration: JournalConfiguration) -> None:
+    try:
+        if isinstance(args.callable, Callable):
+            args.callable(args)
+        elif args.text:
+            journal: Journal = _get_journal(journal_configuration)
+            journal.add_entry(" ".join(args.text).strip())
+    except Exception as e:
+        # Only the journal raises it, so it is already imported by then.
+        from .journal import PasswordChangeInProgressError
 
-    if isinstance(args.callable, Callable):
-        args.callable()
-    elif args.text:
-        journal: Journal = Journal(journal_configuration)
-        journal.add_entry(" ".join(args.text).strip())
+        if not isinstance(e, PasswordChangeInProgressError):
+            raise
+        print(f"{e}, with the same old and new passwords.", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
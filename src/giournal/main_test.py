@@ -1,3 +1,4 @@
+import argparse
 import unittest
 from tempfile import (
     TemporaryDirectory,
@@ -7,6 +8,7 @@ from typing import List
 from unittest.mock import patch, MagicMock
 
 from .journal_configuration import JournalConfiguration, initialise_journal_config
+from .main import _parse_args, _search_query
 
 
 class MainTest(unittest.TestCase):
@@ -23,3 +25,13 @@ class MainTest(unittest.TestCase):
         self.assertEqual(journal_config.journal_path, journal_directory)
         self.assertFalse(journal_config.sync_to_git)
         self.assertFalse(journal_config.use_keychain)
+
+    def test_search_query_keeps_a_quoted_argument_as_a_phrase(self) -> None:
+        self.assertEqual(_search_query(["walk in the park"]), '"walk in the park"')
+        self.assertEqual(_search_query(["park", "walk"]), "park walk")
+        self.assertEqual(_search_query(['"walk in"']), '"walk in"')
+
+    def test_timings_flag_does_not_take_the_entry_text(self) -> None:
+        args: argparse.Namespace = _parse_args(["--timings", "hello", "world"])
+        self.assertEqual((args.timings, args.timings_json, args.text), (True, None, ["hello", "world"]))
+        self.assertEqual(_parse_args(["--timings-json", "times.json"]).timings_json, "times.json")
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from helpers.encryption import local_decrypt, local_encrypt
+from helpers.filesystem import atomic_write
+from .entry import Entry
+
+MANIFEST_FILE_NAME = "manifest"
+# Records of added entries, appended without rewriting the manifest and folded into it when it is next read.
+MANIFEST_LOG_FILE_NAME = "manifest.log"
+
+
+def ciphertext_digest(ciphertext: bytes) -> Tuple[str, int]:
+    """ Hash and size of an encrypted entry, which need no decryption. """
+    return hashlib.sha256(ciphertext).hexdigest(), len(ciphertext)
+
+
+@dataclass
+class ManifestRecord(object):
+    created: datetime
+    last_modified: datetime
+    content_hash: str
+    size: int
+    words: int
+
+    @classmethod
+    def from_entry(cls, entry: Entry, ciphertext: bytes) -> ManifestRecord:
+        content_hash, size = ciphertext_digest(ciphertext)
+        return cls(entry.created, entry.last_modified, content_hash, size, len(entry.body.split()))
+
+    @classmethod
+    def from_dict(cls, dictionary: Dict[str, Any]) -> ManifestRecord:
+        return cls(created=datetime.fromisoformat(dictionary["created"]),
+                   last_modified=datetime.fromisoformat(dictionary["last_modified"]),
+                   content_hash=dictionary["content_hash"],
+                   size=dictionary["size"],
+                   words=dictionary["words"],
+                   )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"created": self.created.isoformat(), "last_modified": self.last_modified.isoformat(),
+                "content_hash": self.content_hash, "size": self.size, "words": self.words}
+
+
+class Manifest(object):
+    """
+    Metadata of every entry keyed by file name, so counts and date lookups need neither a directory scan
+    nor decrypting entries. The ciphertext hash tells which records went stale, e.g. after a pull.
+    """
+
+    def __init__(self) -> None:
+        self.records: Dict[str, ManifestRecord] = {}
+        # Records replaced or removed and their replacements since loading, for aggregates kept alongside.
+        self.changes: List[Tuple[Optional[ManifestRecord], Optional[ManifestRecord]]] = []
+
+    @classmethod
+    def load(cls, path: str, key: bytes) -> Manifest:
+        """ Returns an empty manifest if none was stored yet. """
+        manifest: Manifest = cls()
+        if not os.path.exists(path):
+            return manifest
+        with open(path, "rb") as file:
+            loaded_dictionary: Dict[str, Dict] = json.loads(zlib.decompress(local_decrypt(file.read(), key)))
+        manifest.records = {k: ManifestRecord.from_dict(v) for k, v in loaded_dictionary.items()}
+        return manifest
+
+    def store(self, path: str, key: bytes) -> None:
+        content: bytes = json.dumps({k: v.to_dict() for k, v in self.records.items()}).encode()
+        atomic_write(path, local_encrypt(zlib.compress(content), key))
+
+    def put(self, file_name: str, record: ManifestRecord) -> None:
+        self.changes.append((self.records.get(file_name), record))
+        self.records[file_name] = record
+
+    def put_all(self, records: Dict[str, ManifestRecord]) -> None:
+        for file_name, record in records.items():
+            self.put(file_name, record)
+
+    def remove(self, file_name: str) -> None:
+        removed: Optional[ManifestRecord] = self.records.pop(file_name, None)
+        if removed is not None:
+            self.changes.append((removed, None))
+
+    def rename(self, file_name: str, new_file_name: str) -> None:
+        if file_name in self.records:
+            self.records[new_file_name] = self.records.pop(file_name)
+
+    def refresh_digest(self, file_name: str, ciphertext: bytes) -> None:
+        """ For entries re-encrypted without changing their content. """
+        if file_name in self.records:
+            self.records[file_name].content_hash, self.records[file_name].size = ciphertext_digest(ciphertext)
+
+    def check(self, digests: Dict[str, Tuple[str, int]]) -> List[str]:
+        """ Describes every difference with the hash and size of the entries on disk, keyed by file name. """
+        problems: List[str] = []
+        file_names: Set[str] = set(digests)
+        for file_name in sorted(file_names - set(self.records)):
+            problems.append(f"'{file_name}' is missing from the manifest.")
+        for file_name in sorted(set(self.records) - file_names):
+            problems.append(f"'{file_name}' is in the manifest but not in the journal.")
+        for file_name in sorted(file_names & set(self.records)):
+            record: ManifestRecord = self.records[file_name]
+            if digests[file_name] != (record.content_hash, record.size):
+                problems.append(f"'{file_name}' changed since it was indexed.")
+        return problems
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import zlib
+from typing import Dict, List, Set, Tuple
+
+from helpers.encryption import local_decrypt, local_encrypt
+from helpers.filesystem import atomic_write
+
+SEARCH_INDEX_FILE_NAME = "search_index"
+# Entries added since the index was stored, indexed when it is next read.
+SEARCH_INDEX_LOG_FILE_NAME = "search_index.log"
+
+Signature = Tuple[int, int]
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def file_signature(file_path: str) -> Signature:
+    stat: os.stat_result = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class SearchIndex(object):
+    """
+    Inverted index from tokens to the entries, and positions within them, containing each token.
+    Every indexed entry keeps the size and mtime of its file, so entries changed or added by a pull can be found
+    and re-indexed without decrypting the others.
+    """
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        self.documents: Dict[str, Signature] = {}
+
+    @classmethod
+    def load(cls, path: str, key: bytes) -> SearchIndex:
+        """ Returns an empty index if none was stored yet. """
+        search_index: SearchIndex = cls()
+        if not os.path.exists(path):
+            return search_index
+        with open(path, "rb") as file:
+            loaded_dictionary: Dict = json.loads(zlib.decompress(local_decrypt(file.read(), key)))
+        search_index.postings = loaded_dictionary["postings"]
+        search_index.documents = {k: tuple(v) for k, v in loaded_dictionary["documents"].items()}
+        return search_index
+
+    def store(self, path: str, key: bytes) -> None:
+        content: bytes = json.dumps({"postings": self.postings, "documents": self.documents}).encode()
+        atomic_write(path, local_encrypt(zlib.compress(content), key))
+
+    def add(self, file_name: str, signature: Signature, text: str) -> None:
+        self.remove(file_name)
+        for position, token in enumerate(tokenize(text)):
+            self.postings.setdefault(token, {}).setdefault(file_name, []).append(position)
+        self.documents[file_name] = signature
+
+    def remove(self, file_name: str) -> None:
+        if self.documents.pop(file_name, None) is None:
+            return
+        for token in [t for t, p in self.postings.items() if file_name in p]:
+            del self.postings[token][file_name]
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def stale(self, signatures: Dict[str, Signature]) -> Tuple[List[str], List[str]]:
+        """ Returns the entries to (re)index and the ones to remove, given the signatures of the current files. """
+        to_index: List[str] = sorted(f for f, s in signatures.items() if self.documents.get(f) != s)
+        to_remove: List[str] = sorted(f for f in self.documents if f not in signatures)
+        return to_index, to_remove
+
+    def search(self, query: str) -> List[str]:
+        """
+        File names of the entries containing every token of the query, sorted by file name.
+        A query between double quotes only matches the tokens next to each other, in order.
+        """
+        tokens: List[str] = tokenize(query)
+        if not tokens or any(t not in self.postings for t in tokens):
+            return []
+        file_names: Set[str] = set.intersection(*(set(self.postings[t]) for t in tokens))
+        if query.strip().startswith('"') and query.strip().endswith('"'):
+            file_names = {f for f in file_names if self._contains_phrase(f, tokens)}
+        return sorted(file_names)
+
+    def _contains_phrase(self, file_name: str, tokens: List[str]) -> bool:
+        return any(
+            all(position + offset in self.postings[token][file_name] for offset, token in enumerate(tokens))
+            for position in self.postings[tokens[0]][file_name]
+        )
@@ -0,0 +1,34 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from helpers.encryption import EncryptionSession, KeyParameters
+from .search_index import SearchIndex
+
+
+class SearchIndexTest(unittest.TestCase):
+    def test_search_matches_all_tokens_and_phrases(self) -> None:
+        search_index: SearchIndex = SearchIndex()
+        search_index.add("a", (1, 1), "The quick brown fox")
+        search_index.add("b", (1, 1), "A brown and quick dog")
+
+        self.assertEqual(search_index.search("QUICK brown"), ["a", "b"])
+        self.assertEqual(search_index.search('"quick brown"'), ["a"])
+        self.assertEqual(search_index.search("cat"), [])
+
+        search_index.remove("a")
+        self.assertEqual(search_index.search("quick"), ["b"])
+        self.assertNotIn("fox", search_index.postings)
+
+    def test_store_and_load(self) -> None:
+        key: bytes = EncryptionSession("password", [KeyParameters.generate(1_000)]).derive_subkey(b"search-index")
+        search_index: SearchIndex = SearchIndex()
+        search_index.add("a", (1, 2), "secret words")
+        with TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "index")
+            search_index.store(path, key)
+            with open(path, "rb") as file:
+                self.assertNotIn(b"secret", file.read())
+            loaded_search_index: SearchIndex = SearchIndex.load(path, key)
+        self.assertEqual(loaded_search_index.search("secret"), ["a"])
+        self.assertEqual(loaded_search_index.stale({"a": (1, 2), "b": (3, 4)}), (["b"], []))
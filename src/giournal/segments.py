@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import time
+import uuid
+import zlib
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from helpers.filesystem import atomic_write
+from .local_state import local_state_lock, local_state_path
+
+# One file per entry, the default.
+FILES = "files"
+# New entries appended to segments.
+SEGMENTS = "segments"
+STORAGES = (FILES, SEGMENTS)
+
+# Committed like the entries, so other machines can read the packed entries.
+SEGMENTS_DIRECTORY = "segments"
+SEGMENT_INDEX_FILE_NAME = "segment_index"
+# Names the segments this clone writes, other clones never write to them so git never has to merge a segment.
+SEGMENT_WRITER_FILE_NAME = "segment_writer"
+# A new segment is started once the current one would grow past this.
+MAX_SEGMENT_BYTES = 4 * 1024 * 1024
+_INDEX_VERSION = 2
+
+# Every record is the length of the name, the length of the token, then the name and the token.
+# The name is followed by `@` and when the record was written, in nanoseconds, records written before have none.
+_RECORD_HEADER: struct.Struct = struct.Struct(">HI")
+
+# Segment, offset of the token, length of the token and when the record was written.
+Location = Tuple[str, int, int, int]
+
+
+def _segment_name(writer: str, number: int) -> str:
+    return f"{writer}-{number:08d}"
+
+
+def _segment_writer(segment: str) -> str:
+    """ Empty for the segments written before they were named after their writer, e.g. `00000001`. """
+    return segment.rpartition("-")[0]
+
+
+def _segment_order(segment: str) -> Tuple[int, str, int]:
+    writer, _, number = segment.rpartition("-")
+    return (1 if writer else 0, writer, int(number))
+
+
+def _is_segment(file_name: str) -> bool:
+    writer, _, number = file_name.rpartition("-")
+    return number.isdigit() and (not writer or writer.isalnum())
+
+
+def _precedence(location: Location) -> Tuple[int, Tuple[int, str, int], int]:
+    """ The latest written record of an entry wins, whichever machine wrote it, so all machines agree. """
+    segment, offset, _, written = location
+    return written, _segment_order(segment), offset
+
+
+def _load_writer(journal_path: str) -> str:
+    path: str = local_state_path(journal_path, SEGMENT_WRITER_FILE_NAME)
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            return file.read().strip()
+    writer: str = uuid.uuid4().hex[:12]
+    atomic_write(path, writer.encode())
+    return writer
+
+
+class SegmentStore(object):
+    """
+    Entries packed into append only segment files, each record holding an entry name and its encrypted token.
+    Every clone appends to, and compacts, only segments named after itself, so segments never conflict in git.
+    The latest written record of an entry supersedes the others, compaction drops the superseded records.
+    The offset index is local state, it is brought up to date by scanning only what was appended to each
+    segment since, e.g. by a pull. It is rebuilt when a segment disappears or its scanned part changed.
+    """
+
+    def __init__(self, journal_path: str) -> None:
+        self.journal_path: str = journal_path
+        self.directory: str = os.path.join(journal_path, SEGMENTS_DIRECTORY)
+        self.index_path: str = local_state_path(journal_path, SEGMENT_INDEX_FILE_NAME)
+        self.writer: str = _load_writer(journal_path)
+        self.locations: Dict[str, Location] = {}
+        # How far each segment was scanned, the checksum of that part, and the size and mtime it was checked at.
+        self.scanned: Dict[str, List[int]] = {}
+        self._maps: Dict[str, mmap.mmap] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as file:
+                loaded_dictionary: Dict = json.load(file)
+            # An index from before records were timestamped is rebuilt.
+            if loaded_dictionary.get("version") == _INDEX_VERSION:
+                self.locations = {k: tuple(v) for k, v in loaded_dictionary["locations"].items()}
+                self.scanned = loaded_dictionary["scanned"]
+        self.refresh()
+
+    def __enter__(self) -> SegmentStore:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def segments(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((f for f in os.listdir(self.directory) if _is_segment(f)), key=_segment_order)
+
+    def refresh(self) -> None:
+        """
+        Indexes records appended since the last scan. Segments are bounded, so checking that their scanned part
+        is unchanged, and rebuilding when it is not, stays cheap.
+        """
+        if not self._changed():
+            return
+        with local_state_lock(self.journal_path):
+            self._refresh()
+
+    def _changed(self) -> bool:
+        """ Checked without the lock, as it is on every read. """
+        segments: List[str] = self.segments()
+        if set(self.scanned) - set(segments):
+            return True
+        for segment in segments:
+            status: os.stat_result = os.stat(os.path.join(self.directory, segment))
+            if [status.st_size, status.st_mtime_ns] != self.scanned.get(segment, [0, 0, 0, 0])[2:]:
+                return True
+        return False
+
+    def _refresh(self) -> None:
+        segments: List[str] = self.segments()
+        contents: Dict[str, bytes] = {}
+        rebuild: bool = bool(set(self.scanned) - set(segments))
+        for segment in segments:
+            status: os.stat_result = os.stat(os.path.join(self.directory, segment))
+            scanned, checksum, size, mtime = self.scanned.get(segment, [0, 0, 0, 0])
+            if (status.st_size, status.st_mtime_ns) == (size, mtime):
+                continue
+            # Rewritten by git, a map would still show the previous file.
+            self._close_map(segment)
+            with open(os.path.join(self.directory, segment), "rb") as file:
+                contents[segment] = file.read()
+            if zlib.crc32(contents[segment][:scanned]) != checksum or len(contents[segment]) < scanned:
+                rebuild = True
+        if rebuild:
+            self.close()
+            self.locations = {}
+            self.scanned = {}
+        if not rebuild and not contents:
+            return
+        for segment in segments:
+            if rebuild or segment in contents:
+                if segment not in contents:
+                    with open(os.path.join(self.directory, segment), "rb") as file:
+                        contents[segment] = file.read()
+                self._scan(segment, contents[segment])
+        self._store_index()
+
+    def names(self) -> List[str]:
+        return sorted(self.locations)
+
+    def read(self, name: str) -> bytes:
+        segment, offset, length, _ = self.locations[name]
+        if segment not in self._maps:
+            with open(os.path.join(self.directory, segment), "rb") as file:
+                self._maps[segment] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[segment][offset:offset + length]
+
+    def signature(self, name: str) -> Tuple[int, int]:
+        """ Changes whenever the record for `name` is rewritten, like the size and mtime of a file. """
+        segment, offset, length, written = self.locations[name]
+        return length, written or zlib.crc32(segment.encode()) << 32 | offset
+
+    def append(self, records: Iterable[Tuple[str, bytes]]) -> List[str]:
+        """
+        Appends the records durably to the last segment of this clone.
+        Returns the paths of the segments written, relative to the journal.
+        """
+        return self._write((name, token, time.time_ns()) for name, token in records)
+
+    def remove_all(self) -> List[str]:
+        """ Deletes every segment, returning their paths relative to the journal. """
+        self.close()
+        with local_state_lock(self.journal_path):
+            removed: List[str] = self.segments()
+            for segment in removed:
+                os.remove(os.path.join(self.directory, segment))
+            self.locations = {}
+            self.scanned = {}
+            self._store_index()
+        return [os.path.join(SEGMENTS_DIRECTORY, s) for s in removed]
+
+    def compact(self) -> List[str]:
+        """
+        Rewrites the latest records in the segments of this clone, and in the ones from before segments were named
+        after their writer, into a new segment, in name order, and deletes those segments.
+        Segments of other clones are left for them to compact. Returns the paths written and removed.
+        """
+        with local_state_lock(self.journal_path):
+            self.refresh()
+            old_segments: List[str] = [s for s in self.segments() if _segment_writer(s) in ("", self.writer)]
+            if not old_segments:
+                return []
+            compacted: List[Tuple[str, bytes, int]] = [
+                (n, bytes(self.read(n)), self.locations[n][3]) for n in self.names()
+                if self.locations[n][0] in old_segments
+            ]
+            self.close()
+            # Numbered after the old segments, so a crash halfway leaves the copies superseding the old records.
+            written: List[str] = self._write(compacted, new_segment=True)
+            for segment in old_segments:
+                os.remove(os.path.join(self.directory, segment))
+                self.scanned.pop(segment, None)
+            self._store_index()
+        return written + [os.path.join(SEGMENTS_DIRECTORY, s) for s in old_segments]
+
+    def close(self) -> None:
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps = {}
+
+    def _own_segments(self) -> List[str]:
+        return [s for s in self.segments() if _segment_writer(s) == self.writer]
+
+    def _write(self, records: Iterable[Tuple[str, bytes, int]], new_segment: bool = False) -> List[str]:
+        # Other processes append to the same segments, e.g. background workers: the offsets of the records, and the
+        # index stored, come from the files as they are under the lock, never from what this store saw earlier.
+        with local_state_lock(self.journal_path):
+            self.refresh()
+            os.makedirs(self.directory, exist_ok=True)
+            own_segments: List[str] = self._own_segments()
+            number: int = int(own_segments[-1].rpartition("-")[2]) if own_segments else 0
+            if new_segment or not own_segments:
+                number += 1
+            segment: str = _segment_name(self.writer, number)
+            written: List[str] = []
+            file: Optional[BinaryIO] = None
+            size, checksum = 0, 0
+            try:
+                for name, token, written_at in records:
+                    stored_name: bytes = f"{name}@{written_at}".encode()
+                    record: bytes = _RECORD_HEADER.pack(len(stored_name), len(token)) + stored_name + token
+                    if file is not None and size + len(record) > MAX_SEGMENT_BYTES:
+                        self._close_durably(file, segment)
+                        file = None
+                        number += 1
+                        segment = _segment_name(self.writer, number)
+                    while file is None:
+                        # A map of the segment would not see what is appended.
+                        self._close_map(segment)
+                        file = open(os.path.join(self.directory, segment), "ab")
+                        size = file.tell()
+                        scanned, checksum = self.scanned.get(segment, [0, 0])[:2]
+                        # Records after one cut short by a crash could not be read, and a full segment stays full.
+                        if size != scanned or (size and size + len(record) > MAX_SEGMENT_BYTES):
+                            file.close()
+                            file = None
+                            number += 1
+                            segment = _segment_name(self.writer, number)
+                    if segment not in written:
+                        written.append(segment)
+                    file.write(record)
+                    self._locate(name, (segment, size + len(record) - len(token), len(token), written_at))
+                    size += len(record)
+                    checksum = zlib.crc32(record, checksum)
+                    self.scanned[segment] = [size, checksum, 0, 0]
+            finally:
+                if file is not None:
+                    self._close_durably(file, segment)
+            self._store_index()
+        return [os.path.join(SEGMENTS_DIRECTORY, s) for s in written]
+
+    def _locate(self, name: str, location: Location) -> None:
+        if name not in self.locations or _precedence(location) >= _precedence(self.locations[name]):
+            self.locations[name] = location
+
+    def _scan(self, segment: str, content: bytes) -> None:
+        """ Indexes the records of `content` after the part of the segment already scanned. """
+        offset, checksum = self.scanned.get(segment, [0, 0])[:2]
+        position: int = offset
+        while position + _RECORD_HEADER.size <= len(content):
+            name_length, token_length = _RECORD_HEADER.unpack_from(content, position)
+            end: int = position + _RECORD_HEADER.size + name_length + token_length
+            if end > len(content):
+                # A record still being written, or cut short by a crash: scanned again next time.
+                break
+            name_start: int = position + _RECORD_HEADER.size
+            name, _, written_at = content[name_start:name_start + name_length].decode().partition("@")
+            self._locate(name, (segment, end - token_length, token_length, int(written_at or 0)))
+            position = end
+        status: os.stat_result = os.stat(os.path.join(self.directory, segment))
+        self.scanned[segment] = [position, zlib.crc32(content[offset:position], checksum), status.st_size,
+                                 status.st_mtime_ns]
+
+    def _close_durably(self, file: BinaryIO, segment: str) -> None:
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+        status: os.stat_result = os.stat(os.path.join(self.directory, segment))
+        self.scanned[segment][2:] = [status.st_size, status.st_mtime_ns]
+
+    def _close_map(self, segment: str) -> None:
+        segment_map: Optional[mmap.mmap] = self._maps.pop(segment, None)
+        if segment_map is not None:
+            segment_map.close()
+
+    def _store_index(self) -> None:
+        atomic_write(self.index_path, json.dumps({
+            "version": _INDEX_VERSION, "locations": self.locations, "scanned": self.scanned,
+        }).encode())
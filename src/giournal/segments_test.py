@@ -0,0 +1,95 @@
+import os
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+from typing import List
+from unittest.mock import patch
+
+from .segments import SegmentStore
+
+
+class SegmentStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_later_records_supersede_and_compaction_drops_them(self) -> None:
+        with SegmentStore(self.directory.name) as store:
+            store.append([("a", b"first"), ("b", b"other")])
+            store.append([("a", b"second")])
+            self.assertEqual(store.names(), ["a", "b"])
+            self.assertEqual(bytes(store.read("a")), b"second")
+
+            store.compact()
+            self.assertEqual(len(store.segments()), 1)
+            self.assertEqual(bytes(store.read("a")), b"second")
+            # Names are followed by `@` and the nanoseconds they were written at.
+            self.assertEqual(os.path.getsize(os.path.join(store.directory, store.segments()[0])),
+                             2 * (6 + 1 + 20) + len(b"second") + len(b"other"))
+
+    def test_segments_are_bounded_and_appends_by_others_are_picked_up(self) -> None:
+        with patch("giournal.segments.MAX_SEGMENT_BYTES", 40):
+            with SegmentStore(self.directory.name) as store:
+                store.append([("a", b"0123456789"), ("b", b"0123456789")])
+                self.assertEqual(len(store.segments()), 2)
+
+            with SegmentStore(self.directory.name) as other_store:
+                other_store.append([("c", b"pulled")])
+
+            store.refresh()
+            self.assertEqual(bytes(store.read("c")), b"pulled")
+
+    def test_clones_only_write_and_compact_their_own_segments(self) -> None:
+        with SegmentStore(self.directory.name) as store, SegmentStore(self.directory.name) as other_store:
+            other_store.writer = "0ther0clone0"
+            store.append([("a", b"mine")])
+            other_store.append([("a", b"newer"), ("b", b"theirs")])
+            other_segment: str = os.path.join(store.directory, "0ther0clone0-00000001")
+            with open(other_segment, "rb") as file:
+                other_content: bytes = file.read()
+
+            store.refresh()
+            self.assertEqual(bytes(store.read("a")), b"newer")
+            store.append([("b", b"newest")])
+            store.compact()
+            self.assertEqual(len(store.segments()), 2)
+            with open(other_segment, "rb") as file:
+                self.assertEqual(file.read(), other_content)
+            self.assertEqual((bytes(store.read("a")), bytes(store.read("b"))), (b"newer", b"newest"))
+
+    def test_refresh_rebuilds_when_a_pull_rewrites_what_was_scanned(self) -> None:
+        with SegmentStore(self.directory.name) as store, SegmentStore(self.directory.name) as other_store:
+            other_store.writer = "0ther0clone0"
+            other_store.append([("a", b"first"), ("b", b"second")])
+            store.refresh()
+            self.assertEqual(store.names(), ["a", "b"])
+            other_segment: str = os.path.join(store.directory, "0ther0clone0-00000001")
+
+            os.remove(other_segment)
+            other_store.scanned = {}
+            other_store.append([("c", b"rewritten, and longer than before")])
+            store.refresh()
+            self.assertEqual(store.names(), ["c"])
+
+    def test_concurrent_writers_never_corrupt_the_index(self) -> None:
+        with SegmentStore(self.directory.name) as store, SegmentStore(self.directory.name) as other_store:
+            store.append([("e1", b"first")])
+            # Appends from a view that does not include the record above yet.
+            other_store.append([("e2", b"second")])
+            store.append([("e3", b"third")])
+
+            writers: List[threading.Thread] = [
+                threading.Thread(target=lambda s=s, w=w: [s.append([(f"{w}{i}", f"{w}{i}".encode())])
+                                                          for i in range(50)])
+                for s, w in ((store, "a"), (other_store, "b"))
+            ]
+            for writer in writers:
+                writer.start()
+            for writer in writers:
+                writer.join()
+
+        with SegmentStore(self.directory.name) as reopened:
+            self.assertEqual(len(reopened.names()), 103)
+            self.assertEqual([bytes(reopened.read(n)) for n in ("e1", "e2", "e3")], [b"first", b"second", b"third"])
+            self.assertTrue(all(bytes(reopened.read(n)) == n.encode() for n in reopened.names()
+                                if n[0] in "ab"))
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import secrets
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from helpers import key_agent
+from .journal import Journal
+from .sync_queue import FULL_SCAN
+
+# Clients on a TCP port must send this token, read from a file only the user can access. A Unix socket needs none.
+TOKEN_FILE_NAME = "server.token"
+SOCKET_FILE_NAME = "server.sock"
+# A request is one line, an added entry included, far above asyncio's default of 64 KiB.
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+def default_socket_path() -> str:
+    return os.path.join(key_agent.runtime_directory(), SOCKET_FILE_NAME)
+
+
+def token_path() -> str:
+    return os.path.join(key_agent.runtime_directory(), TOKEN_FILE_NAME)
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class JournalServer(object):
+    """
+    Answers JSON requests, one per line, with one JSON response per line, keeping the journal, its journal keys,
+    segment index and git repository open between requests.
+    Commands run off the event loop one at a time, so git operations never overlap and the journal, which is not
+    thread safe, is only used from one thread. Each command still decrypts on the configured worker pool.
+    """
+
+    def __init__(self, journal: Journal, token: Optional[str] = None) -> None:
+        self.journal: Journal = journal
+        self.token: Optional[str] = token
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+        # Created once the event loop runs, Python 3.9 binds it to the loop current at creation.
+        self._stopped: Optional[asyncio.Event] = None
+        self._commands: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            "add": self._add, "list": self._list, "search": self._search, "sync": self._sync,
+        }
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line: bytes = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST_BYTES, the rest of it cannot be told apart from the next request.
+                    writer.write(json.dumps({"error": f"Requests are limited to {MAX_REQUEST_BYTES} bytes"}).encode()
+                                 + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                response: Dict[str, Any]
+                try:
+                    request: Any = json.loads(line)
+                except ValueError as e:
+                    # Not JSON, or not UTF-8: answered like any other bad request, the connection stays usable.
+                    response = {"error": f"Malformed request: {e}"}
+                else:
+                    response = await self.handle(request) if isinstance(request, dict) \
+                        else {"error": "A request must be a JSON object"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if self.token is not None and not secrets.compare_digest(str(request.get("token", "")), self.token):
+            return {"error": "Wrong or missing token"}
+        command: Any = request.get("command", "")
+        if not isinstance(command, str):
+            return {"error": "The command must be a string"}
+        if command == "stop":
+            self._stopped.set()
+            return {}
+        if command not in self._commands:
+            return {"error": f"Unknown command '{command}'"}
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._commands[command], request)
+        except Exception as e:
+            return {"error": repr(e)}
+
+    def _add(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.journal.add_entry(request["text"].strip())
+        return {}
+
+    def _list(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {"entries": [e.to_dict() for e in self.journal.iter_entries(
+            _parse_datetime(request.get("since")), _parse_datetime(request.get("until")), request.get("limit"),
+            request.get("reverse", False),
+        )]}
+
+    def _search(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {"entries": [e.to_dict() for e in self.journal.search(request["query"], request.get("limit"))]}
+
+    def _sync(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {"reports": [str(r) for r in self.journal.request_sync([FULL_SCAN], wait=True)]}
+
+    async def serve(self, path: Optional[str] = None, port: Optional[int] = None) -> None:
+        """ On the Unix socket at `path`, or on `port` of localhost, until stopped by a request or a signal. """
+        self._stopped = asyncio.Event()
+        # Derives the journal key before listening, so the first requests do not all derive it.
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.journal.unlock)
+        server: asyncio.AbstractServer
+        if port is not None:
+            server = await asyncio.start_server(self.handle_connection, "127.0.0.1", port, limit=MAX_REQUEST_BYTES)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            previous_umask: int = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_REQUEST_BYTES)
+            finally:
+                os.umask(previous_umask)
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self._stopped.set)
+            except (NotImplementedError, RuntimeError):
+                # Not on Windows, nor outside of the main thread.
+                pass
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+            if path is not None and port is None and os.path.exists(path):
+                os.remove(path)
+
+
+def run(journal: Journal, path: Optional[str] = None, port: Optional[int] = None) -> None:
+    token: Optional[str] = None
+    if port is not None:
+        token = secrets.token_urlsafe(32)
+        if os.path.exists(token_path()):
+            os.remove(token_path())
+        previous_umask: int = os.umask(0o177)
+        try:
+            with open(token_path(), "w") as file:
+                file.write(token)
+        finally:
+            os.umask(previous_umask)
+    try:
+        asyncio.run(JournalServer(journal, token).serve(path or default_socket_path(), port))
+    finally:
+        if token is not None:
+            os.remove(token_path())
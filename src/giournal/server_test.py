@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from typing import Any, Dict
+from unittest.mock import patch
+
+from helpers import key_agent
+from .journal import Journal
+from .journal_configuration import JournalConfiguration
+from .server import JournalServer
+
+
+@unittest.skipUnless(key_agent.is_supported(), "Needs Unix sockets")
+class ServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        password_patch = patch("giournal.journal.get_password_from_keychain_with_fallback", return_value="password")
+        password_patch.start()
+        self.addCleanup(password_patch.stop)
+        # Never the agent of whoever runs the tests, which holds the password of their own journal.
+        agent_patch = patch.dict(os.environ, {
+            key_agent.SOCKET_ENVIRONMENT_VARIABLE: os.path.join(directory.name, "no-agent.sock"),
+        })
+        agent_patch.start()
+        self.addCleanup(agent_patch.stop)
+        journal_path: str = os.path.join(directory.name, "journal")
+        os.makedirs(journal_path)
+        self.journal: Journal = Journal(JournalConfiguration(
+            journal_path=journal_path,
+            sync_to_git=False,
+            git_remote=None,
+            use_keychain=False,
+            editor_path="",
+            cache_path=os.path.join(directory.name, "cache.sqlite"),
+        ))
+        self.socket_path: str = os.path.join(directory.name, "server.sock")
+
+    def _wait_for_socket(self, timeout: float = 5) -> None:
+        deadline: float = time.monotonic() + timeout
+        while not os.path.exists(self.socket_path):
+            if time.monotonic() > deadline:
+                self.fail(f"The server did not listen on '{self.socket_path}' within {timeout} seconds")
+            time.sleep(0.01)
+
+    def _request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            with client.makefile("rwb") as stream:
+                stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                return json.loads(stream.readline())
+
+    def test_add_list_and_search_on_one_journal(self) -> None:
+        server: threading.Thread = threading.Thread(
+            target=asyncio.run, args=(JournalServer(self.journal).serve(self.socket_path),)
+        )
+        server.start()
+        self.addCleanup(server.join)
+        self._wait_for_socket()
+
+        with patch.object(self.journal, "request_sync"):
+            self.assertEqual(self._request({"command": "add", "text": "walk in the park"}), {})
+            self.assertEqual(self._request({"command": "add", "text": "rainy day"}), {})
+        self.assertEqual([e["body"] for e in self._request({"command": "list"})["entries"]],
+                         ["walk in the park", "rainy day"])
+        self.assertEqual([e["body"] for e in self._request({"command": "search", "query": "park"})["entries"]],
+                         ["walk in the park"])
+        self.assertIn("error", self._request({"command": "delete"}))
+        self.assertIn("error", self._request({"command": ["add"]}))
+        with patch.object(self.journal, "request_sync"):
+            self.assertEqual(self._request({"command": "add", "text": "long " * 20_000}), {})
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            with client.makefile("rwb") as stream:
+                for malformed in (b"not json", b"[1, 2]", b"\xff"):
+                    stream.write(malformed + b"\n")
+                    stream.flush()
+                    self.assertIn("error", json.loads(stream.readline()))
+
+        self._request({"command": "stop"})
+        server.join()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    @patch("giournal.server.MAX_REQUEST_BYTES", 1024)
+    def test_answers_requests_over_the_limit_with_an_error(self) -> None:
+        server: threading.Thread = threading.Thread(
+            target=asyncio.run, args=(JournalServer(self.journal).serve(self.socket_path),)
+        )
+        server.start()
+        self.addCleanup(server.join)
+        self._wait_for_socket()
+
+        response: Dict[str, Any] = self._request({"command": "add", "text": "long " * 1_000})
+        self.assertIn("error", response)
+        self.assertEqual(self.journal.count(), 0)
+        self._request({"command": "stop"})
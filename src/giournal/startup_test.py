@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import unittest
+from typing import Dict, List
+
+SOURCE_PATH: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous, imports are much faster than this on a developer machine, but CI runners can be slow.
+IMPORT_TIME_BUDGET_US: int = 150_000
+HEAVY_MODULES: List[str] = ["cryptography", "frontmatter", "git", "keyring", "sqlite3", "yaml"]
+
+
+def _import_times(module: str) -> Dict[str, int]:
+    """ Cumulative import time in microseconds of every module imported, as reported by `python -X importtime`. """
+    completed_process: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SOURCE_PATH,
+        env={**os.environ, "PYTHONPATH": SOURCE_PATH},
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    import_times: Dict[str, int] = {}
+    for line in completed_process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+class StartupTest(unittest.TestCase):
+    def test_main_does_not_import_heavy_modules(self) -> None:
+        import_times: Dict[str, int] = _import_times("giournal.main")
+        self.assertEqual([m for m in import_times if m.split(".")[0] in HEAVY_MODULES], [])
+
+    def test_main_import_time_budget(self) -> None:
+        # Best of three, the first run may also be compiling bytecode.
+        import_time: int = min(_import_times("giournal.main")["giournal.main"] for _ in range(3))
+        self.assertLess(import_time, IMPORT_TIME_BUDGET_US)
+
+    def test_configuration_import_does_not_look_for_editors(self) -> None:
+        import_times: Dict[str, int] = _import_times("giournal.journal_configuration")
+        self.assertNotIn("subprocess", import_times)
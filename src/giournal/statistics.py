@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import json
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from helpers.encryption import local_decrypt, local_encrypt
+from helpers.filesystem import atomic_write
+from .manifest import ManifestRecord
+
+STATISTICS_FILE_NAME = "statistics"
+
+# Days, first day and last day.
+Span = Tuple[int, Optional[date], Optional[date]]
+
+
+@dataclass
+class Summary(object):
+    entries: int = 0
+    words: int = 0
+    days_written: int = 0
+    first_day: Optional[date] = None
+    last_day: Optional[date] = None
+    # Entries and words per YYYY-MM.
+    months: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    current_streak: int = 0
+    longest_streak: Span = (0, None, None)
+    # Days without entries between two days with some.
+    longest_gap: Span = (0, None, None)
+
+    def __str__(self) -> str:
+        if not self.entries:
+            return "No entries."
+        lines: List[str] = [
+            f"Entries: {self.entries}, {self.words} words, on {self.days_written} days "
+            f"from {self.first_day} to {self.last_day}.",
+            f"Per day written: {self.entries / self.days_written:.1f} entries, "
+            f"{self.words / self.days_written:.0f} words.",
+            f"Current streak: {self.current_streak} days.",
+            f"Longest streak: {self.longest_streak[0]} days, from {self.longest_streak[1]} "
+            f"to {self.longest_streak[2]}.",
+        ]
+        if self.longest_gap[0]:
+            lines.append(f"Longest gap: {self.longest_gap[0]} days, from {self.longest_gap[1]} "
+                         f"to {self.longest_gap[2]}.")
+        lines.append("")
+        lines.append(f"{'month':<7}  {'entries':>7}  {'words':>8}")
+        for month, (entries, words) in self.months.items():
+            lines.append(f"{month:<7}  {entries:>7}  {words:>8}")
+        return "\n".join(lines)
+
+
+class Statistics(object):
+    """
+    Entries and words per day, which every statistic is computed from without decrypting entries.
+    Kept up to date from the changes made to the manifest, so an added entry only touches its own day.
+    """
+
+    def __init__(self) -> None:
+        # Entries and words per ISO date.
+        self.days: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[ManifestRecord]) -> Statistics:
+        statistics: Statistics = cls()
+        for record in records:
+            statistics.add(record)
+        return statistics
+
+    @classmethod
+    def load(cls, path: str, key: bytes) -> Statistics:
+        statistics: Statistics = cls()
+        with open(path, "rb") as file:
+            statistics.days = json.loads(zlib.decompress(local_decrypt(file.read(), key)))
+        return statistics
+
+    def store(self, path: str, key: bytes) -> None:
+        atomic_write(path, local_encrypt(zlib.compress(json.dumps(self.days).encode()), key))
+
+    def add(self, record: ManifestRecord) -> None:
+        totals: List[int] = self.days.setdefault(record.created.date().isoformat(), [0, 0])
+        totals[0] += 1
+        totals[1] += record.words
+
+    def remove(self, record: ManifestRecord) -> None:
+        day: str = record.created.date().isoformat()
+        totals: Optional[List[int]] = self.days.get(day)
+        if totals is None:
+            return
+        totals[0] -= 1
+        totals[1] -= record.words
+        if totals[0] <= 0:
+            del self.days[day]
+
+    def apply(self, changes: Iterable[Tuple[Optional[ManifestRecord], Optional[ManifestRecord]]]) -> None:
+        for old_record, new_record in changes:
+            if old_record is not None:
+                self.remove(old_record)
+            if new_record is not None:
+                self.add(new_record)
+
+    def summary(self, since: Optional[date] = None, until: Optional[date] = None,
+                today: Optional[date] = None) -> Summary:
+        """ Of the days from `since` included to `until` excluded. """
+        today = today or date.today()
+        days: List[date] = sorted(d for d in map(date.fromisoformat, self.days)
+                                  if (since is None or d >= since) and (until is None or d < until))
+        summary: Summary = Summary(days_written=len(days))
+        if not days:
+            return summary
+        summary.first_day, summary.last_day = days[0], days[-1]
+        streak_start: date = days[0]
+        for previous, day in zip([None] + days, days):
+            entries, words = self.days[day.isoformat()]
+            summary.entries += entries
+            summary.words += words
+            month_entries, month_words = summary.months.get(day.strftime("%Y-%m"), (0, 0))
+            summary.months[day.strftime("%Y-%m")] = (month_entries + entries, month_words + words)
+            if previous is not None and day - previous > timedelta(days=1):
+                gap: int = (day - previous).days - 1
+                if gap > summary.longest_gap[0]:
+                    summary.longest_gap = (gap, previous + timedelta(days=1), day - timedelta(days=1))
+                streak_start = day
+            streak: int = (day - streak_start).days + 1
+            if streak > summary.longest_streak[0]:
+                summary.longest_streak = (streak, streak_start, day)
+        # Still going if the last entry was written today or yesterday.
+        if today - days[-1] <= timedelta(days=1):
+            summary.current_streak = (days[-1] - streak_start).days + 1
+        return summary
@@ -0,0 +1,33 @@
+import unittest
+from datetime import date, datetime
+
+from .manifest import ManifestRecord
+from .statistics import Statistics, Summary
+
+
+def _record(created: datetime, words: int) -> ManifestRecord:
+    return ManifestRecord(created, created, "", 0, words)
+
+
+class StatisticsTest(unittest.TestCase):
+    def test_streaks_gaps_and_months(self) -> None:
+        days = [date(2020, 1, 30), date(2020, 1, 31), date(2020, 2, 1), date(2020, 2, 5), date(2020, 2, 6)]
+        statistics: Statistics = Statistics.from_records(_record(datetime(d.year, d.month, d.day), 10) for d in days)
+        statistics.add(_record(datetime(2020, 2, 6, 12), 5))
+
+        summary: Summary = statistics.summary(today=date(2020, 2, 7))
+        self.assertEqual((summary.entries, summary.words, summary.days_written), (6, 55, 5))
+        self.assertEqual(summary.months, {"2020-01": (2, 20), "2020-02": (4, 35)})
+        self.assertEqual(summary.longest_streak, (3, date(2020, 1, 30), date(2020, 2, 1)))
+        self.assertEqual(summary.longest_gap, (3, date(2020, 2, 2), date(2020, 2, 4)))
+        self.assertEqual(summary.current_streak, 2)
+        self.assertEqual(statistics.summary(today=date(2020, 2, 8)).current_streak, 0)
+        self.assertEqual(statistics.summary(since=date(2020, 2, 1), until=date(2020, 2, 6)).entries, 2)
+
+    def test_changes_replace_and_remove_records(self) -> None:
+        old: ManifestRecord = _record(datetime(2020, 1, 1), 10)
+        statistics: Statistics = Statistics.from_records([old])
+        statistics.apply([(old, _record(datetime(2020, 1, 1), 3)), (None, _record(datetime(2020, 1, 2), 4))])
+        self.assertEqual(statistics.days, {"2020-01-01": [1, 3], "2020-01-02": [1, 4]})
+        statistics.apply([(_record(datetime(2020, 1, 2), 4), None)])
+        self.assertEqual(statistics.days, {"2020-01-01": [1, 3]})
@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterator, List
+
+from . import background
+from .journal_configuration import JournalConfiguration
+from .local_state import local_state_path
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows, where syncing stays in the foreground.
+    fcntl = None
+
+if TYPE_CHECKING:
+    from .journal import Journal, SyncReport
+
+SYNC_QUEUE_DIRECTORY = "sync_queue"
+SYNC_LOCK_FILE_NAME = "sync.lock"
+SYNC_LOG_FILE_NAME = "sync.log"
+# Recorded by a manual sync: stages every visible file in the journal, as `git add *` would.
+FULL_SCAN = "*"
+# How long the worker waits for more entries before syncing, so a burst of adds becomes a single commit.
+COALESCE_SECONDS = 1.0
+
+
+def is_supported() -> bool:
+    return fcntl is not None
+
+
+def _queue_path(journal_path: str) -> str:
+    path: str = local_state_path(journal_path, SYNC_QUEUE_DIRECTORY)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enqueue(journal_path: str, paths: List[str]) -> None:
+    """
+    Durably records a sync request for `paths`, relative to the journal, for a background worker to pick up.
+    Requests queued while a worker is busy are coalesced into its next commit and push.
+    """
+    queue_path: str = _queue_path(journal_path)
+    request_name: str = f"{time.time_ns()}-{os.getpid()}"
+    # Written under a hidden name first, so the worker never reads a partial request.
+    temporary_path: str = os.path.join(queue_path, f".{request_name}")
+    with open(temporary_path, "w") as file:
+        file.write("".join(f"{p}\n" for p in paths))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, os.path.join(queue_path, request_name))
+
+
+def pending_requests(journal_path: str) -> List[str]:
+    queue_path: str = _queue_path(journal_path)
+    return sorted(os.path.join(queue_path, f) for f in os.listdir(queue_path) if not f.startswith("."))
+
+
+def read_requests(requests: List[str]) -> List[str]:
+    """ The paths recorded by the given requests, without duplicates. """
+    paths: List[str] = []
+    for request in requests:
+        with open(request, "r") as file:
+            paths.extend(line.strip() for line in file if line.strip())
+    return list(dict.fromkeys(paths))
+
+
+@contextmanager
+def _sync_lock(journal_path: str, wait: bool) -> Iterator[bool]:
+    """ Yields whether the lock was acquired. Only one process syncs a journal at a time. """
+    if fcntl is None:
+        yield True
+        return
+    with open(local_state_path(journal_path, SYNC_LOCK_FILE_NAME), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def drain(journal: "Journal", wait: bool = True, coalesce_seconds: float = 0) -> List["SyncReport"]:
+    """
+    Syncs the paths of every queued request until the queue is empty, returning a report per sync.
+    With `wait` blocks until any other worker is done, then syncs at least once.
+    Without it returns straight away if another worker holds the lock, that worker will pick up the requests.
+    """
+    journal_path: str = journal.journal_configuration.journal_path
+    sync_reports: List[SyncReport] = []
+    while True:
+        with _sync_lock(journal_path, wait) as acquired:
+            if not acquired:
+                return sync_reports
+            time.sleep(coalesce_seconds)
+            requests: List[str] = pending_requests(journal_path)
+            while requests or (wait and not sync_reports):
+                sync_reports.append(journal.git_sync(read_requests(requests)))
+                for request in requests:
+                    os.remove(request)
+                requests = pending_requests(journal_path)
+        # A request queued after the last check, whose worker found the lock taken, would otherwise be stranded.
+        if not pending_requests(journal_path):
+            return sync_reports
+
+
+def spawn_worker(journal_configuration: JournalConfiguration) -> None:
+    """ Starts a detached worker that outlives the current process, logging to the local state directory. """
+    background.spawn("giournal.sync_queue", journal_configuration, SYNC_LOG_FILE_NAME)
+
+
+def run_worker(serialized_configuration: str) -> None:
+    from helpers.encryption import WrongPasswordError
+    from .journal import Journal, PasswordUnavailableError
+
+    journal: Journal = Journal(JournalConfiguration(**json.loads(serialized_configuration)), interactive=False)
+    try:
+        for sync_report in drain(journal, wait=False, coalesce_seconds=COALESCE_SECONDS):
+            print(f"{datetime.now().isoformat()} {sync_report}", flush=True)
+    except (PasswordUnavailableError, WrongPasswordError) as e:
+        # Requests are only removed once synced, the next foreground sync picks them up.
+        print(f"{datetime.now().isoformat()} {e}, leaving the queue for the next foreground run.", flush=True)
+
+
+# Started by spawn_worker, or by hand with `python -m giournal.sync_queue '<journal configuration json>'`.
+if __name__ == "__main__":
+    run_worker(sys.argv[1])
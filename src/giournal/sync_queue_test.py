@@ -0,0 +1,144 @@
+import dataclasses
+import json
+import os
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import StringIO
+from tempfile import TemporaryDirectory
+from typing import List
+from unittest.mock import patch, MagicMock
+
+from git import Remote, Repo
+
+from helpers import key_agent
+from . import sync_queue
+from .journal import Journal, SyncReport
+from .journal_configuration import JournalConfiguration
+
+
+def make_remote_and_clone(directory: str) -> str:
+    """ A bare repository with a first commit on master, and a clone of it. Returns the clone's path. """
+    remote_path: str = os.path.join(directory, "remote.git")
+    seed_path: str = os.path.join(directory, "seed")
+    Repo.init(remote_path, bare=True)
+    seed: Repo = Repo.init(seed_path)
+    seed.git.checkout("-b", "master")
+    seed.index.commit("first commit")
+    seed.create_remote("origin", remote_path).push("master")
+    clone_path: str = os.path.join(directory, "journal")
+    Repo.clone_from(remote_path, clone_path, branch="master")
+    return clone_path
+
+
+class SyncQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory: str = directory.name
+        self.remote_path: str = os.path.join(directory.name, "remote.git")
+        self.journal: Journal = Journal(JournalConfiguration(
+            journal_path=make_remote_and_clone(directory.name),
+            sync_to_git=True,
+            git_remote=self.remote_path,
+            use_keychain=False,
+            editor_path="",
+            cache_path=os.path.join(directory.name, "cache.sqlite"),
+            background_sync=True,
+        ))
+        for patcher in [
+            patch("giournal.journal.get_password_from_keychain_with_fallback", return_value="password"),
+            # Never the agent of whoever runs the tests, which holds the password of their own journal.
+            patch.dict(os.environ, {
+                key_agent.SOCKET_ENVIRONMENT_VARIABLE: os.path.join(directory.name, "no-agent.sock"),
+            }),
+            patch.dict(os.environ, {"GIT_AUTHOR_NAME": "test", "GIT_AUTHOR_EMAIL": "test@test",
+                                    "GIT_COMMITTER_NAME": "test", "GIT_COMMITTER_EMAIL": "test@test"}),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch.object(sync_queue, "spawn_worker")
+    def test_burst_of_adds_is_coalesced_into_one_commit(self, spawn_worker_mock: MagicMock) -> None:
+        for day in range(1, 4):
+            with patch("giournal.journal.datetime", wraps=datetime) as datetime_mock:
+                datetime_mock.now.return_value = datetime(2020, 1, day)
+                self.journal.add_entry(f"entry {day}")
+        self.assertEqual(spawn_worker_mock.call_count, 3)
+        self.assertEqual(len(sync_queue.pending_requests(self.journal.journal_configuration.journal_path)), 3)
+
+        self.assertTrue(sync_queue.drain(self.journal, wait=False))
+
+        self.assertEqual(sync_queue.pending_requests(self.journal.journal_configuration.journal_path), [])
+        remote: Repo = Repo(self.remote_path)
+        commits: List = list(remote.iter_commits("master"))
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(sorted(commits[0].stats.files), [
+            ".giournal_header", "2020_01_01-00_00_00", "2020_01_02-00_00_00", "2020_01_03-00_00_00"
+        ])
+
+    def test_drain_without_wait_leaves_requests_to_the_lock_holder(self) -> None:
+        sync_queue.enqueue(self.journal.journal_configuration.journal_path, [])
+        with sync_queue._sync_lock(self.journal.journal_configuration.journal_path, wait=True):
+            self.assertFalse(sync_queue.drain(self.journal, wait=False))
+        self.assertEqual(len(sync_queue.pending_requests(self.journal.journal_configuration.journal_path)), 1)
+
+    def test_worker_without_password_leaves_the_queue_without_prompting(self) -> None:
+        journal_path: str = self.journal.journal_configuration.journal_path
+        sync_queue.enqueue(journal_path, ["entry"])
+        output: StringIO = StringIO()
+        with patch("giournal.journal.get_password_without_prompt", return_value=None), \
+                patch("helpers.keychain.getpass", side_effect=AssertionError("prompted")), \
+                patch.object(sync_queue, "drain", side_effect=lambda journal, **_: journal.unlock()), \
+                redirect_stdout(output):
+            sync_queue.run_worker(json.dumps(dataclasses.asdict(self.journal.journal_configuration)))
+        self.assertIn("leaving the queue", output.getvalue())
+        self.assertEqual(len(sync_queue.pending_requests(journal_path)), 1)
+
+    def test_sync_stages_only_recorded_paths_and_skips_pull_when_remote_unchanged(self) -> None:
+        self.journal.journal_configuration.background_sync = False
+        with open(os.path.join(self.journal.journal_configuration.journal_path, "stray"), "w") as file:
+            file.write("not written by the journal")
+
+        with patch.object(Remote, "pull", side_effect=AssertionError("pulled")):
+            self.journal.add_entry("entry")
+
+        committed_files: List[str] = list(Repo(self.remote_path).commit("master").stats.files)
+        self.assertEqual(len(committed_files), 2)
+        self.assertNotIn("stray", committed_files)
+        # Local state is ignored, rather than left for git status to list.
+        self.assertEqual(Repo(self.journal.journal_configuration.journal_path).untracked_files, ["stray"])
+
+    def test_sync_pulls_and_reports_when_remote_moved(self) -> None:
+        other: Repo = Repo.clone_from(self.remote_path, os.path.join(self.directory, "other"), branch="master")
+        with open(os.path.join(other.working_tree_dir, "other"), "w") as file:
+            file.write("from another machine")
+        other.index.add(["other"])
+        other.index.commit("other machine")
+        other.remotes.origin.push("master")
+
+        sync_report: SyncReport = self.journal.git_sync([])
+
+        self.assertEqual(sync_report.pulled_commits, 1)
+        self.assertEqual(sync_report.pulled_paths, ["other"])
+        self.assertEqual(sync_report.committed_paths, [])
+        self.assertEqual(sync_report.pushed_commits, 0)
+
+    def test_new_clone_adopts_the_remote_header_on_its_first_sync(self) -> None:
+        self.journal.journal_configuration.background_sync = False
+        other_path: str = os.path.join(self.directory, "other")
+        Repo.clone_from(self.remote_path, other_path, branch="master")
+        other: Journal = Journal(dataclasses.replace(self.journal.journal_configuration, journal_path=other_path))
+        with patch("giournal.journal.datetime", wraps=datetime) as datetime_mock:
+            datetime_mock.now.return_value = datetime(2020, 1, 1)
+            self.journal.add_entry("from here")
+            datetime_mock.now.return_value = datetime(2020, 1, 2)
+            other.add_entry("written before the first pull")
+
+        self.assertEqual([e.body for e in other.iter_entries()], ["from here", "written before the first pull"])
+        with open(os.path.join(other_path, ".giournal_header"), "r") as other_header, \
+                open(os.path.join(self.journal.journal_configuration.journal_path, ".giournal_header"), "r") as header:
+            self.assertEqual(other_header.read(), header.read())
+        self.journal.git_sync([])
+        self.assertEqual([e.body for e in self.journal.iter_entries()],
+                         ["from here", "written before the first pull"])
@@ -0,0 +1,38 @@
+import dataclasses
+import json
+import os
+import sys
+from datetime import datetime
+
+from helpers.parallel import PROCESS
+from . import background
+from .journal_configuration import JournalConfiguration
+
+UPGRADE_LOG_FILE_NAME = "upgrade.log"
+
+
+def spawn_worker(journal_configuration: JournalConfiguration) -> None:
+    """ Re-encrypts the entries not under the current journal key in the background. """
+    background.spawn("giournal.upgrade_worker", journal_configuration, UPGRADE_LOG_FILE_NAME)
+
+
+def run_worker(serialized_configuration: str) -> None:
+    from helpers.encryption import WrongPasswordError
+    from .journal import Journal, PasswordUnavailableError
+
+    journal_configuration: JournalConfiguration = JournalConfiguration(**json.loads(serialized_configuration))
+    # Nobody is waiting on the terminal, so use every core.
+    journal: Journal = Journal(dataclasses.replace(journal_configuration, workers=os.cpu_count() or 1,
+                                                   worker_mode=PROCESS), interactive=False)
+    try:
+        # Like --upgrade, the rewritten entries are left for the next sync.
+        upgraded: int = journal.upgrade()
+    except (PasswordUnavailableError, WrongPasswordError) as e:
+        print(f"{datetime.now().isoformat()} {e}, run --upgrade to upgrade the entries.", flush=True)
+        return
+    print(f"{datetime.now().isoformat()} Upgraded {upgraded} entries to the current journal key.", flush=True)
+
+
+# Started by spawn_worker, or by hand with `python -m giournal.upgrade_worker '<journal configuration json>'`.
+if __name__ == "__main__":
+    run_worker(sys.argv[1])
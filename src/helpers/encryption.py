@@ -1,16 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import lzma
+import math
 import secrets
+import time
+import zlib
 from base64 import urlsafe_b64encode as b64e, urlsafe_b64decode as b64d
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from helpers.timings import timed
+
+PBKDF2 = "pbkdf2"
+# Memory hard, available in hashlib when Python is built against OpenSSL 1.1 or later.
+SCRYPT = "scrypt"
+KDFS = (PBKDF2, SCRYPT)
+# The cost is the number of iterations for PBKDF2 and the CPU/memory cost n, a power of two, for scrypt.
 ITERATIONS = 100_000
+SCRYPT_COST = 2 ** 15
+SCRYPT_BLOCK_SIZE = 8
+DEFAULT_COSTS: Dict[str, int] = {PBKDF2: ITERATIONS, SCRYPT: SCRYPT_COST}
+# Costs calibration never goes below, however slow the machine.
+MINIMUM_COSTS: Dict[str, int] = {PBKDF2: 50_000, SCRYPT: 2 ** 14}
+SALT_LENGTH = 16
+KEY_ID_LENGTH = 8
+KEY_CHECK_LENGTH = 8
+NONCE_LENGTH = 16
+LOCAL_NONCE_LENGTH = 12
+# "$" is not part of the urlsafe base64 alphabet, so v1 tokens can never start with it.
+V2_PREFIX = b"$v2$"
+# Raw binary rather than base64, with the plain text compressed before encryption.
+V3_PREFIX = b"$v3$"
+
+NO_COMPRESSION = "none"
+ZLIB = "zlib"
+LZMA = "lzma"
+# Stored in every v3 token, so the compression of existing entries can be changed at any time.
+COMPRESSION_IDS: Dict[str, int] = {NO_COMPRESSION: 0, ZLIB: 1, LZMA: 2}
+
+
+class UnknownKeyError(Exception):
+    """ The token was encrypted with a journal key that is not in the header. """
+
+
+class WrongPasswordError(Exception):
+    """ The password does not derive the journal key, e.g. it was changed on another machine. """
+
 
+def is_kdf_available(algorithm: str) -> bool:
+    return algorithm == PBKDF2 or hasattr(hashlib, "scrypt")
 
-def _derive_key(password: bytes, salt: bytes, iterations: int = ITERATIONS) -> bytes:
+
+@timed("kdf")
+def _derive_key(password: bytes, salt: bytes, iterations: int = ITERATIONS, algorithm: str = PBKDF2) -> bytes:
     """Derive a secret key from a given password and salt"""
+    if algorithm == SCRYPT:
+        # scrypt needs about 128 * r * n bytes, leave some room for OpenSSL's own bookkeeping.
+        maxmem: int = 2 * 128 * SCRYPT_BLOCK_SIZE * iterations + 1024 * 1024
+        return b64e(hashlib.scrypt(password, salt=salt, n=iterations, r=SCRYPT_BLOCK_SIZE, p=1, maxmem=maxmem,
+                                   dklen=32))
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
@@ -21,10 +79,22 @@ def _derive_key(password: bytes, salt: bytes, iterations: int = ITERATIONS) -> b
     return b64e(kdf.derive(password))
 
 
+def _derive_entry_key(master_key: bytes, nonce: bytes, info: bytes = b"giournal-entry") -> bytes:
+    """Derive a per entry key from the journal master key, cheap compared to PBKDF2"""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=nonce,
+        info=info,
+        backend=default_backend(),
+    )
+    return b64e(hkdf.derive(b64d(master_key)))
+
+
 def password_encrypt(
     message: bytes, password: str, iterations: int = ITERATIONS
 ) -> bytes:
-    salt = secrets.token_bytes(16)
+    salt = secrets.token_bytes(SALT_LENGTH)
     key = _derive_key(password.encode(), salt, iterations)
     return b64e(
         b"%b%b%b"
@@ -36,9 +106,260 @@ def password_encrypt(
     )
 
 
+@timed("decrypt")
 def password_decrypt(token: bytes, password: str) -> bytes:
     decoded = b64d(token)
     salt, iter, token = decoded[:16], decoded[16:20], b64e(decoded[20:])
     iterations = int.from_bytes(iter, "big")
     key = _derive_key(password.encode(), salt, iterations)
     return Fernet(key).decrypt(token)
+
+
+def token_key_id(token: bytes) -> Optional[bytes]:
+    """ Returns the id of the journal key used for a v2 or v3 token, None for v1 tokens. """
+    if token.startswith(V3_PREFIX):
+        return token[len(V3_PREFIX):len(V3_PREFIX) + KEY_ID_LENGTH]
+    if not token.startswith(V2_PREFIX):
+        return None
+    return b64d(token[len(V2_PREFIX):])[:KEY_ID_LENGTH]
+
+
+@timed("encrypt")
+def key_encrypt(message: bytes, master_key: bytes, key_id: bytes) -> bytes:
+    nonce = secrets.token_bytes(NONCE_LENGTH)
+    key = _derive_entry_key(master_key, nonce)
+    return V2_PREFIX + b64e(
+        b"%b%b%b"
+        % (
+            key_id,
+            nonce,
+            b64d(Fernet(key).encrypt(message)),
+        )
+    )
+
+
+@timed("decrypt")
+def key_decrypt(token: bytes, master_key: bytes) -> bytes:
+    decoded = b64d(token[len(V2_PREFIX):])
+    nonce, token = decoded[KEY_ID_LENGTH:KEY_ID_LENGTH + NONCE_LENGTH], b64e(decoded[KEY_ID_LENGTH + NONCE_LENGTH:])
+    key = _derive_entry_key(master_key, nonce)
+    return Fernet(key).decrypt(token)
+
+
+@timed("compress")
+def compress(message: bytes, compression: str, level: Optional[int] = None) -> Tuple[int, bytes]:
+    """ Returns the id of the compression used, none when it would not make the message smaller. """
+    if compression == ZLIB:
+        compressed: bytes = zlib.compress(message, -1 if level is None else level)
+    elif compression == LZMA:
+        compressed: bytes = lzma.compress(message, preset=level)
+    elif compression == NO_COMPRESSION:
+        return COMPRESSION_IDS[NO_COMPRESSION], message
+    else:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {tuple(COMPRESSION_IDS)}")
+    if len(compressed) >= len(message):
+        return COMPRESSION_IDS[NO_COMPRESSION], message
+    return COMPRESSION_IDS[compression], compressed
+
+
+@timed("decompress")
+def decompress(message: bytes, compression_id: int) -> bytes:
+    if compression_id == COMPRESSION_IDS[ZLIB]:
+        return zlib.decompress(message)
+    if compression_id == COMPRESSION_IDS[LZMA]:
+        return lzma.decompress(message)
+    return message
+
+
+@timed("encrypt")
+def envelope_encrypt(
+    message: bytes, master_key: bytes, key_id: bytes, compression: str = ZLIB, level: Optional[int] = None
+) -> bytes:
+    """
+    A v3 token: prefix, key id, compression id and nonce in clear, then the compressed message encrypted with
+    AES-GCM under a key derived from the nonce. The clear part is authenticated too.
+    """
+    nonce = secrets.token_bytes(LOCAL_NONCE_LENGTH)
+    compression_id, compressed = compress(message, compression, level)
+    header: bytes = V3_PREFIX + key_id + bytes([compression_id])
+    key = _derive_entry_key(master_key, nonce)
+    return header + nonce + AESGCM(b64d(key)).encrypt(nonce, compressed, header)
+
+
+@timed("decrypt")
+def envelope_decrypt(token: bytes, master_key: bytes) -> bytes:
+    header_length: int = len(V3_PREFIX) + KEY_ID_LENGTH + 1
+    header, nonce = token[:header_length], token[header_length:header_length + LOCAL_NONCE_LENGTH]
+    key = _derive_entry_key(master_key, nonce)
+    compressed: bytes = AESGCM(b64d(key)).decrypt(nonce, token[header_length + LOCAL_NONCE_LENGTH:], header)
+    return decompress(compressed, header[-1])
+
+
+@timed("encrypt.local")
+def local_encrypt(message: bytes, key: bytes, associated_data: Optional[bytes] = None) -> bytes:
+    """ AES-GCM for data that never leaves this machine, much cheaper than Fernet for many small records. """
+    nonce = secrets.token_bytes(LOCAL_NONCE_LENGTH)
+    return nonce + AESGCM(b64d(key)).encrypt(nonce, message, associated_data)
+
+
+@timed("decrypt.local")
+def local_decrypt(token: bytes, key: bytes, associated_data: Optional[bytes] = None) -> bytes:
+    """ Raises cryptography.exceptions.InvalidTag if the key or the associated data do not match. """
+    return AESGCM(b64d(key)).decrypt(token[:LOCAL_NONCE_LENGTH], token[LOCAL_NONCE_LENGTH:], associated_data)
+
+
+@dataclass
+class KeyParameters:
+    """ Salt, algorithm and cost of a journal wide key, stored in clear in the journal header. """
+    salt: bytes
+    iterations: int = ITERATIONS
+    algorithm: str = PBKDF2
+    # Tells whether a password derives this key. Keys made before it existed have none and are not checked.
+    check: Optional[bytes] = None
+    # Set once a password change replaced this key: the key encrypted with the key `wrapped_by`, so entries other
+    # machines still write under it decrypt with the new password.
+    wrapped: Optional[bytes] = None
+    wrapped_by: Optional[bytes] = None
+
+    @classmethod
+    def generate(cls, iterations: int = ITERATIONS, algorithm: str = PBKDF2) -> KeyParameters:
+        return cls(secrets.token_bytes(SALT_LENGTH), iterations, algorithm)
+
+    @classmethod
+    def from_dict(cls, dictionary: Dict[str, Any]) -> KeyParameters:
+        # Headers written before scrypt was supported have no algorithm.
+        return cls(b64d(dictionary["salt"].encode()), dictionary["iterations"], dictionary.get("algorithm", PBKDF2),
+                   b64d(dictionary["check"].encode()) if dictionary.get("check") else None,
+                   b64d(dictionary["wrapped"].encode()) if dictionary.get("wrapped") else None,
+                   b64d(dictionary["wrapped_by"].encode()) if dictionary.get("wrapped_by") else None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        dictionary: Dict[str, Any] = {
+            "salt": b64e(self.salt).decode(), "iterations": self.iterations, "algorithm": self.algorithm,
+        }
+        if self.check is not None:
+            dictionary["check"] = b64e(self.check).decode()
+        if self.wrapped is not None:
+            dictionary["wrapped"] = b64e(self.wrapped).decode()
+            dictionary["wrapped_by"] = b64e(self.wrapped_by).decode()
+        return dictionary
+
+    @property
+    def key_id(self) -> bytes:
+        return hashlib.sha256(self.salt).digest()[:KEY_ID_LENGTH]
+
+
+@dataclass
+class EncryptionSession:
+    """
+    Encrypts and decrypts entries for one journal, deriving each journal key at most once.
+    New tokens are always encrypted with the last key in `keys`.
+    """
+    password: str
+    keys: List[KeyParameters]
+    compression: str = ZLIB
+    compression_level: Optional[int] = None
+    _master_keys: Dict[bytes, bytes] = field(default_factory=dict, repr=False)
+
+    @property
+    def current_key(self) -> KeyParameters:
+        return self.keys[-1]
+
+    def encrypt(self, message: bytes) -> bytes:
+        parameters: KeyParameters = self.current_key
+        return envelope_encrypt(message, self.master_key(parameters), parameters.key_id, self.compression,
+                                self.compression_level)
+
+    def decrypt(self, token: bytes) -> bytes:
+        key_id: Optional[bytes] = token_key_id(token)
+        if key_id is None:
+            return password_decrypt(token, self.password)
+        for parameters in self.keys:
+            if parameters.key_id == key_id:
+                if token.startswith(V3_PREFIX):
+                    return envelope_decrypt(token, self.master_key(parameters))
+                return key_decrypt(token, self.master_key(parameters))
+        raise UnknownKeyError(f"No journal key with id {key_id.hex()}")
+
+    def derive_subkey(self, purpose: bytes) -> bytes:
+        """ A Fernet key for local data other than entries, bound to the current journal key. """
+        return _derive_entry_key(self.master_key(self.current_key), purpose, b"giournal-local")
+
+    def derive_keys(self) -> None:
+        """ Eagerly derive every journal key, e.g. before handing the session to other processes. """
+        for parameters in self.keys:
+            self.master_key(parameters)
+
+    def is_current(self, token: bytes) -> bool:
+        """ Whether the token uses both the current journal key and the current envelope. """
+        return token.startswith(V3_PREFIX) and token_key_id(token) == self.current_key.key_id
+
+    def add_key(self, parameters: KeyParameters, password: Optional[str] = None) -> None:
+        """
+        Makes `parameters` the current key, derived from `password` rather than the session password if given.
+        Records the check of a new key, raises WrongPasswordError if the password does not match an existing one.
+        """
+        master_key: bytes = _derive_key((password or self.password).encode(), parameters.salt, parameters.iterations,
+                                        parameters.algorithm)
+        if parameters.check is None:
+            parameters.check = key_check(master_key)
+        elif not hmac.compare_digest(parameters.check, key_check(master_key)):
+            raise WrongPasswordError(f"The password does not match journal key {parameters.key_id.hex()}")
+        self.keys.append(parameters)
+        self._master_keys[parameters.key_id] = master_key
+
+    def set_master_key(self, parameters: KeyParameters, master_key: bytes) -> None:
+        """ For a key derived earlier, e.g. held by the key agent, so it is not derived again. """
+        self._master_keys[parameters.key_id] = master_key
+
+    def wrap_older_keys(self) -> None:
+        """ Wraps every older key not wrapped yet with the current one, after a password change. """
+        for parameters in self.keys[:-1]:
+            if parameters.wrapped is None:
+                parameters.wrapped = local_encrypt(self.master_key(parameters), self.master_key(self.current_key),
+                                                   parameters.key_id)
+                parameters.wrapped_by = self.current_key.key_id
+
+    def master_key(self, parameters: KeyParameters) -> bytes:
+        key_id: bytes = parameters.key_id
+        wrapping: List[KeyParameters] = [k for k in self.keys if k.key_id == parameters.wrapped_by]
+        if key_id not in self._master_keys and parameters.wrapped is not None and wrapping:
+            # Replaced by a password change, the current password no longer derives it.
+            try:
+                self._master_keys[key_id] = local_decrypt(parameters.wrapped, self.master_key(wrapping[0]), key_id)
+            except InvalidTag:
+                raise WrongPasswordError(f"Journal key {key_id.hex()} is not wrapped by the key it names")
+        if key_id not in self._master_keys:
+            master_key: bytes = _derive_key(self.password.encode(), parameters.salt, parameters.iterations,
+                                            parameters.algorithm)
+            if parameters.check is not None and not hmac.compare_digest(parameters.check, key_check(master_key)):
+                raise WrongPasswordError(f"The password does not match journal key {key_id.hex()}, "
+                                         f"it may have been changed on another machine")
+            self._master_keys[key_id] = master_key
+        return self._master_keys[key_id]
+
+
+def key_check(master_key: bytes) -> bytes:
+    """ Stored in clear, so only as hard to brute force as the key derivation itself. """
+    return hmac.new(master_key, b"giournal-key-check", hashlib.sha256).digest()[:KEY_CHECK_LENGTH]
+
+
+def calibrate(algorithm: str = PBKDF2, target_seconds: float = 0.5) -> int:
+    """
+    The cost at which deriving a key takes about `target_seconds` on this machine.
+    Both algorithms take time proportional to their cost, so a cheap derivation long enough to time is scaled up.
+    """
+    cost: int = MINIMUM_COSTS[algorithm] // 8 if algorithm == PBKDF2 else 2 ** 10
+    while True:
+        start: float = time.perf_counter()
+        _derive_key(b"calibration", bytes(SALT_LENGTH), cost, algorithm)
+        elapsed: float = time.perf_counter() - start
+        if elapsed >= 0.05:
+            break
+        cost *= 2
+    estimated: float = cost * target_seconds / elapsed
+    if algorithm == SCRYPT:
+        calibrated: int = 2 ** max(round(math.log2(estimated)), 1)
+    else:
+        calibrated = int(round(estimated, -3))
+    return max(calibrated, MINIMUM_COSTS[algorithm])
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from . import encryption
+from .encryption import (
+    LZMA, MINIMUM_COSTS, NO_COMPRESSION, PBKDF2, SCRYPT, ZLIB, EncryptionSession, KeyParameters, calibrate,
+    is_kdf_available, key_encrypt, password_encrypt, token_key_id, UnknownKeyError,
+)
+
+
+class EncryptionTest(unittest.TestCase):
+    def test_session_round_trip(self) -> None:
+        session: EncryptionSession = EncryptionSession("password", [KeyParameters.generate(iterations=1_000)])
+        token: bytes = session.encrypt(b"hello")
+        self.assertEqual(token_key_id(token), session.current_key.key_id)
+        self.assertEqual(session.decrypt(token), b"hello")
+
+    def test_v3_tokens_are_compressed_binary_and_v2_tokens_still_decrypt(self) -> None:
+        parameters: KeyParameters = KeyParameters.generate(iterations=1_000)
+        message: bytes = b"a day like any other\n" * 50
+        for compression in (NO_COMPRESSION, ZLIB, LZMA):
+            session: EncryptionSession = EncryptionSession("password", [parameters], compression)
+            token: bytes = session.encrypt(message)
+            self.assertEqual(session.decrypt(token), message)
+            self.assertTrue(session.is_current(token))
+            if compression != NO_COMPRESSION:
+                self.assertLess(len(token), len(message) // 4)
+
+        v2_token: bytes = key_encrypt(message, session.master_key(parameters), parameters.key_id)
+        self.assertEqual(session.decrypt(v2_token), message)
+        self.assertFalse(session.is_current(v2_token))
+
+    def test_session_decrypts_v1_tokens(self) -> None:
+        session: EncryptionSession = EncryptionSession("password", [KeyParameters.generate(iterations=1_000)])
+        token: bytes = password_encrypt(b"hello", "password", 1_000)
+        self.assertIsNone(token_key_id(token))
+        self.assertFalse(session.is_current(token))
+        self.assertEqual(session.decrypt(token), b"hello")
+
+    def test_session_derives_journal_key_once(self) -> None:
+        session: EncryptionSession = EncryptionSession("password", [KeyParameters.generate(iterations=1_000)])
+        with patch.object(encryption, "_derive_key", wraps=encryption._derive_key) as derive_key_mock:
+            derive_key_mock: MagicMock
+            tokens = [session.encrypt(f"entry {i}".encode()) for i in range(10)]
+            self.assertEqual([session.decrypt(t) for t in tokens], [f"entry {i}".encode() for i in range(10)])
+        self.assertEqual(derive_key_mock.call_count, 1)
+
+    def test_unknown_key_raises(self) -> None:
+        token: bytes = EncryptionSession("password", [KeyParameters.generate(iterations=1_000)]).encrypt(b"hello")
+        session: EncryptionSession = EncryptionSession("password", [KeyParameters.generate(iterations=1_000)])
+        with self.assertRaises(UnknownKeyError):
+            session.decrypt(token)
+
+    @unittest.skipUnless(is_kdf_available(SCRYPT), "Needs hashlib.scrypt")
+    def test_keys_with_different_algorithms_and_costs_decrypt(self) -> None:
+        old_parameters: KeyParameters = KeyParameters.generate(iterations=1_000)
+        old_token: bytes = EncryptionSession("password", [old_parameters]).encrypt(b"old")
+        new_parameters: KeyParameters = KeyParameters.from_dict(KeyParameters.generate(2 ** 10, SCRYPT).to_dict())
+        self.assertEqual(new_parameters.algorithm, SCRYPT)
+
+        session: EncryptionSession = EncryptionSession("password", [old_parameters, new_parameters])
+        self.assertEqual(session.decrypt(old_token), b"old")
+        self.assertFalse(session.is_current(old_token))
+        self.assertEqual(session.decrypt(session.encrypt(b"new")), b"new")
+
+    def test_headers_without_algorithm_are_pbkdf2(self) -> None:
+        dictionary = KeyParameters.generate(iterations=1_000).to_dict()
+        del dictionary["algorithm"]
+        self.assertEqual(KeyParameters.from_dict(dictionary).algorithm, PBKDF2)
+
+    def test_calibrate_never_goes_below_the_minimum(self) -> None:
+        self.assertEqual(calibrate(PBKDF2, target_seconds=0), MINIMUM_COSTS[PBKDF2])
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 
@@ -13,3 +14,38 @@ def safe_make_dir_and_file(file_path: str) -> None:
 def safe_make_dir(path: str) -> None:
     if not os.path.exists(path):
         os.mkdir(path)
+
+
+def atomic_write(file_path: str, content: bytes) -> None:
+    """ Readers see either the old or the new content, never a partially written file. """
+    # A unique, hidden, name: writers of the same file at the same time must not share it.
+    descriptor, temporary_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp",
+                                                  dir=os.path.dirname(file_path) or None)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def atomic_create(file_path: str, content: bytes) -> bool:
+    """ Like atomic_write, but never replaces an existing file: returns False instead, leaving it untouched. """
+    descriptor, temporary_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp",
+                                                  dir=os.path.dirname(file_path) or None)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        # Unlike a rename, a link fails if the file exists, checking and creating in one step.
+        os.link(temporary_path, file_path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temporary_path)
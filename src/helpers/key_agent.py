@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64decode, b64encode
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from helpers.timings import timed
+
+if TYPE_CHECKING:
+    # Only for annotations, the agent itself never loads cryptography.
+    from helpers.encryption import EncryptionSession, KeyParameters
+
+# Like SSH_AUTH_SOCK, points clients and the agent to a socket other than the default one.
+SOCKET_ENVIRONMENT_VARIABLE = "GIOURNAL_AGENT_SOCKET"
+# Secrets are forgotten, and the agent exits, after this long without requests.
+DEFAULT_TTL_SECONDS = 15 * 60
+_CLIENT_TIMEOUT_SECONDS = 1.0
+# How long the agent waits for a connected client to send its request.
+_REQUEST_TIMEOUT_SECONDS = 5.0
+
+
+def is_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def socket_path() -> str:
+    """ In a directory only the current user can access, so only they can talk to the agent. """
+    if os.environ.get(SOCKET_ENVIRONMENT_VARIABLE):
+        return os.environ[SOCKET_ENVIRONMENT_VARIABLE]
+    return os.path.join(runtime_directory(), "agent.sock")
+
+
+def runtime_directory() -> str:
+    """
+    Per user, only they can access it. Like ssh-agent, refuses a directory that another user could have created
+    first in a shared temporary directory, or that others can access.
+    """
+    directory: str = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"giournal-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    status: os.stat_result = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or stat.S_IMODE(status.st_mode) != 0o700:
+        raise PermissionError(f"'{directory}' must be a directory, not a link, owned by you and with mode 700")
+    return directory
+
+
+def _key_name(parameters: "KeyParameters") -> str:
+    """ Keys are cached per salt, algorithm and cost, a journal key with a new cost is derived again. """
+    key_parameters: Dict[str, Any] = parameters.to_dict()
+    return f"{key_parameters['salt']}:{key_parameters['algorithm']}:{key_parameters['iterations']}"
+
+
+class KeyAgent(object):
+    """ Holds the password and the journal keys derived from it, in memory only. """
+
+    def __init__(self) -> None:
+        self.password: Optional[str] = None
+        self.keys: Dict[str, str] = {}
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self._handle(request)
+        except (KeyError, TypeError) as e:
+            # A missing field, or one of the wrong type.
+            return {"error": f"Malformed request: {e!r}"}
+
+    def _handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command: str = request.get("command", "")
+        if command == "get_password":
+            return {"password": self.password}
+        if command == "set_password":
+            # Keys derived from another password are no longer valid.
+            if request["password"] != self.password:
+                self.keys = {}
+            self.password = request["password"]
+            return {}
+        if command == "get_key":
+            return {"key": self.keys.get(request["name"])}
+        if command == "set_key":
+            if self.password is not None:
+                self.keys[request["name"]] = request["key"]
+            return {}
+        if command == "lock":
+            self.password = None
+            self.keys = {}
+            return {}
+        return {"error": f"Unknown command '{command}'"}
+
+
+def serve(path: str, ttl_seconds: float) -> None:
+    """ Answers one JSON request per connection until `ttl_seconds` pass without any, or it is told to stop. """
+    if os.path.exists(path):
+        os.remove(path)
+    key_agent: KeyAgent = KeyAgent()
+    server: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask: int = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(previous_umask)
+    server.listen()
+    try:
+        while True:
+            server.settimeout(ttl_seconds)
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                return
+            # A client that stops halfway, or never sends its request, must not hold up or end the agent.
+            connection.settimeout(_REQUEST_TIMEOUT_SECONDS)
+            try:
+                with connection, connection.makefile("rwb") as stream:
+                    response: Dict[str, Any]
+                    try:
+                        request: Any = json.loads(stream.readline())
+                    except ValueError as e:
+                        response = {"error": f"Malformed request: {e}"}
+                    else:
+                        if not isinstance(request, dict):
+                            response = {"error": "A request must be a JSON object"}
+                        elif request.get("command") == "stop":
+                            return
+                        else:
+                            response = key_agent.handle(request)
+                    stream.write(json.dumps(response).encode() + b"\n")
+            except OSError:
+                continue
+    finally:
+        server.close()
+        os.remove(path)
+
+
+@timed("key_agent")
+def _request(request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ None when no agent is running, so callers fall back to the keychain. """
+    if not is_supported():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(_CLIENT_TIMEOUT_SECONDS)
+            client.connect(socket_path())
+            with client.makefile("rwb") as stream:
+                stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                response: bytes = stream.readline()
+    except OSError:
+        return None
+    return json.loads(response) if response else {}
+
+
+def get_password() -> Optional[str]:
+    response: Optional[Dict[str, Any]] = _request({"command": "get_password"})
+    return None if response is None else response.get("password")
+
+
+def set_password(password: str) -> None:
+    _request({"command": "set_password", "password": password})
+
+
+def lock() -> bool:
+    """ Returns whether an agent was running. """
+    return _request({"command": "lock"}) is not None
+
+
+def stop() -> bool:
+    """ Returns whether an agent was running. """
+    return _request({"command": "stop"}) is not None
+
+
+def share_current_key(session: "EncryptionSession") -> None:
+    """
+    Seeds the session with the current journal key held by the agent, or hands the agent the key once derived.
+    Does nothing, apart from deriving the key, when no agent is running.
+    """
+    parameters: "KeyParameters" = session.current_key
+    response: Optional[Dict[str, Any]] = _request({"command": "get_key", "name": _key_name(parameters)})
+    if response is not None and response.get("key"):
+        session.set_master_key(parameters, b64decode(response["key"]))
+        return
+    master_key: bytes = session.master_key(parameters)
+    if response is not None:
+        _request({"command": "set_key", "name": _key_name(parameters), "key": b64encode(master_key).decode()})
+
+
+def spawn(ttl_seconds: float = DEFAULT_TTL_SECONDS) -> None:
+    """ Starts a detached agent, unless one is already running, and waits for it to listen. """
+    if _request({"command": "get_password"}) is not None:
+        return
+    source_path: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path: str = os.pathsep.join(p for p in [source_path, os.environ.get("PYTHONPATH")] if p)
+    subprocess.Popen(
+        [sys.executable, "-m", "helpers.key_agent", socket_path(), str(ttl_seconds)],
+        env={**os.environ, "PYTHONPATH": python_path},
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    for _ in range(50):
+        if os.path.exists(socket_path()):
+            return
+        time.sleep(0.1)
+
+
+# Started by spawn, or by hand with `python -m helpers.key_agent <socket path> <ttl seconds>`.
+if __name__ == "__main__":
+    serve(sys.argv[1], float(sys.argv[2]))
@@ -0,0 +1,75 @@
+import json
+import os
+import socket
+import threading
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from helpers import key_agent
+from helpers.encryption import EncryptionSession, KeyParameters
+
+
+@unittest.skipUnless(key_agent.is_supported(), "Needs Unix sockets")
+class KeyAgentTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory: TemporaryDirectory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.socket_path: str = os.path.join(directory.name, "agent.sock")
+        environment_patch = patch.dict(os.environ, {key_agent.SOCKET_ENVIRONMENT_VARIABLE: self.socket_path})
+        environment_patch.start()
+        self.addCleanup(environment_patch.stop)
+
+    def _wait_for_socket(self, timeout: float = 5) -> None:
+        deadline: float = time.monotonic() + timeout
+        while not os.path.exists(self.socket_path):
+            if time.monotonic() > deadline:
+                self.fail(f"The agent did not listen on '{self.socket_path}' within {timeout} seconds")
+            time.sleep(0.01)
+
+    def test_without_agent_everything_falls_back(self) -> None:
+        self.assertIsNone(key_agent.get_password())
+        self.assertFalse(key_agent.lock())
+
+    def test_holds_password_and_keys_until_locked(self) -> None:
+        server: threading.Thread = threading.Thread(target=key_agent.serve, args=(self.socket_path, 10))
+        server.start()
+        self.addCleanup(server.join)
+        self.addCleanup(key_agent.stop)
+        self._wait_for_socket()
+
+        key_agent.set_password("password")
+        self.assertEqual(key_agent.get_password(), "password")
+        parameters: KeyParameters = KeyParameters.generate(1_000)
+        key_agent.share_current_key(EncryptionSession("password", [parameters]))
+        session: EncryptionSession = EncryptionSession("password", [parameters])
+        with patch("helpers.encryption._derive_key", side_effect=AssertionError("derived")):
+            key_agent.share_current_key(session)
+            self.assertEqual(session.decrypt(session.encrypt(b"message")), b"message")
+
+        for malformed in (b"not json", b"[1, 2]", b'{"command": "set_key"}'):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(self.socket_path)
+                client.sendall(malformed + b"\n")
+                with client.makefile("rb") as stream:
+                    self.assertIn("error", json.loads(stream.readline()))
+
+        self.assertTrue(key_agent.lock())
+        self.assertIsNone(key_agent.get_password())
+
+    def test_refuses_a_runtime_directory_others_can_access(self) -> None:
+        with TemporaryDirectory() as runtime_path, patch.dict(os.environ, {"XDG_RUNTIME_DIR": runtime_path}):
+            directory: str = key_agent.runtime_directory()
+            self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+            os.chmod(directory, 0o755)
+            with self.assertRaises(PermissionError):
+                key_agent.runtime_directory()
+            os.rmdir(directory)
+            os.symlink(runtime_path, directory)
+            with self.assertRaises(PermissionError):
+                key_agent.runtime_directory()
+
+    def test_forgets_everything_once_idle(self) -> None:
+        key_agent.serve(self.socket_path, 0.01)
+        self.assertFalse(os.path.exists(self.socket_path))
@@ -2,20 +2,50 @@ import sys
 from getpass import getpass
 from typing import Optional
 
-import keyring as keyring
-from keyring.errors import KeyringError
+from helpers import key_agent
+from helpers.timings import timed
 
+# keyring is imported inside each function: importing it loads every backend, which is slow on the startup path.
 
+
+@timed("keychain")
 def get_password_from_keychain_with_fallback() -> str:
-    password: str = keyring.get_password("giournal", "giournal")
+    """ Asks the key agent first, if one is running, which avoids the keyring backend altogether. """
+    password: Optional[str] = key_agent.get_password()
+    if password is not None:
+        return password
+
+    import keyring
+
+    password = keyring.get_password("giournal", "giournal")
     if password is None:
         password: str = getpass("Configure a password: ")
         set_password_in_keychain(password)
 
+    key_agent.set_password(password)
+    return password
+
+
+def get_password_without_prompt() -> Optional[str]:
+    """ From the key agent or the keyring only, for background workers that have no terminal to ask on. """
+    password: Optional[str] = key_agent.get_password()
+    if password is not None:
+        return password
+    return get_password_from_keychain()
+
+
+def replace_password(prompt: str) -> str:
+    """ Asks for the password again, e.g. after it was changed on another machine, and keeps the new one. """
+    password: str = getpass(prompt)
+    set_password_in_keychain(password)
+    key_agent.set_password(password)
     return password
 
 
 def get_password_from_keychain() -> Optional[str]:
+    import keyring
+    from keyring.errors import KeyringError
+
     try:
         return keyring.get_password("giournal", "giournal")
     except KeyringError as e:
@@ -25,6 +55,9 @@ def get_password_from_keychain() -> Optional[str]:
 
 
 def set_password_in_keychain(password: Optional[str]) -> None:
+    import keyring
+    from keyring.errors import KeyringError
+
     if password is None:
         try:
             keyring.delete_password("giournal", "giournal")
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Deque, Generic, Iterable, Iterator, Optional, Tuple, TypeVar
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+THREAD = "thread"
+PROCESS = "process"
+WORKER_MODES = (THREAD, PROCESS)
+
+
+@dataclass
+class TaskResult(Generic[T, R]):
+    item: T
+    value: Optional[R] = None
+    error: Optional[Exception] = None
+
+
+def ordered_map(
+    function: Callable[[T], R],
+    items: Iterable[T],
+    workers: int = 1,
+    mode: str = THREAD,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[TaskResult]:
+    """
+    Lazily applies `function` to every item, yielding results in the same order as `items`.
+    At most `max_in_flight` items are submitted ahead of the one being yielded, so memory stays flat.
+    Exceptions are captured per item instead of aborting the whole run.
+    `function` and the items must be picklable in process mode.
+    """
+    if workers <= 1:
+        for item in items:
+            try:
+                yield TaskResult(item, function(item))
+            except Exception as e:
+                yield TaskResult(item, error=e)
+        return
+
+    if mode not in WORKER_MODES:
+        raise ValueError(f"Unknown worker mode '{mode}', expected one of {WORKER_MODES}")
+    # Only imported when actually running in parallel, concurrent.futures is slow to import.
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    max_in_flight = max_in_flight or workers * 2
+    executor_class = ProcessPoolExecutor if mode == PROCESS else ThreadPoolExecutor
+    executor: Executor
+    with executor_class(max_workers=workers) as executor:
+        in_flight: Deque[Tuple[T, Future]] = deque()
+        try:
+            for item in items:
+                in_flight.append((item, executor.submit(function, item)))
+                if len(in_flight) >= max_in_flight:
+                    yield _result(*in_flight.popleft())
+            while in_flight:
+                yield _result(*in_flight.popleft())
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+
+def _result(item: T, future: Future) -> TaskResult:
+    try:
+        return TaskResult(item, future.result())
+    except Exception as e:
+        return TaskResult(item, error=e)
@@ -0,0 +1,23 @@
+import unittest
+from typing import List
+
+from .parallel import PROCESS, THREAD, TaskResult, ordered_map
+
+
+def _square_or_fail(value: int) -> int:
+    if value == 3:
+        raise ValueError("three")
+    return value * value
+
+
+class ParallelTest(unittest.TestCase):
+    def test_results_keep_input_order_and_errors_do_not_abort(self) -> None:
+        for workers, mode in [(1, THREAD), (4, THREAD), (2, PROCESS)]:
+            results: List[TaskResult] = list(ordered_map(_square_or_fail, range(6), workers, mode, max_in_flight=2))
+            self.assertEqual([r.item for r in results], list(range(6)))
+            self.assertEqual([r.value for r in results if r.error is None], [0, 1, 4, 16, 25])
+            self.assertIsInstance(results[3].error, ValueError)
+
+    def test_unknown_mode_raises(self) -> None:
+        with self.assertRaises(ValueError):
+            list(ordered_map(_square_or_fail, range(2), 2, "fibers"))
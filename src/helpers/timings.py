@@ -0,0 +1,93 @@
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, TypeVar
+
+# "1" prints a summary to stderr once the command is done, anything else is a path to write JSON to.
+TIMINGS_ENVIRONMENT_VARIABLE = "GIOURNAL_TIMINGS"
+# A path to dump cProfile statistics to, readable with pstats or snakeviz.
+PROFILE_ENVIRONMENT_VARIABLE = "GIOURNAL_PROFILE"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_enabled: bool = False
+_lock: threading.Lock = threading.Lock()
+# Seconds and calls per phase. Only phases run in this process are counted, not the ones in worker processes.
+_phases: Dict[str, List[float]] = {}
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _lock:
+        _phases.clear()
+
+
+def _record(name: str, seconds: float) -> None:
+    with _lock:
+        totals: List[float] = _phases.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+
+class Phase(object):
+    """ Times the block as `name` when timings are enabled, otherwise costs a flag check. Phases can nest. """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.start: float = 0.0
+
+    def __enter__(self) -> None:
+        if _enabled:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *_) -> None:
+        if _enabled:
+            _record(self.name, time.perf_counter() - self.start)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """ Times every call of the decorated function as the phase `name`. """
+    def decorator(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start: float = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """ Wall time, inclusive of nested phases, and number of calls per phase, slowest first. """
+    with _lock:
+        phases: List = sorted(_phases.items(), key=lambda p: p[1][0], reverse=True)
+    return {name: {"seconds": seconds, "calls": int(calls)} for name, (seconds, calls) in phases}
+
+
+def format_table() -> str:
+    phases: Dict[str, Dict[str, float]] = summary()
+    width: int = max([len("phase")] + [len(name) for name in phases])
+    lines: List[str] = [f"{'phase':<{width}}  {'seconds':>10}  {'calls':>8}  {'ms/call':>9}"]
+    for name, totals in phases.items():
+        lines.append(f"{name:<{width}}  {totals['seconds']:>10.4f}  {totals['calls']:>8}"
+                     f"  {totals['seconds'] * 1000 / totals['calls']:>9.3f}")
+    return "\n".join(lines)
+
+
+def write_json(path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(summary(), file, indent=2)
@@ -0,0 +1,33 @@
+import unittest
+from unittest.mock import patch
+
+from . import timings
+
+
+@timings.timed("work")
+def work() -> int:
+    with timings.Phase("work.inner"):
+        return 1
+
+
+class TimingsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        enabled_patch = patch.object(timings, "_enabled", False)
+        enabled_patch.start()
+        self.addCleanup(enabled_patch.stop)
+        self.addCleanup(timings.reset)
+        timings.reset()
+
+    def test_nothing_is_recorded_while_disabled(self) -> None:
+        self.assertEqual(work(), 1)
+        self.assertEqual(timings.summary(), {})
+
+    def test_phases_are_counted_once_enabled(self) -> None:
+        timings.enable()
+        work()
+        work()
+        phases = timings.summary()
+        self.assertEqual(phases["work"]["calls"], 2)
+        self.assertEqual(phases["work.inner"]["calls"], 2)
+        self.assertGreaterEqual(phases["work"]["seconds"], phases["work.inner"]["seconds"])
+        self.assertIn("work.inner", timings.format_table())